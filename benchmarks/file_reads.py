@@ -0,0 +1,123 @@
+"""
+Concurrent read benchmark for ``file_service``.
+
+Starts ``file_service`` under uvicorn against a generated directory of many
+files (a share of text files plus some binaries), then posts
+``/read_directory`` at increasing concurrency. Alongside the load, a probe
+requests ``/openapi.json`` every ``--probe-interval-ms`` and records its
+latency: while file reads block the event loop, the probe waits behind them.
+
+Usage::
+
+    python benchmarks/file_reads.py --files 2000 --file-size 4096 --out after.json
+    python benchmarks/file_reads.py --compare after.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import httpx
+
+from load_test import ROOT, compare, free_port, git_commit, memory_mb, percentile, run_level, start_process, wait_ready
+
+
+def make_share(directory, files, size, binary_every):
+    for i in range(files):
+        if binary_every and i % binary_every == 0:
+            with open(os.path.join(directory, f"blob_{i:05d}.bin"), "wb") as f:
+                f.write(os.urandom(size))
+        else:
+            with open(os.path.join(directory, f"file_{i:05d}.txt"), "w") as f:
+                f.write((f"line {i} " * (size // 8 + 1))[:size])
+
+
+async def probe(client, url, interval, stop):
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            await client.get(url)
+            latencies.append(time.perf_counter() - start)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def run(options):
+    levels = [int(c) for c in options.concurrency.split(",")]
+    results = []
+    log_dir = tempfile.mkdtemp(prefix="mcp-file-reads-")
+    print(f"Process logs: {log_dir}")
+    with tempfile.TemporaryDirectory() as share_dir:
+        make_share(share_dir, options.files, options.file_size, options.binary_every)
+        env = {"FILE_SERVICE_READ_THREADS": str(options.read_threads)} if options.read_threads else {}
+        process, url = start_process(
+            ["-m", "uvicorn", "main:app", "--log-level", "warning"],
+            os.path.join(ROOT, "file_service"), env, free_port(), os.path.join(log_dir, "file_service.log"),
+        )
+        try:
+            limits = httpx.Limits(max_connections=max(levels) + 1)
+            async with httpx.AsyncClient(timeout=options.timeout, limits=limits) as client:
+                await wait_ready(client, process, url, "/metrics")
+                for concurrency in levels:
+                    stop = asyncio.Event()
+                    prober = asyncio.ensure_future(probe(client, url + "/openapi.json", options.probe_interval_ms / 1000, stop))
+                    level = await run_level(client, url + "/read_directory", {"path": share_dir}, concurrency, options.duration, options.warmup)
+                    stop.set()
+                    probes = sorted(await prober)
+                    rss, peak = memory_mb(process.pid)
+                    ms = lambda value: round(value * 1000, 3) if value is not None else None  # noqa: E731
+                    level.update({
+                        "scenario": "file_service.read_directory",
+                        "concurrency": concurrency,
+                        "files_per_s": round(level["rps"] * options.files, 1),
+                        "probe_p50_ms": ms(percentile(probes, 50)),
+                        "probe_p99_ms": ms(percentile(probes, 99)),
+                        "rss_mb": rss,
+                        "peak_rss_mb": peak,
+                    })
+                    results.append(level)
+                    print(
+                        f"c={concurrency:<4} {level['rps']:>8.1f} req/s {level['files_per_s']:>10.0f} files/s  "
+                        f"p50 {level['p50_ms'] or 0:>8.1f}  p99 {level['p99_ms'] or 0:>8.1f} ms  "
+                        f"probe p50 {level['probe_p50_ms'] or 0:>7.1f}  p99 {level['probe_p99_ms'] or 0:>7.1f} ms  "
+                        f"errors {level['errors']:<4} rss {rss or 0:.0f} MB",
+                        flush=True,
+                    )
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent directory reads in file_service.")
+    parser.add_argument("--files", type=int, default=1000, help="Files in the generated directory.")
+    parser.add_argument("--file-size", type=int, default=4096, help="Size of each file in bytes.")
+    parser.add_argument("--binary-every", type=int, default=10, help="Make every Nth file binary (0 = none).")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="Comma-separated concurrency levels.")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds measured per concurrency level.")
+    parser.add_argument("--warmup", type=float, default=1.0, help="Unmeasured seconds before each level.")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds.")
+    parser.add_argument("--probe-interval-ms", type=float, default=50.0, help="Delay between probe requests.")
+    parser.add_argument("--read-threads", type=int, help="FILE_SERVICE_READ_THREADS for the service.")
+    parser.add_argument("--out", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="Compare with a previous results file.")
+    options = parser.parse_args()
+
+    results = asyncio.run(run(options))
+    report = {"meta": {"commit": git_commit(), "settings": {k: v for k, v in vars(options).items() if k not in ("out", "compare")}}, "results": results}
+    if options.out:
+        with open(options.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if options.compare:
+        with open(options.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Microbenchmark of the MCP JSON request/response path.
+
+Compares, for a synthetic Wazuh ``/agents`` payload:
+
+* ``stdlib``      - ``response.json()`` upstream, Starlette ``JSONResponse`` downstream (the old path)
+* ``fast``        - orjson decode upstream, ``mcp_common.fastjson.JSONResponse`` downstream
+* ``passthrough`` - orjson decode for the error check, raw upstream bytes spliced into the response
+
+Usage::
+
+    python benchmarks/json_path.py --agents 20000 --repeat 20
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from starlette.responses import JSONResponse as StarletteJSONResponse  # noqa: E402
+
+from mcp_common.fastjson import JSONResponse, RawJSON, loads, orjson  # noqa: E402
+
+
+def make_payload(agents):
+    items = [
+        {
+            "id": f"{i:03d}",
+            "name": f"agent-{i}",
+            "ip": f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+            "status": "active" if i % 7 else "disconnected",
+            "os": {"platform": "ubuntu", "name": "Ubuntu", "version": "22.04.3 LTS", "arch": "x86_64"},
+            "version": "Wazuh v4.7.2",
+            "group": ["default", "linux"],
+            "lastKeepAlive": "2024-03-01T12:00:00Z",
+            "dateAdd": "2023-11-15T08:30:00Z",
+            "node_name": "node01",
+            "manager": "wazuh-manager",
+        }
+        for i in range(agents)
+    ]
+    body = {"data": {"affected_items": items, "total_affected_items": agents, "failed_items": []}, "error": 0}
+    return json.dumps(body).encode("utf-8")
+
+
+def stdlib_path(upstream):
+    result = json.loads(upstream)
+    return StarletteJSONResponse(content={"jsonrpc": "2.0", "id": 1, "result": result}).body
+
+
+def fast_path(upstream):
+    result = loads(upstream)
+    return JSONResponse(content={"jsonrpc": "2.0", "id": 1, "result": result}).body
+
+
+def passthrough_path(upstream):
+    if loads(upstream).get("error", 0) != 0:
+        raise RuntimeError("unexpected error payload")
+    return JSONResponse(content={"jsonrpc": "2.0", "id": 1, "result": RawJSON(upstream)}).body
+
+
+def measure(fn, upstream, repeat):
+    fn(upstream)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(upstream)
+        timings.append(time.perf_counter() - start)
+    return {"median_ms": round(statistics.median(timings) * 1000, 3), "min_ms": round(min(timings) * 1000, 3)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the MCP JSON request/response path.")
+    parser.add_argument("--agents", type=int, default=20000, help="The number of agents in the synthetic payload.")
+    parser.add_argument("--repeat", type=int, default=20, help="The number of timed runs per path.")
+    args = parser.parse_args()
+
+    upstream = make_payload(args.agents)
+    assert json.loads(passthrough_path(upstream)) == json.loads(stdlib_path(upstream))
+
+    results = {
+        "payload_bytes": len(upstream),
+        "orjson": orjson.__version__ if orjson else None,
+        "stdlib": measure(stdlib_path, upstream, args.repeat),
+        "fast": measure(fast_path, upstream, args.repeat),
+        "passthrough": measure(passthrough_path, upstream, args.repeat),
+    }
+    print(json.dumps(results, indent=2))
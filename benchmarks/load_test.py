@@ -0,0 +1,320 @@
+"""
+Load test for the MCP servers against local stub upstreams.
+
+Starts ``benchmarks/stubs.py`` and each selected service under uvicorn, then
+drives every scenario at increasing concurrency and records p50/p95/p99
+latency, throughput, errors and the service's memory use. Results are
+written as JSON so runs can be compared across commits.
+
+Usage::
+
+    python benchmarks/load_test.py --out baseline.json
+    python benchmarks/load_test.py --services wazuh_tools --concurrency 1,16,64 --compare baseline.json
+
+Response caches are disabled for the scenario tools unless ``--cache`` is
+given, so every call reaches the stub upstream.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def mcp_call(tool, arguments):
+    return {"jsonrpc": "2.0", "id": 1, "method": "tools/call", "params": {"name": tool, "arguments": arguments}}
+
+
+def service_env(stub_url):
+    """
+    Environment pointing each service at the stub upstreams. The per-minute
+    rate limits of the real Wazuh, OpenWeather and Alpha Vantage APIs are
+    lifted, so the services themselves are measured.
+    """
+    unlimited = "1000000"
+    return {
+        "grafana_tool": {
+            "GRAFANA_URL": stub_url,
+            "GRAFANA_API_TOKEN": "stub",
+            "ZABBIX_URL": stub_url,
+            "ZABBIX_USER": "stub",
+            "ZABBIX_PASSWORD": "stub",
+            "GRAFANA_QUERY_CACHE_TTL": "0",
+        },
+        "wazuh_tools": {"WAZUH_URL": stub_url, "WAZUH_USER": "stub", "WAZUH_PASSWORD": "stub", "WAZUH_SSL_VERIFY": "false", "WAZUH_REQUESTS_PER_MINUTE": unlimited},
+        "easyvista_tools": {"EASYVISTA_URL": stub_url, "EASYVISTA_API_KEY": "stub", "EASYVISTA_ACCOUNT_ID": "stub"},
+        "weather_tool": {"OPENWEATHER_URL": stub_url, "OPENWEATHER_API_KEY": "stub", "OPENWEATHER_REQUESTS_PER_MINUTE": unlimited, "OPENWEATHER_BURST": "1000", "OPENWEATHER_CONCURRENCY": "1000"},
+        "yahoo_finance_tool": {"ALPHAVANTAGE_URL": stub_url, "ALPHAVANTAGE_API_KEY": "stub", "ALPHAVANTAGE_REQUESTS_PER_MINUTE": unlimited, "ALPHAVANTAGE_BURST": "1000"},
+        "file_fetch_tool": {},
+        "file_service": {},
+        "mcp_gateway": {
+            "MCP_GATEWAY_CONFIG": "",
+            "MCP_GATEWAY_INPROCESS": "wazuh_tools",
+            "WAZUH_URL": stub_url, "WAZUH_USER": "stub", "WAZUH_PASSWORD": "stub", "WAZUH_SSL_VERIFY": "false", "WAZUH_REQUESTS_PER_MINUTE": unlimited,
+        },
+    }
+
+
+def scenarios(share_dir):
+    """
+    (name, service, path, body) for every benchmarked call.
+    """
+    mcp = "/api/v1/mcp"
+    return [
+        ("grafana.search_grafana_dashboards", "grafana_tool", mcp, mcp_call("search_grafana_dashboards", {"query": ""})),
+        ("grafana.get_grafana_dashboard_by_uid", "grafana_tool", mcp, mcp_call("get_grafana_dashboard_by_uid", {"uid": "dash-1"})),
+        ("grafana.list_grafana_users", "grafana_tool", mcp, mcp_call("list_grafana_users", {})),
+        ("grafana.preview_grafana_panel_query", "grafana_tool", mcp, mcp_call("preview_grafana_panel_query", {"targets": [{"expr": "up"}, {"expr": "rate(x[5m])"}], "max_points": 200})),
+        ("grafana.get_zabbix_data", "grafana_tool", mcp, mcp_call("get_zabbix_data", {})),
+        ("grafana.get_zabbix_problems", "grafana_tool", mcp, mcp_call("get_zabbix_problems", {})),
+        ("wazuh.get_agents", "wazuh_tools", mcp, mcp_call("get_agents", {})),
+        ("wazuh.get_rules", "wazuh_tools", mcp, mcp_call("get_rules", {})),
+        ("wazuh.get_alerts", "wazuh_tools", mcp, mcp_call("get_alerts", {})),
+        ("wazuh.get_vulnerabilities", "wazuh_tools", mcp, mcp_call("get_vulnerabilities", {"agent_id": "001"})),
+        ("easyvista.get_ticket", "easyvista_tools", mcp, mcp_call("get_ticket", {"rfc_number": "I240001"})),
+        ("weather.get_weather_forecast", "weather_tool", mcp, mcp_call("get_weather_forecast", {"lat": 48.85, "lon": 2.35})),
+        ("yahoo.get_stock_price", "yahoo_finance_tool", mcp, mcp_call("get_stock_price", {"ticker": "STUB"})),
+        ("file_fetch.file_fetcher", "file_fetch_tool", mcp, mcp_call("file_fetcher", {"path": share_dir})),
+        ("file_service.read_directory", "file_service", "/read_directory", {"path": share_dir}),
+        ("gateway.get_rules", "mcp_gateway", mcp, mcp_call("get_rules", {})),
+    ]
+
+
+def make_share(directory, files, size):
+    for i in range(files):
+        with open(os.path.join(directory, f"file_{i:04d}.txt"), "w") as f:
+            f.write((f"line {i} " * (size // 8 + 1))[:size])
+
+
+# --- Processes ---
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_process(args, cwd, env, port, log_path):
+    with open(log_path, "wb") as log:
+        process = subprocess.Popen(
+            [sys.executable, *args, "--host", "127.0.0.1", "--port", str(port)],
+            cwd=cwd,
+            env={**os.environ, "PYTHONPATH": ROOT, **env},
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    process.log_path = log_path
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_ready(client, process, url, path, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with status {process.returncode}, see {process.log_path}")
+        try:
+            await client.get(url + path)
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout:.0f}s")
+
+
+def memory_mb(pid):
+    """
+    Current and peak resident set size from /proc (Linux only).
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(fields["VmRSS"].split()[0]) / 1024, int(fields["VmHWM"].split()[0]) / 1024
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+# --- Load generation ---
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def is_error(response):
+    if response.status_code != 200:
+        return True
+    try:
+        body = response.json()
+    except ValueError:
+        return True
+    return isinstance(body, dict) and "error" in body
+
+
+async def run_level(client, url, body, concurrency, duration, warmup):
+    latencies, errors = [], 0
+    payload = json.dumps(body).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+
+    async def worker(deadline, record):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.post(url, content=payload, headers=headers)
+                failed = is_error(response)
+            except httpx.HTTPError:
+                failed = True
+            if record:
+                latencies.append(time.perf_counter() - start)
+                errors += failed
+
+    if warmup:
+        deadline = time.monotonic() + warmup
+        await asyncio.gather(*(worker(deadline, False) for _ in range(concurrency)))
+
+    start = time.monotonic()
+    await asyncio.gather(*(worker(start + duration, True) for _ in range(concurrency)))
+    elapsed = time.monotonic() - start
+
+    latencies.sort()
+    ms = lambda value: round(value * 1000, 3) if value is not None else None  # noqa: E731
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+    }
+
+
+async def run(options):
+    selected = set(options.services.split(",")) if options.services else None
+    levels = [int(c) for c in options.concurrency.split(",")]
+    results = []
+
+    log_dir = tempfile.mkdtemp(prefix="mcp-load-test-")
+    print(f"Process logs: {log_dir}")
+    with tempfile.TemporaryDirectory() as share_dir:
+        make_share(share_dir, options.files, options.file_size)
+        plan = [s for s in scenarios(share_dir) if selected is None or s[1] in selected]
+
+        stub_port = free_port()
+        stub, stub_url = start_process(
+            [os.path.join(ROOT, "benchmarks", "stubs.py"), "--latency-ms", str(options.latency_ms), "--jitter-ms", str(options.jitter_ms), "--items", str(options.items)],
+            ROOT, {}, stub_port, os.path.join(log_dir, "stubs.log"),
+        )
+        processes = [stub]
+        envs = service_env(stub_url)
+        try:
+            async with httpx.AsyncClient(timeout=options.timeout, limits=httpx.Limits(max_connections=max(levels))) as client:
+                await wait_ready(client, stub, stub_url, "/query")
+                services = {}
+                for service in dict.fromkeys(s[1] for s in plan):
+                    env = dict(envs[service])
+                    if not options.cache:
+                        env.update({f"MCP_CACHE_TTL_{s[3]['params']['name'].upper()}": "0" for s in plan if s[1] == service and "params" in s[3]})
+                    process, url = start_process(
+                        ["-m", "uvicorn", "main:app", "--log-level", "warning"],
+                        os.path.join(ROOT, service), env, free_port(), os.path.join(log_dir, f"{service}.log"),
+                    )
+                    processes.append(process)
+                    services[service] = (process, url)
+                for process, url in services.values():
+                    await wait_ready(client, process, url, "/metrics")
+
+                for name, service, path, body in plan:
+                    process, url = services[service]
+                    for concurrency in levels:
+                        level = await run_level(client, url + path, body, concurrency, options.duration, options.warmup)
+                        rss, peak = memory_mb(process.pid)
+                        level.update({"scenario": name, "concurrency": concurrency, "rss_mb": rss, "peak_rss_mb": peak})
+                        results.append(level)
+                        print(format_row(level), flush=True)
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait(timeout=10)
+    return results
+
+
+# --- Reporting ---
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_row(level):
+    return (
+        f"{level['scenario']:<42} c={level['concurrency']:<4} {level['rps']:>9.1f} req/s  "
+        f"p50 {level['p50_ms'] or 0:>8.1f}  p95 {level['p95_ms'] or 0:>8.1f}  p99 {level['p99_ms'] or 0:>8.1f} ms  "
+        f"errors {level['errors']:<5} rss {level['rss_mb'] or 0:.0f} MB"
+    )
+
+
+def compare(results, baseline):
+    """
+    Prints throughput and p95 changes relative to a previous run.
+    """
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'}:")
+    for level in results:
+        before = previous.get((level["scenario"], level["concurrency"]))
+        if not before or not before["rps"] or not before["p95_ms"] or level["p95_ms"] is None:
+            continue
+        rps = (level["rps"] - before["rps"]) / before["rps"] * 100
+        p95 = (level["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+        print(f"{level['scenario']:<42} c={level['concurrency']:<4} rps {rps:+7.1f}%  p95 {p95:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the MCP servers against stub upstreams.")
+    parser.add_argument("--services", help="Comma-separated service directories to test (default: all).")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="Comma-separated concurrency levels.")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds measured per concurrency level.")
+    parser.add_argument("--warmup", type=float, default=1.0, help="Unmeasured seconds before each level.")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds.")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Stub upstream latency.")
+    parser.add_argument("--jitter-ms", type=float, default=5.0, help="Stub upstream random extra latency.")
+    parser.add_argument("--items", type=int, default=500, help="Entries in stub list responses.")
+    parser.add_argument("--files", type=int, default=50, help="Files in the file tool share.")
+    parser.add_argument("--file-size", type=int, default=16384, help="Size of each share file in bytes.")
+    parser.add_argument("--cache", action="store_true", help="Leave the response caches enabled.")
+    parser.add_argument("--out", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="Compare with a previous results file.")
+    options = parser.parse_args()
+
+    results = asyncio.run(run(options))
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": {k: v for k, v in vars(options).items() if k not in ("out", "compare")},
+        },
+        "results": results,
+    }
+    if options.out:
+        with open(options.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if options.compare:
+        with open(options.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
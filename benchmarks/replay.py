@@ -0,0 +1,210 @@
+"""
+Replays recorded MCP traffic against a service.
+
+The log is written by a service running with ``MCP_RECORD_PATH`` set (see
+``mcp_common/recording.py``). With ``--service``, the service is started with
+``MCP_REPLAY_PATH`` pointing at the same log, so its upstream calls are
+answered from the recording and no Grafana, Wazuh or Zabbix instance is
+needed. Calls are re-sent at their recorded arrival times divided by
+``--speed``, or as fast as ``--concurrency`` allows with ``--speed max``.
+
+Usage::
+
+    python benchmarks/replay.py traffic.jsonl.gz --service wazuh_tools --speed 1
+    python benchmarks/replay.py traffic.jsonl.gz --service wazuh_tools --speed 10 --out after.json --compare before.json
+    python benchmarks/replay.py traffic.jsonl.gz --url http://localhost:8000 --speed max --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import httpx
+
+from load_test import ROOT, free_port, git_commit, is_error, memory_mb, percentile, service_env, start_process, wait_ready
+
+sys.path.insert(0, ROOT)
+
+from mcp_common.recording import read_log  # noqa: E402
+
+
+def load_calls(path, service=None):
+    """
+    Returns the recorded calls in arrival order, optionally only those
+    recorded by ``service``.
+    """
+    calls = [r for r in read_log(path) if r.get("t") == "call" and (service is None or r.get("service") == service)]
+    calls.sort(key=lambda c: c["ts"])
+    return calls
+
+
+async def send(client, url, call):
+    start = time.perf_counter()
+    try:
+        response = await client.post(url + call["path"], json=call["body"])
+        failed = is_error(response)
+    except httpx.HTTPError:
+        failed = True
+    return call, time.perf_counter() - start, failed
+
+
+async def drive(client, url, calls, speed, concurrency):
+    """
+    Sends the calls on the recorded schedule (scaled by ``speed``) or, when
+    ``speed`` is ``None``, back to back from ``concurrency`` workers. Returns
+    the results and the largest scheduling lag in seconds.
+    """
+    if speed is None:
+        pending = iter(calls)
+        results = []
+
+        async def worker():
+            for call in pending:
+                results.append(await send(client, url, call))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return results, 0.0
+
+    start = time.monotonic()
+    first = calls[0]["ts"] if calls else 0.0
+    tasks, lag = [], 0.0
+    for call in calls:
+        due = start + (call["ts"] - first) / speed
+        delay = due - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            lag = max(lag, -delay)
+        tasks.append(asyncio.ensure_future(send(client, url, call)))
+    return await asyncio.gather(*tasks), lag
+
+
+def summarize(latencies, recorded, errors, elapsed):
+    latencies, recorded = sorted(latencies), sorted(recorded)
+    ms = lambda value: round(value * 1000, 3) if value is not None else None  # noqa: E731
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "recorded_p50_ms": ms(percentile(recorded, 50)),
+        "recorded_p95_ms": ms(percentile(recorded, 95)),
+    }
+
+
+async def run(options, calls):
+    speed = None if options.speed == "max" else float(options.speed)
+    process = None
+    url = options.url
+    if options.service:
+        log_dir = tempfile.mkdtemp(prefix="mcp-replay-")
+        # The services refuse to run unconfigured; the placeholder URLs are never contacted in replay mode.
+        env = dict(service_env("http://replay.invalid").get(options.service, {}))
+        env.update(dict(item.split("=", 1) for item in options.env))
+        env.update({"MCP_REPLAY_PATH": os.path.abspath(options.log), "MCP_REPLAY_LATENCY": str(options.upstream_latency)})
+        process, url = start_process(
+            ["-m", "uvicorn", "main:app", "--log-level", "warning"],
+            os.path.join(ROOT, options.service), env, free_port(), os.path.join(log_dir, f"{options.service}.log"),
+        )
+        print(f"Service log: {process.log_path}")
+
+    try:
+        async with httpx.AsyncClient(timeout=options.timeout, limits=httpx.Limits(max_connections=None)) as client:
+            if process is not None:
+                await wait_ready(client, process, url, "/metrics")
+            start = time.monotonic()
+            results, lag = await drive(client, url, calls, speed, options.concurrency)
+            elapsed = time.monotonic() - start
+        rss, peak = memory_mb(process.pid) if process is not None else (None, None)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+    by_tool = defaultdict(lambda: ([], [], 0))
+    for call, latency, failed in results:
+        name = call["body"]["params"].get("name", "?")
+        latencies, recorded, errors = by_tool[name]
+        latencies.append(latency)
+        recorded.append(call.get("dur", 0.0))
+        by_tool[name] = (latencies, recorded, errors + failed)
+
+    summary = summarize([r[1] for r in results], [r[0].get("dur", 0.0) for r in results], sum(r[2] for r in results), elapsed)
+    summary.update({"elapsed_s": round(elapsed, 3), "max_lag_ms": round(lag * 1000, 3), "rss_mb": rss, "peak_rss_mb": peak})
+    tools = {name: summarize(latencies, recorded, errors, elapsed) for name, (latencies, recorded, errors) in sorted(by_tool.items())}
+    return summary, tools
+
+
+def print_row(name, s):
+    print(
+        f"{name:<36} {s['requests']:>6} calls {s['rps'] or 0:>8.1f} req/s  "
+        f"p50 {s['p50_ms'] or 0:>8.1f}  p95 {s['p95_ms'] or 0:>8.1f}  p99 {s['p99_ms'] or 0:>8.1f} ms  "
+        f"(recorded p50 {s['recorded_p50_ms'] or 0:.1f}, p95 {s['recorded_p95_ms'] or 0:.1f})  errors {s['errors']}"
+    )
+
+
+def compare(tools, baseline):
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'}:")
+    for name, s in tools.items():
+        before = baseline["tools"].get(name)
+        if not before or not before["p95_ms"] or s["p95_ms"] is None:
+            continue
+        change = (s["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+        print(f"{name:<36} p95 {before['p95_ms']:>8.1f} -> {s['p95_ms']:>8.1f} ms ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded MCP traffic against a service.")
+    parser.add_argument("log", help="Traffic log written with MCP_RECORD_PATH.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--service", help="Service directory to start in replay mode, e.g. wazuh_tools.")
+    target.add_argument("--url", help="Base URL of an already running service.")
+    parser.add_argument("--only", help="With --url, replay only the calls recorded by this service.")
+    parser.add_argument("--speed", default="1", help="Replay speed: 1, 10, ... or max.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Workers used with --speed max.")
+    parser.add_argument("--upstream-latency", type=float, default=1.0, help="Scale of the recorded upstream latency (0 = none).")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="Extra environment for the started service, e.g. MCP_CACHE_TTL_GET_AGENTS=0.")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds.")
+    parser.add_argument("--out", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="Compare with a previous results file.")
+    options = parser.parse_args()
+
+    calls = load_calls(options.log, options.service or options.only)
+    if not calls:
+        parser.error(f"{options.log} contains no recorded calls for this service")
+
+    summary, tools = asyncio.run(run(options, calls))
+    print_row("all", summary)
+    for name, s in tools.items():
+        print_row(name, s)
+    print(f"elapsed {summary['elapsed_s']:.1f}s, max scheduling lag {summary['max_lag_ms']:.1f} ms, rss {summary['rss_mb'] or 0:.0f} MB")
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "log": options.log,
+            "settings": {k: v for k, v in vars(options).items() if k not in ("log", "out", "compare")},
+        },
+        "summary": summary,
+        "tools": tools,
+    }
+    if options.out:
+        with open(options.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if options.compare:
+        with open(options.compare) as f:
+            compare(tools, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
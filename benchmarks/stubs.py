@@ -0,0 +1,275 @@
+"""
+Local stub upstreams for load testing the MCP servers.
+
+One Starlette app imitates the parts of Grafana, Wazuh, Zabbix (JSON-RPC),
+EasyVista, OpenWeather and Alpha Vantage that the tools call. Every response
+is delayed by ``--latency-ms`` (plus up to ``--jitter-ms``) and list responses
+hold ``--items`` entries, so upstream cost can be dialled up or down. With
+``--rate-limit``, requests above that many per second get 429 Too Many
+Requests, as a throttling upstream would answer.
+
+Usage::
+
+    python benchmarks/stubs.py --port 9100 --latency-ms 20 --items 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+
+class StubConfig:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, items=100, rate_limit=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.items = items
+        self.rate_limit = rate_limit
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency_ms=float(os.environ.get("STUB_LATENCY_MS", "0")),
+            jitter_ms=float(os.environ.get("STUB_JITTER_MS", "0")),
+            items=int(os.environ.get("STUB_ITEMS", "100")),
+            rate_limit=float(os.environ.get("STUB_RATE_LIMIT", "0")),
+        )
+
+
+# --- Payloads ---
+def agent(i):
+    return {
+        "id": f"{i:03d}",
+        "name": f"agent-{i}",
+        "ip": f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+        "status": "active" if i % 7 else "disconnected",
+        "os": {"platform": "ubuntu", "name": "Ubuntu", "version": "22.04.3 LTS", "arch": "x86_64"},
+        "version": "Wazuh v4.7.2",
+        "group": ["default", "linux"],
+        "lastKeepAlive": "2024-03-01T12:00:00Z",
+    }
+
+
+def rule(i):
+    return {"id": 1000 + i, "level": i % 16, "description": f"Stub rule {i}", "groups": ["syslog", "stub"], "filename": "0010-stub_rules.xml", "status": "enabled"}
+
+
+def alert(i):
+    return {"id": str(i), "timestamp": "2024-03-01T12:00:00Z", "rule": {"id": str(1000 + i % 50), "level": i % 16, "description": f"Stub alert {i}"}, "agent": {"id": f"{i % 100:03d}", "name": f"agent-{i % 100}"}}
+
+
+def vulnerability(i):
+    return {"cve": f"CVE-2024-{i:05d}", "name": f"package-{i}", "version": "1.0.0", "severity": ("Low", "Medium", "High", "Critical")[i % 4], "status": "VALID"}
+
+
+def wazuh_items(items):
+    return {"data": {"affected_items": items, "total_affected_items": len(items), "total_failed_items": 0, "failed_items": []}, "message": "OK", "error": 0}
+
+
+def dashboard(uid, panels):
+    return {
+        "meta": {"type": "db", "slug": uid, "version": 1, "url": f"/d/{uid}/{uid}"},
+        "dashboard": {
+            "uid": uid,
+            "title": f"Dashboard {uid}",
+            "version": 1,
+            "panels": [
+                {"id": i, "type": "timeseries", "title": f"Panel {i}", "gridPos": {"x": i % 2 * 12, "y": i // 2 * 8, "w": 12, "h": 8}, "targets": [{"refId": "A", "expr": f"rate(metric_{i}[5m])"}]}
+                for i in range(panels)
+            ],
+        },
+    }
+
+
+def frame(points):
+    start = 1_700_000_000_000
+    return {
+        "schema": {"fields": [{"name": "Time", "type": "time"}, {"name": "Value", "type": "number"}]},
+        "data": {"values": [[start + i * 15_000 for i in range(points)], [float(i % 97) for i in range(points)]]},
+    }
+
+
+def zabbix_result(method, params, items):
+    if method == "apiinfo.version":
+        return "6.0.0"
+    if method == "user.login":
+        return "stub-zabbix-session"
+    if method == "hostgroup.get":
+        return [{"groupid": str(i), "name": f"Group {i}"} for i in range(max(items // 10, 1))]
+    if method == "host.get":
+        return [{"hostid": str(10000 + i), "host": f"host-{i}"} for i in range(items)]
+    if method == "item.get":
+        return [{"itemid": str(20000 + i), "name": f"Item {i}"} for i in range(min(items, 10))]
+    if method == "event.get":
+        if params.get("sortorder") == "DESC":
+            return [{"eventid": str(items)}]
+        if "eventid_from" in params:
+            return []
+        return [
+            {"eventid": str(i), "objectid": str(30000 + i), "clock": "1700000000", "value": "1", "name": f"Problem {i}", "severity": str(i % 6), "acknowledged": "0", "hosts": [{"host": f"host-{i % 50}"}]}
+            for i in range(1, items + 1)
+        ]
+    if method == "problem.get":
+        return [{"eventid": str(i)} for i in range(1, items + 1)]
+    return []
+
+
+# --- App ---
+def create_app(config=None):
+    config = config or StubConfig.from_env()
+
+    async def delay():
+        latency = config.latency_ms + random.uniform(0, config.jitter_ms)
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+
+    def respond(body, status_code=200):
+        return Response(json.dumps(body), status_code=status_code, media_type="application/json")
+
+    bucket = {"tokens": config.rate_limit, "updated": time.monotonic()}
+
+    def throttled():
+        if not config.rate_limit:
+            return False
+        now = time.monotonic()
+        bucket["tokens"] = min(config.rate_limit, bucket["tokens"] + (now - bucket["updated"]) * config.rate_limit)
+        bucket["updated"] = now
+        if bucket["tokens"] < 1:
+            return True
+        bucket["tokens"] -= 1
+        return False
+
+    def endpoint(build):
+        async def handler(request):
+            if throttled():
+                return Response(json.dumps({"title": "Too Many Requests"}), status_code=429, media_type="application/json", headers={"Retry-After": "1"})
+            await delay()
+            return respond(await build(request))
+        return handler
+
+    # Grafana
+    async def grafana_search(request):
+        return [{"id": i, "uid": f"dash-{i}", "title": f"Dashboard {i}", "type": "dash-db", "url": f"/d/dash-{i}"} for i in range(config.items)]
+
+    async def grafana_dashboard(request):
+        uid = request.path_params["uid"]
+        if request.method == "DELETE":
+            return {"title": f"Dashboard {uid}", "message": "Dashboard deleted"}
+        return dashboard(uid, min(config.items, 100))
+
+    async def grafana_versions(request):
+        return [{"id": 1, "version": 1, "created": "2024-03-01T12:00:00Z"}]
+
+    async def grafana_save(request):
+        body = await request.json()
+        uid = body.get("dashboard", {}).get("uid") or "stub"
+        return {"id": 1, "uid": uid, "url": f"/d/{uid}", "status": "success", "version": 1}
+
+    async def grafana_teams(request):
+        return {"totalCount": config.items, "teams": [{"id": i, "name": f"team-{i}", "memberCount": i % 10} for i in range(config.items)], "page": 1, "perPage": config.items}
+
+    async def grafana_users(request):
+        return [{"id": i, "login": f"user{i}", "email": f"user{i}@example.com", "name": f"User {i}"} for i in range(config.items)]
+
+    async def grafana_query(request):
+        body = await request.json()
+        return {"results": {q.get("refId", "A"): {"status": 200, "frames": [frame(config.items * 10)]} for q in body.get("queries", [])}}
+
+    # Wazuh
+    async def wazuh_authenticate(request):
+        return {"data": {"token": "stub-wazuh-token"}, "error": 0}
+
+    async def wazuh_agents(request):
+        if request.method == "POST":
+            return {"data": {"id": "999", "key": "c3R1Yi1rZXk="}, "error": 0}
+        if request.method in ("DELETE", "PUT"):
+            return wazuh_items([f"{i:03d}" for i in range(min(config.items, 50))])
+        return wazuh_items([agent(i) for i in range(config.items)])
+
+    async def wazuh_agent_key(request):
+        return wazuh_items([{"id": request.path_params["agent_id"], "key": "c3R1Yi1rZXk="}])
+
+    async def wazuh_rules(request):
+        return wazuh_items([rule(i) for i in range(config.items)])
+
+    async def wazuh_alerts(request):
+        offset = int(request.query_params.get("offset", 0))
+        limit = int(request.query_params.get("limit", config.items))
+        return wazuh_items([alert(i) for i in range(offset, min(offset + limit, config.items))])
+
+    async def wazuh_vulnerabilities(request):
+        return wazuh_items([vulnerability(i) for i in range(config.items)])
+
+    # Zabbix
+    async def zabbix_rpc(request):
+        body = await request.json()
+        return {"jsonrpc": "2.0", "result": zabbix_result(body.get("method"), body.get("params") or {}, config.items), "id": body.get("id")}
+
+    # EasyVista
+    async def easyvista_create(request):
+        return {"HREF": "/api/v1/tickets/I240001", "rfc_number": "I240001"}
+
+    async def easyvista_ticket(request):
+        number = request.path_params["rfc_number"]
+        if request.method == "PUT":
+            return {"HREF": f"/api/v1/tickets/{number}"}
+        return {"rfc_number": number, "title": "Stub ticket", "status": "Open", "description": "x" * config.items}
+
+    # OpenWeather
+    async def openweather(request):
+        return {"weather": [{"id": 800, "main": "Clear", "description": "clear sky"}], "main": {"temp": 293.15, "humidity": 40}, "name": "Stubville"}
+
+    # Alpha Vantage
+    async def alphavantage(request):
+        symbol = request.query_params.get("symbol", "STUB")
+        return {"Global Quote": {"01. symbol": symbol, "05. price": "123.4500", "07. latest trading day": "2024-03-01"}}
+
+    routes = [
+        Route("/api/search", endpoint(grafana_search)),
+        Route("/api/dashboards/db", endpoint(grafana_save), methods=["POST"]),
+        Route("/api/dashboards/uid/{uid}", endpoint(grafana_dashboard), methods=["GET", "DELETE"]),
+        Route("/api/dashboards/uid/{uid}/versions", endpoint(grafana_versions)),
+        Route("/api/teams/search", endpoint(grafana_teams)),
+        Route("/api/users", endpoint(grafana_users)),
+        Route("/api/ds/query", endpoint(grafana_query), methods=["POST"]),
+        Route("/security/user/authenticate", endpoint(wazuh_authenticate), methods=["GET", "POST"]),
+        Route("/agents", endpoint(wazuh_agents), methods=["GET", "POST", "DELETE"]),
+        Route("/agents/restart", endpoint(wazuh_agents), methods=["PUT"]),
+        Route("/agents/{agent_id}/key", endpoint(wazuh_agent_key)),
+        Route("/rules", endpoint(wazuh_rules)),
+        Route("/alerts", endpoint(wazuh_alerts)),
+        Route("/vulnerability/{agent_id}", endpoint(wazuh_vulnerabilities)),
+        Route("/api_jsonrpc.php", endpoint(zabbix_rpc), methods=["POST"]),
+        Route("/api/v1/tickets", endpoint(easyvista_create), methods=["POST"]),
+        Route("/api/v1/tickets/{rfc_number}", endpoint(easyvista_ticket), methods=["GET", "PUT"]),
+        Route("/data/2.5/weather", endpoint(openweather)),
+        Route("/query", endpoint(alphavantage)),
+    ]
+    return Starlette(routes=routes)
+
+
+app = create_app()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve stub upstream APIs for load testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every response.")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra delay, up to this value.")
+    parser.add_argument("--items", type=int, default=100, help="Number of entries in list responses.")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Answer 429 above this many requests per second (0 = unlimited).")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    uvicorn.run(create_app(StubConfig(args.latency_ms, args.jitter_ms, args.items, args.rate_limit)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,20 @@
 
 from fastapi import FastAPI, APIRouter, Request
-from starlette.responses import JSONResponse
 from pydantic import BaseModel, Field
 import requests
 import os
 import json
 
+from mcp_common import upstream
+from mcp_common.fastjson import JSONResponse, passthrough, read_json
+from mcp_common.metrics import instrument
+from mcp_common.results import RESULTS_NEXT_TOOL, ResultsNextArgs, results_next, error_of as results_error
+from mcp_common.streaming import call_tool
+
+# --- Upstream Limits ---
+upstream.limit(os.environ.get("EASYVISTA_URL", ""), concurrency=8)
+upstream.policy(os.environ.get("EASYVISTA_URL", ""), read_timeout=30)
+
 # --- Pydantic Schemas ---
 class CreateTicketArgs(BaseModel):
     catalog_code: str = Field(..., description="The catalog code of the ticket.")
@@ -54,9 +63,9 @@ def create_ticket(args: CreateTicketArgs):
     }
 
     try:
-        response = requests.post(f"{easyvista_url}/api/v1/tickets", headers=headers, data=json.dumps(payload))
+        response = upstream.post(f"{easyvista_url}/api/v1/tickets", headers=headers, data=json.dumps(payload))
         response.raise_for_status()
-        return response.json()
+        return passthrough(response)
     except requests.exceptions.RequestException as e:
         return f"An error occurred: {e}"
 
@@ -77,9 +86,9 @@ def get_ticket(args: GetTicketArgs):
     }
 
     try:
-        response = requests.get(f"{easyvista_url}/api/v1/tickets/{args.rfc_number}?account_id={account_id}", headers=headers)
+        response = upstream.get(f"{easyvista_url}/api/v1/tickets/{args.rfc_number}?account_id={account_id}", headers=headers)
         response.raise_for_status()
-        return response.json()
+        return passthrough(response)
     except requests.exceptions.RequestException as e:
         return f"An error occurred: {e}"
 
@@ -105,9 +114,9 @@ def update_ticket(args: UpdateTicketArgs):
     }
 
     try:
-        response = requests.put(f"{easyvista_url}/api/v1/tickets/{args.rfc_number}", headers=headers, data=json.dumps(payload))
+        response = upstream.put(f"{easyvista_url}/api/v1/tickets/{args.rfc_number}", headers=headers, data=json.dumps(payload))
         response.raise_for_status()
-        return response.json()
+        return passthrough(response)
     except requests.exceptions.RequestException as e:
         return f"An error occurred: {e}"
 
@@ -134,9 +143,9 @@ def close_ticket(args: CloseTicketArgs):
     }
 
     try:
-        response = requests.put(f"{easyvista_url}/api/v1/tickets/{args.rfc_number}", headers=headers, a=json.dumps(payload))
+        response = upstream.put(f"{easyvista_url}/api/v1/tickets/{args.rfc_number}", headers=headers, data=json.dumps(payload))
         response.raise_for_status()
-        return response.json()
+        return passthrough(response)
     except requests.exceptions.RequestException as e:
         return f"An error occurred: {e}"
 
@@ -145,7 +154,7 @@ router = APIRouter()
 
 @router.post("/mcp")
 async def mcp_handler(request: Request):
-    body = await request.json()
+    body = await read_json(request)
     method = body.get("method")
     id = body.get("id")
 
@@ -183,7 +192,8 @@ async def mcp_handler(request: Request):
                 "description": "Closes an EasyVista ticket.",
                 "inputSchema": CloseTicketArgs.model_json_schema(),
                 "outputSchema": {"type": "object"}
-            }
+            },
+            RESULTS_NEXT_TOOL
         ]
         return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": {"tools": tools}})
     elif method == "tools/call":
@@ -191,20 +201,19 @@ async def mcp_handler(request: Request):
         tool_args = body["params"].get("arguments", {})
         if tool_name == "create_ticket":
             args = CreateTicketArgs(**tool_args)
-            result = create_ticket(args)
-            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+            return await call_tool(request, id, body["params"], create_ticket, args)
         elif tool_name == "get_ticket":
             args = GetTicketArgs(**tool_args)
-            result = get_ticket(args)
-            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+            return await call_tool(request, id, body["params"], get_ticket, args)
         elif tool_name == "update_ticket":
             args = UpdateTicketArgs(**tool_args)
-            result = update_ticket(args)
-            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+            return await call_tool(request, id, body["params"], update_ticket, args)
         elif tool_name == "close_ticket":
             args = CloseTicketArgs(**tool_args)
-            result = close_ticket(args)
-            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+            return await call_tool(request, id, body["params"], close_ticket, args)
+        elif tool_name == "results_next":
+            args = ResultsNextArgs(**tool_args)
+            return await call_tool(request, id, body["params"], results_next, args, error_of=results_error)
         else:
             return JSONResponse(content={"jsonrpc": "2.0", "id": id, "error": {"code": -32601, "message": "Method not found"}}, status_code=404)
     else:
@@ -213,3 +222,4 @@ async def mcp_handler(request: Request):
 # --- FastAPI App ---
 app = FastAPI()
 app.include_router(router, prefix="/api/v1")
+instrument(app)
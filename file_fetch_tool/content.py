@@ -0,0 +1,164 @@
+"""
+Compressed file content for the binary resource endpoint.
+
+``GET /api/v1/files/{path}`` serves a file from the network share as raw
+bytes instead of base64 inside JSON. The encoding is negotiated from the
+request's ``Accept-Encoding``: zstd when the ``zstandard`` package is
+installed and the client accepts it, then gzip, then identity. Compression
+runs on a dedicated thread pool so it never blocks the event loop.
+
+The compressed form of files up to ``FILE_FETCH_CACHE_MAX_FILE_BYTES`` is kept
+in an LRU of ``FILE_FETCH_CACHE_BYTES``, keyed by the file's identity (inode,
+size and modification time) and the requested range, so unchanged files are
+compressed once. Larger files are compressed chunk by chunk as they stream.
+"""
+import asyncio
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from mcp_common import metrics
+
+CACHE_BYTES = int(os.environ.get("FILE_FETCH_CACHE_BYTES", str(64 * 1024 * 1024)))
+CACHE_MAX_FILE_BYTES = int(os.environ.get("FILE_FETCH_CACHE_MAX_FILE_BYTES", str(8 * 1024 * 1024)))
+STREAM_CHUNK_BYTES = 256 * 1024
+ZSTD_LEVEL = 3
+GZIP_LEVEL = 6
+
+_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("FILE_FETCH_COMPRESS_THREADS", "4")), thread_name_prefix="file-compress")
+
+
+def negotiate(accept_encoding):
+    """
+    The best encoding the client accepts: ``zstd``, ``gzip`` or ``identity``.
+    Encodings with ``q=0`` count as refused.
+    """
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    for encoding in ("zstd", "gzip"):
+        if encoding == "zstd" and zstandard is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+
+def etag(stat, offset, length, encoding):
+    return f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}-{offset:x}-{length:x}-{encoding}"'
+
+
+class _Compressor:
+    """
+    An incremental compressor with the same interface for zstd and gzip.
+    """
+
+    def __init__(self, encoding):
+        if encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+            self._finish = lambda: self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+        else:
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._finish = self._obj.flush
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def finish(self):
+        return self._finish()
+
+
+def _read(path, offset, length):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+def _compress_range(path, offset, length, encoding):
+    compressor = _Compressor(encoding)
+    return compressor.compress(_read(path, offset, length)) + compressor.finish()
+
+
+class ByteLRU:
+    """
+    A byte-bounded LRU of cached file data, e.g. compressed or encoded ranges.
+    """
+
+    def __init__(self, budget=CACHE_BYTES):
+        self.budget = budget
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.budget:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.budget:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+cache = ByteLRU()
+
+
+async def compressed(path, stat, offset, length, encoding):
+    """
+    The whole compressed range, from the cache or compressed on the pool.
+    """
+    key = (stat.st_ino, stat.st_size, stat.st_mtime_ns, path, offset, length, encoding)
+    data = cache.get(key)
+    metrics.CACHE_REQUESTS.labels("file_content", "hit" if data is not None else "miss").inc()
+    if data is None:
+        data = await asyncio.get_running_loop().run_in_executor(_pool, _compress_range, path, offset, length, encoding)
+        cache.put(key, data)
+    return data
+
+
+async def stream(path, offset, length, encoding):
+    """
+    Yields the range ``offset:offset + length`` of a file, compressed chunk by
+    chunk on the pool unless ``encoding`` is ``identity``.
+    """
+    loop = asyncio.get_running_loop()
+    compressor = _Compressor(encoding) if encoding != "identity" else None
+    with open(path, "rb") as f:
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+            data = await loop.run_in_executor(_pool, f.read, min(STREAM_CHUNK_BYTES, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            if compressor is not None:
+                data = await loop.run_in_executor(_pool, compressor.compress, data)
+            if data:
+                yield data
+    if compressor is not None:
+        yield compressor.finish()
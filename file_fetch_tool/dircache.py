@@ -0,0 +1,236 @@
+"""
+Per-directory manifests for repeated listings of the same share paths.
+
+``scan(path)`` returns a snapshot of the directory's manifest: the name, size,
+mtime and inode of every file. A file is modified when its size, mtime or
+inode changed since the last scan. Scans only stat files; their SHA-256 is
+computed by ``digest`` for the files a caller actually serves, and kept until
+the file changes.
+
+Every scan that finds a change bumps the manifest's version. Listings carry a
+``token`` naming that version, and ``scan(path, since=token)`` also returns
+the files added, modified or removed since it. Tokens from another process
+or older than the retained removal history are answered with a full listing
+(``reset``).
+
+By default each scan stats every entry, which is the only reliable check on
+network filesystems. With ``FILE_FETCH_INOTIFY=true`` and ``inotify_simple``
+installed, scanned directories are watched and a directory is only rescanned
+after an event for it. inotify does not see changes made by other clients of
+an NFS or SMB share, so only enable it for local filesystems.
+"""
+import hashlib
+import logging
+import os
+import secrets
+import threading
+from collections import OrderedDict
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+MAX_DIRECTORIES = int(os.environ.get("FILE_FETCH_MANIFEST_DIRS", "256"))
+HASH_MAX_BYTES = int(os.environ.get("FILE_FETCH_HASH_MAX_BYTES", str(256 * 1024 * 1024)))
+MAX_TOMBSTONES = 10000
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def file_hash(path, size):
+    """
+    The SHA-256 of a file, or ``None`` for files over ``HASH_MAX_BYTES``.
+    """
+    if size > HASH_MAX_BYTES:
+        return None
+    digest = hashlib.sha256()
+    buffer = bytearray(HASH_CHUNK_BYTES)
+    view = memoryview(buffer)
+    with open(path, "rb") as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    The files of one directory, with the version at which each was added and
+    last changed, and tombstones for removed files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.epoch = secrets.token_hex(4)
+        self.version = 0
+        self.files = {}
+        self.removed = OrderedDict()
+        self.floor = 0
+        self.scanned = False
+        self.lock = threading.Lock()
+
+    @property
+    def token(self):
+        return f"{self.epoch}.{self.version}"
+
+    def refresh(self):
+        """
+        Rescans the directory and records what changed.
+        """
+        seen = {}
+        with os.scandir(self.path) as it:
+            for entry in it:
+                try:
+                    if entry.is_file():
+                        seen[entry.name] = entry.stat()
+                except OSError:
+                    continue
+
+        version = self.version + 1
+        changed = False
+        for name, stat in seen.items():
+            old = self.files.get(name)
+            if old is not None and (old["ino"], old["size"], old["mtime_ns"]) == (stat.st_ino, stat.st_size, stat.st_mtime_ns):
+                continue
+            record = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "ino": stat.st_ino, "sha256": None}
+            record.update(added=old["added"] if old is not None else version, changed=version)
+            self.files[name] = record
+            changed = True
+            self.removed.pop(name, None)
+
+        for name in [n for n in self.files if n not in seen]:
+            del self.files[name]
+            self.removed[name] = version
+            changed = True
+        while len(self.removed) > MAX_TOMBSTONES:
+            _, dropped = self.removed.popitem(last=False)
+            self.floor = max(self.floor, dropped)
+        if changed:
+            self.version = version
+        self.scanned = True
+
+
+def digest(record, path):
+    """
+    The SHA-256 of a manifest file, hashed on first use and kept on its
+    record, which a change replaces. ``None`` for files over
+    ``HASH_MAX_BYTES`` or that cannot be read.
+    """
+    if record["sha256"] is None:
+        try:
+            record["sha256"] = file_hash(path, record["size"])
+        except OSError as e:
+            logging.warning(f"Could not hash {path}: {e}")
+    return record["sha256"]
+
+
+def changes(manifest, token):
+    """
+    The names of the files added, modified and removed since ``token``, or
+    ``None`` when the token cannot be answered incrementally.
+    """
+    epoch, _, version = (token or "").partition(".")
+    if epoch != manifest.epoch or not version.isdigit() or int(version) < manifest.floor or int(version) > manifest.version:
+        return None
+    since = int(version)
+    added = sorted(n for n, f in manifest.files.items() if f["added"] > since)
+    modified = sorted(n for n, f in manifest.files.items() if f["changed"] > since and f["added"] <= since)
+    removed = sorted(n for n, v in manifest.removed.items() if v > since)
+    return {"added": added, "modified": modified, "removed": removed}
+
+
+class _Watcher:
+    """
+    Marks directories dirty when inotify reports a change in them.
+    """
+
+    def __init__(self):
+        flags = inotify_simple.flags
+        self._flags = flags.CREATE | flags.DELETE | flags.MODIFY | flags.CLOSE_WRITE | flags.MOVED_FROM | flags.MOVED_TO | flags.ATTRIB | flags.DELETE_SELF
+        self._inotify = inotify_simple.INotify()
+        self._paths = {}
+        self._watches = {}
+        self.dirty = set()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name="file-fetch-inotify", daemon=True).start()
+
+    def watch(self, path):
+        with self._lock:
+            if path in self._watches:
+                return True
+            try:
+                wd = self._inotify.add_watch(path, self._flags)
+            except OSError as e:
+                logging.warning(f"Cannot watch {path}: {e}")
+                return False
+            self._watches[path] = wd
+            self._paths[wd] = path
+            return True
+
+    def unwatch(self, path):
+        with self._lock:
+            wd = self._watches.pop(path, None)
+            if wd is not None:
+                self._paths.pop(wd, None)
+                try:
+                    self._inotify.rm_watch(wd)
+                except OSError:
+                    pass
+
+    def is_clean(self, path):
+        with self._lock:
+            return path in self._watches and path not in self.dirty
+
+    def mark_clean(self, path):
+        with self._lock:
+            self.dirty.discard(path)
+
+    def _run(self):
+        while True:
+            for event in self._inotify.read():
+                with self._lock:
+                    if event.mask & inotify_simple.flags.Q_OVERFLOW:
+                        self.dirty.update(self._watches)
+                    path = self._paths.get(event.wd)
+                    if path is not None:
+                        self.dirty.add(path)
+                    if event.mask & inotify_simple.flags.IGNORED and path is not None:
+                        self._paths.pop(event.wd, None)
+                        self._watches.pop(path, None)
+
+
+_watcher = _Watcher() if inotify_simple is not None and os.environ.get("FILE_FETCH_INOTIFY", "false").lower() == "true" else None
+_manifests = OrderedDict()
+_lock = threading.Lock()
+
+
+def scan(path, since=None):
+    """
+    A snapshot of the up-to-date manifest of a directory: its files, its
+    token and, when ``since`` is given, the changes since that token.
+    Concurrent scans of the same directory wait for each other instead of
+    rescanning it twice.
+    """
+    path = os.path.realpath(path)
+    with _lock:
+        manifest = _manifests.get(path)
+        if manifest is None:
+            manifest = _manifests[path] = Manifest(path)
+        _manifests.move_to_end(path)
+        while len(_manifests) > MAX_DIRECTORIES:
+            evicted, _ = _manifests.popitem(last=False)
+            if _watcher is not None:
+                _watcher.unwatch(evicted)
+    with manifest.lock:
+        if _watcher is None or not manifest.scanned or not _watcher.is_clean(path):
+            if _watcher is not None and _watcher.watch(path):
+                # Cleared before rescanning, so an event during the scan marks it dirty again.
+                _watcher.mark_clean(path)
+            manifest.refresh()
+        return {
+            "files": dict(manifest.files),
+            "token": manifest.token,
+            "changes": changes(manifest, since) if since is not None else None,
+        }
@@ -1,45 +1,309 @@
-
 from fastapi import FastAPI, APIRouter, Request
-from starlette.responses import JSONResponse
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, Field
+from typing import Any, List, Literal, Optional
+from urllib.parse import quote
 import os
 import base64
+import fnmatch
+
+import content
+import dircache
+import search_index
+import structured
+
+from mcp_common import metrics, walk
+from mcp_common.fastjson import JSONResponse, read_json
+from mcp_common.metrics import instrument
+from mcp_common.results import RESULTS_NEXT_TOOL, ResultsNextArgs, results_next, error_of as results_error
+from mcp_common.streaming import call_tool, emit_partial, is_streaming, report_progress
+
+NETWORK_SHARE = os.environ.get("NETWORK_SHARE_PATH", "/home/mnelson-ext/model-context-protocol/network_share")
+MAX_FILE_BYTES = int(os.environ.get("FILE_FETCH_MAX_FILE_BYTES", str(8 * 1024 * 1024)))
+MAX_TOTAL_BYTES = int(os.environ.get("FILE_FETCH_MAX_TOTAL_BYTES", str(32 * 1024 * 1024)))
+# A multiple of 3, so that the base64 chunks of a file can simply be concatenated.
+CHUNK_BYTES = int(os.environ.get("FILE_FETCH_CHUNK_BYTES", str(768 * 1024))) // 3 * 3 or 3
+# Prefix of the resource URLs handed out by file_fetcher, e.g. "http://file-fetch:8002".
+PUBLIC_URL = os.environ.get("FILE_FETCH_PUBLIC_URL", "").rstrip("/")
+
+index = search_index.TrigramIndex(NETWORK_SHARE)
+encoded_cache = content.ByteLRU(int(os.environ.get("FILE_FETCH_ENCODED_CACHE_BYTES", str(64 * 1024 * 1024))))
 
 # --- Pydantic Schemas ---
 class FileFetchArgs(BaseModel):
     path: str = Field(..., description="The path to the directory on the network share.")
+    pattern: Optional[str] = Field(None, description="Optional: Glob pattern that file names must match, e.g. 'report_*.csv'.")
+    extensions: Optional[List[str]] = Field(None, description="Optional: File extensions to include, e.g. ['csv', 'json'].")
+    offset: int = Field(0, ge=0, description="Optional: Byte offset to start reading each file at.")
+    length: Optional[int] = Field(None, ge=0, description="Optional: Maximum number of bytes to read from each file, starting at offset.")
+    max_file_bytes: int = Field(MAX_FILE_BYTES, ge=0, description="Optional: Maximum number of bytes returned per file. Larger files are truncated and report a next_offset.")
+    max_total_bytes: int = Field(MAX_TOTAL_BYTES, ge=0, description="Optional: Maximum number of bytes returned for all files together.")
+    since: Optional[str] = Field(None, description="Optional: The token of a previous listing of this directory. Only files added or modified since then are returned, and removed files are named in 'changes'.")
+    delivery: Literal["inline", "resource"] = Field("inline", description="Optional: 'inline' returns base64 contents in the result; 'resource' returns a URL per file that serves its bytes, compressed with zstd or gzip when the client accepts it.")
+
+class ListTreeArgs(BaseModel):
+    path: str = Field(..., description="The path to the directory on the network share.")
+    max_depth: Optional[int] = Field(None, ge=0, description="Optional: How many levels of subdirectories to descend into; 0 lists the directory itself only. Unlimited by default.")
+    include: Optional[List[str]] = Field(None, description="Optional: Glob patterns; only files whose relative path or name matches one are listed, e.g. ['*.csv', 'reports/2024/*'].")
+    exclude: Optional[List[str]] = Field(None, description="Optional: Glob patterns for files and directories to skip, e.g. ['.git', '*.tmp'].")
+    max_entries: int = Field(walk.MAX_ENTRIES, ge=1, description="Optional: Maximum number of files to list.")
+
+class RowFilter(BaseModel):
+    column: str = Field(..., description="Column name; for JSON records a dotted path, e.g. 'agent.name'.")
+    op: Literal["==", "!=", "<", "<=", ">", ">=", "contains", "in"] = Field(..., description="Comparison. Numbers compare numerically, anything else as text.")
+    value: Any = Field(..., description="Value to compare with; a list for 'in'.")
+
+class Aggregation(BaseModel):
+    op: Literal["count", "sum", "mean", "min", "max"] = Field(..., description="Aggregate function.")
+    column: Optional[str] = Field(None, description="Column to aggregate. Without a column, 'count' counts rows.")
+
+class QueryFileArgs(BaseModel):
+    path: str = Field(..., description="The path to a CSV, TSV, JSON or JSONL file on the network share.")
+    format: Optional[Literal["csv", "json", "jsonl"]] = Field(None, description="Optional: File format, if it cannot be told from the extension.")
+    columns: Optional[List[str]] = Field(None, description="Optional: Columns to return. All by default.")
+    filters: Optional[List[RowFilter]] = Field(None, description="Optional: Conditions that rows must all meet.")
+    head: Optional[int] = Field(None, ge=0, description="Optional: Return only the first N matching rows (or groups).")
+    tail: Optional[int] = Field(None, ge=1, description="Optional: Return only the last N matching rows (or groups).")
+    group_by: Optional[List[str]] = Field(None, description="Optional: Columns to group matching rows by. Each group is returned with its aggregations, or its row count by default.")
+    aggregations: Optional[List[Aggregation]] = Field(None, description="Optional: Aggregates to compute per group, or over all matching rows without group_by.")
+    json_path: Optional[str] = Field(None, description="Optional: Dotted path to the array of records inside a JSON document, e.g. 'data.items'.")
+    delimiter: Optional[str] = Field(None, description="Optional: CSV field delimiter. ',' by default, tab for .tsv files.")
+
+class SearchFilesArgs(BaseModel):
+    query: str = Field(..., min_length=3, description="Text to search for, at least 3 characters, e.g. a hostname or an error message.")
+    path: Optional[str] = Field(None, description="Optional: Only search under this directory of the network share.")
+    include: Optional[List[str]] = Field(None, description="Optional: Glob patterns that file paths must match, e.g. ['*.log'].")
+    case_sensitive: bool = Field(False, description="Optional: Match case exactly.")
+    max_files: int = Field(50, ge=1, le=1000, description="Optional: Maximum number of matching files to return.")
+    max_matches_per_file: int = Field(10, ge=1, le=1000, description="Optional: Maximum number of matches returned per file.")
+    refresh: bool = Field(False, description="Optional: Update the index before searching, to find files added since its last refresh.")
 
 # --- Tool Implementation ---
-def read_directory(path: str):
+def matches(filename: str, pattern: Optional[str], extensions: Optional[List[str]]):
+    if pattern and not fnmatch.fnmatch(filename, pattern):
+        return False
+    if extensions:
+        suffix = os.path.splitext(filename)[1].lstrip(".").lower()
+        return suffix in {e.lstrip(".").lower() for e in extensions}
+    return True
+
+def share_path(path: str):
+    """
+    The path of a file relative to the network share, or ``None`` when it lies
+    outside of it.
+    """
+    root = os.path.realpath(NETWORK_SHARE)
+    real = os.path.realpath(path)
+    return os.path.relpath(real, root) if real.startswith(root + os.sep) else None
+
+def resource_url(relative: str, offset: int, length: int):
+    return f"{PUBLIC_URL}/api/v1/files/{quote(relative)}?offset={offset}&length={length}"
+
+def read_chunks(file_path: str, offset: int, length: int, buffer: bytearray):
+    """
+    Yields the bytes ``offset:offset + length`` of a file as base64 chunks,
+    read through one fixed-size buffer so memory does not grow with the file.
+    """
+    view = memoryview(buffer)
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+            n = f.readinto(view[:min(len(buffer), remaining)])
+            if not n:
+                break
+            remaining -= n
+            yield n, base64.b64encode(view[:n]).decode("ascii")
+
+def describe(record: dict, offset: int, length: Optional[int]):
+    """
+    The manifest fields of a file and the byte range to return from it.
+    """
+    size = record["size"]
+    start = min(offset, size)
+    wanted = size - start if length is None else min(length, size - start)
+    return {"size": size, "mtime_ns": record["mtime_ns"], "sha256": record["sha256"], "offset": start}, wanted
+
+def list_resources(full_path: str, files: dict, offset: int, length: Optional[int]):
+    """
+    Describes each file with the URL of its requested byte range instead of
+    its content.
+    """
+    results = {}
+    for name, record in files.items():
+        relative = share_path(os.path.join(full_path, name))
+        if relative is None:
+            results[name] = {"error": "Resource URLs are only available for files on the network share."}
+            continue
+        info, wanted = describe(record, offset, length)
+        results[name] = dict(info, length=wanted, uri=resource_url(relative, info["offset"], wanted))
+    return results
+
+def read_encoded(file_path: str, record: dict, start: int, count: int, buffer: bytearray):
     """
-    Reads all files from a given directory on the network share and returns their content.
+    The base64 encoding of a byte range, from the encoded cache when the file
+    is unchanged since it was last read.
     """
-    base_path = "/home/mnelson-ext/model-context-protocol/network_share"
-    full_path = os.path.join(base_path, path)
+    key = (file_path, record["ino"], record["size"], record["mtime_ns"], start, count)
+    cacheable = count <= content.CACHE_MAX_FILE_BYTES
+    encoded = encoded_cache.get(key) if cacheable else None
+    if cacheable:
+        metrics.CACHE_REQUESTS.labels("file_fetcher", "hit" if encoded is not None else "miss").inc()
+    if encoded is None:
+        encoded = "".join(chunk for _, chunk in read_chunks(file_path, start, count, buffer))
+        if cacheable:
+            encoded_cache.put(key, encoded)
+    return encoded
+
+def read_directory(path: str, pattern: str = None, extensions: List[str] = None, offset: int = 0, length: int = None,
+                   max_file_bytes: int = MAX_FILE_BYTES, max_total_bytes: int = MAX_TOTAL_BYTES, delivery: str = "inline",
+                   since: str = None):
+    """
+    Reads the files of a directory on the network share, up to the per-file
+    and total byte limits. When the caller is streaming, file contents are
+    sent as partial results chunk by chunk and the final result only lists
+    the files; otherwise the contents are returned inline. With the
+    ``resource`` delivery, files are listed with URLs instead of contents.
+    With ``since``, only files added or modified since that listing's token
+    are returned, along with the names of removed files.
+    """
+    full_path = os.path.join(NETWORK_SHARE, path)
     results = {}
+    if os.path.realpath(full_path) != os.path.realpath(NETWORK_SHARE) and share_path(full_path) is None:
+        return {"error": "Path must be inside the network share."}
+    if not os.path.isdir(full_path):
+        return {"error": "Path is not a directory or does not exist."}
+
+    listing = dircache.scan(full_path, since)
+    changes = listing["changes"]
+    if changes is not None:
+        changes = {kind: [n for n in names if matches(n, pattern, extensions)] for kind, names in changes.items()}
+        names = sorted(changes["added"] + changes["modified"])
+    else:
+        names = sorted(n for n in listing["files"] if matches(n, pattern, extensions))
+    files = {name: listing["files"][name] for name in names}
+    extra = {"token": listing["token"]}
+    if since is not None:
+        extra.update(changes=changes) if changes is not None else extra.update(reset=True)
+
+    if delivery == "resource":
+        return dict({"data": list_resources(full_path, files, offset, length)}, **extra)
+    streaming = is_streaming()
+    buffer = bytearray(CHUNK_BYTES)
+    budget = max_total_bytes
+    total = 0
+    for name, record in files.items():
+        file_path = os.path.join(full_path, name)
+        try:
+            info, wanted = describe(record, offset, length)
+            start = info["offset"]
+            count = min(wanted, max_file_bytes, budget)
+            if start == 0 and count == record["size"]:
+                # Only files served whole are hashed, as hashing reads them in full.
+                info["sha256"] = dircache.digest(record, file_path)
+            info.update(length=0, encoding="base64")
+            if streaming:
+                for n, chunk in read_chunks(file_path, start, count, buffer):
+                    emit_partial({"file": name, "offset": start + info["length"], "content": chunk, "encoding": "base64"})
+                    info["length"] += n
+            else:
+                info["content"] = read_encoded(file_path, record, start, count, buffer)
+                info["length"] = len(info["content"]) * 3 // 4 - info["content"][-2:].count("=")
+            if info["length"] < wanted:
+                info["truncated"] = True
+                info["next_offset"] = start + info["length"]
+            budget -= info["length"]
+            total += info["length"]
+            results[name] = info
+            report_progress(len(results), len(files), f"Read {len(results)} of {len(files)} files")
+        except OSError as e:
+            results[name] = {"error": str(e)}
+    return dict({"data": results, "total_bytes": total, "truncated": any(r.get("truncated") for r in results.values())}, **extra)
+
+def file_fetcher(args: FileFetchArgs):
+    """
+    Reads the files from the directory named in the tool arguments.
+    """
+    return read_directory(args.path, args.pattern, args.extensions, args.offset, args.length, args.max_file_bytes, args.max_total_bytes, args.delivery, args.since)
+
+def list_tree(args: ListTreeArgs):
+    """
+    Lists the files under a directory of the network share, recursively, as a
+    compact manifest without their contents.
+    """
+    full_path = os.path.join(NETWORK_SHARE, args.path)
+    if os.path.realpath(full_path) != os.path.realpath(NETWORK_SHARE) and share_path(full_path) is None:
+        return {"error": "Path must be inside the network share."}
     if not os.path.isdir(full_path):
         return {"error": "Path is not a directory or does not exist."}
+    return walk.walk(full_path, args.max_depth, args.include, args.exclude, args.max_entries)
+
+def query_file(args: QueryFileArgs):
+    """
+    Answers a query over a CSV, JSON or JSONL file on the network share,
+    returning only the selected rows or aggregates instead of the file.
+    """
+    full_path = os.path.join(NETWORK_SHARE, args.path)
+    if share_path(full_path) is None:
+        return {"error": "Path must be inside the network share."}
+    if not os.path.isfile(full_path):
+        return {"error": "Path is not a file or does not exist."}
+    size = os.path.getsize(full_path)
+    try:
+        return structured.query(
+            full_path, args.format, args.columns,
+            [(f.column, f.op, f.value) for f in args.filters or []],
+            args.head, args.tail, args.group_by,
+            [(a.op, a.column) for a in args.aggregations or []],
+            args.json_path, args.delimiter,
+            progress=lambda position: report_progress(position, size, f"Read {position} of {size} bytes"),
+        )
+    except (structured.QueryError, ValueError, OSError) as e:
+        return {"error": str(e)}
+
+def search_files(args: SearchFilesArgs):
+    """
+    Finds the text files on the network share that contain a string, with the
+    line, byte offset and a snippet of each match, using the trigram index.
+    """
+    prefix = None
+    if args.path:
+        prefix = os.path.normpath(args.path).strip("/")
+        if prefix == ".":
+            prefix = None
+        elif prefix == ".." or prefix.startswith("../"):
+            return {"error": "Path must be inside the network share."}
+    if args.refresh or index.stats()["indexed_at"] is None:
+        report_progress(0, None, "Updating the search index")
+        index.refresh()
+    index.start()
 
-    for filename in os.listdir(full_path):
-        file_path = os.path.join(full_path, filename)
-        if os.path.isfile(file_path):
-            try:
-                with open(file_path, "rb") as f:
-                    content = f.read()
-                    results[filename] = {
-                        "content": base64.b64encode(content).decode('utf-8'),
-                        "encoding": "base64"
-                    }
-            except Exception as e:
-                results[filename] = {"error": str(e)}
-    return {"data": results}
+    candidates = index.candidates(args.query, prefix)
+    if args.include:
+        candidates = [p for p in candidates if any(fnmatch.fnmatch(p, g) or fnmatch.fnmatch(os.path.basename(p), g) for g in args.include)]
+    files, searched = [], 0
+    truncated = False
+    for path in candidates:
+        if len(files) >= args.max_files:
+            truncated = True
+            break
+        try:
+            with open(os.path.join(NETWORK_SHARE, path), "rb") as f:
+                data = f.read(search_index.MAX_FILE_BYTES)
+        except OSError:
+            continue
+        searched += 1
+        found, count = search_index.find_matches(data, args.query, args.case_sensitive, args.max_matches_per_file)
+        if count:
+            files.append({"path": path, "match_count": count, "matches": found})
+    return {"query": args.query, "files": files, "candidates": len(candidates), "files_read": searched, "truncated": truncated, "index": index.stats()}
 
 # --- MCP Router ---
 router = APIRouter()
 
 @router.post("/mcp")
 async def mcp_handler(request: Request):
-    body = await request.json()
+    body = await read_json(request)
     method = body.get("method")
     id = body.get("id")
 
@@ -52,23 +316,78 @@ async def mcp_handler(request: Request):
         tools = [{
             "name": "file_fetcher",
             "title": "File Fetcher",
-            "description": "Reads all files from a given directory on the network share.",
+            "description": "Reads files from a directory on the network share, with glob and extension filters, byte ranges and per-file and total size limits. Streaming callers receive file contents as partial results, chunk by chunk.",
             "inputSchema": FileFetchArgs.model_json_schema(),
             "outputSchema": {"type": "object"}
-        }]
+        }, {
+            "name": "list_tree",
+            "title": "List Directory Tree",
+            "description": "Lists the files under a directory on the network share recursively, with their sizes and modification times but without contents, so that specific files can be fetched afterwards. Supports depth limits and include/exclude glob patterns.",
+            "inputSchema": ListTreeArgs.model_json_schema(),
+            "outputSchema": {"type": "object"}
+        }, {
+            "name": "query_file",
+            "title": "Query File",
+            "description": "Parses a CSV, JSON or JSONL file on the network share on the server and returns only the answer: selected columns of rows matching filters, the first or last rows, or group-by aggregates (count, sum, mean, min, max). Works on files of any size without returning their content.",
+            "inputSchema": QueryFileArgs.model_json_schema(),
+            "outputSchema": {"type": "object"}
+        }, {
+            "name": "search_files",
+            "title": "Search Files",
+            "description": "Searches the text files on the network share for a string, such as a hostname or an error message, using a trigram index. Returns the matching files with the line number, byte offset and a snippet of each match.",
+            "inputSchema": SearchFilesArgs.model_json_schema(),
+            "outputSchema": {"type": "object"}
+        }, RESULTS_NEXT_TOOL]
         return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": {"tools": tools}})
     elif method == "tools/call":
         tool_name = body["params"]["name"]
         tool_args = body["params"].get("arguments", {})
         if tool_name == "file_fetcher":
             args = FileFetchArgs(**tool_args)
-            result = read_directory(args.path)
-            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+            return await call_tool(request, id, body["params"], file_fetcher, args)
+        elif tool_name == "query_file":
+            args = QueryFileArgs(**tool_args)
+            return await call_tool(request, id, body["params"], query_file, args)
+        elif tool_name == "search_files":
+            args = SearchFilesArgs(**tool_args)
+            return await call_tool(request, id, body["params"], search_files, args)
+        elif tool_name == "list_tree":
+            args = ListTreeArgs(**tool_args)
+            return await call_tool(request, id, body["params"], list_tree, args)
+        elif tool_name == "results_next":
+            args = ResultsNextArgs(**tool_args)
+            return await call_tool(request, id, body["params"], results_next, args, error_of=results_error)
         else:
             return JSONResponse(content={"jsonrpc": "2.0", "id": id, "error": {"code": -32601, "message": "Method not found"}}, status_code=404)
     else:
         return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": None})
 
+# --- Resource Endpoint ---
+@router.get("/files/{path:path}")
+async def get_file(request: Request, path: str, offset: int = 0, length: Optional[int] = None):
+    """
+    Serves the bytes of a file on the network share, compressed with the best
+    encoding the client accepts. Supports conditional requests via ETag.
+    """
+    full_path = os.path.join(NETWORK_SHARE, path)
+    if share_path(full_path) is None or not os.path.isfile(full_path):
+        return JSONResponse(content={"error": "File not found."}, status_code=404)
+    stat = os.stat(full_path)
+    start = min(max(offset, 0), stat.st_size)
+    count = stat.st_size - start if length is None else min(max(length, 0), stat.st_size - start)
+    encoding = content.negotiate(request.headers.get("accept-encoding"))
+    tag = content.etag(stat, start, count, encoding)
+    headers = {"ETag": tag, "Vary": "Accept-Encoding", "Cache-Control": "private, max-age=0, must-revalidate"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    if request.headers.get("if-none-match") == tag:
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity" and count <= content.CACHE_MAX_FILE_BYTES:
+        body = await content.compressed(full_path, stat, start, count, encoding)
+        return Response(body, media_type="application/octet-stream", headers=headers)
+    return StreamingResponse(content.stream(full_path, start, count, encoding), media_type="application/octet-stream", headers=headers)
+
 # --- FastAPI App ---
 app = FastAPI()
 app.include_router(router, prefix="/api/v1")
+instrument(app)
@@ -0,0 +1,285 @@
+"""
+Trigram index for content search over the network share.
+
+Every text file under the share is indexed by the set of byte trigrams of its
+lowercased content, in an SQLite database at ``FILE_FETCH_INDEX_PATH``. A
+search looks up the trigrams of the query, reads only the files that contain
+all of them, and confirms the matches there, so a query over tens of
+thousands of files reads a handful of them.
+
+The index is refreshed incrementally: files are walked with their size and
+mtime, and only new or changed files are read and re-indexed; deleted files
+are dropped. A background thread refreshes it every
+``FILE_FETCH_INDEX_INTERVAL`` seconds, and a search can ask for a refresh
+first. Between refreshes, new files are not found yet; changed files are
+still searched by their current content.
+
+Binary files (a NUL byte in the first 8 KiB) and files over
+``FILE_FETCH_INDEX_MAX_FILE_BYTES`` are not indexed.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from mcp_common import walk
+
+INDEX_PATH = os.environ.get("FILE_FETCH_INDEX_PATH", os.path.join("index", "trigrams.sqlite3"))
+INTERVAL = float(os.environ.get("FILE_FETCH_INDEX_INTERVAL", "300"))
+MAX_FILE_BYTES = int(os.environ.get("FILE_FETCH_INDEX_MAX_FILE_BYTES", str(16 * 1024 * 1024)))
+MAX_FILES = int(os.environ.get("FILE_FETCH_INDEX_MAX_FILES", "1000000"))
+SNIFF_BYTES = 8192
+SNIPPET_CHARS = 200
+COMMIT_EVERY = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, indexed INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS postings (trigram INTEGER NOT NULL, block INTEGER NOT NULL, bits INTEGER NOT NULL, PRIMARY KEY (trigram, block)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_block ON postings (block);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+# Postings are kept per block of 64 file ids, as a bitmap of the files in the
+# block holding the trigram: neighbouring files share most of their trigrams,
+# so this stores a fraction of the rows of one posting per file.
+BLOCK = 64
+FLUSH_POSTINGS = 4_000_000
+
+
+def trigrams(data):
+    """
+    The distinct byte trigrams of ``data``, each packed into an integer.
+    """
+    if len(data) < 3:
+        return np.empty(0, dtype=np.uint32)
+    array = np.frombuffer(data, dtype=np.uint8).astype(np.uint32)
+    return np.unique((array[:-2] << 16) | (array[1:-1] << 8) | array[2:])
+
+
+def _is_text(data):
+    return b"\0" not in data[:SNIFF_BYTES]
+
+
+def _signed(mask):
+    """
+    A 64-bit mask as the signed integer SQLite stores.
+    """
+    return mask - (1 << 64) if mask >= 1 << 63 else mask
+
+
+def _block_mask(file_id):
+    return file_id // BLOCK, _signed(1 << (file_id % BLOCK))
+
+
+class TrigramIndex:
+    """
+    The index of the files under ``root``, stored at ``path``.
+    """
+
+    def __init__(self, root, path=INDEX_PATH):
+        self.root = root
+        self.path = path
+        self._local = threading.local()
+        self._refresh_lock = threading.Lock()
+        self._refresher = None
+        self._refreshed = None
+        self.refreshing = False
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            self._local.db = db
+        return db
+
+    # --- Updates ---
+    def refresh(self):
+        """
+        Indexes new and changed files and drops deleted ones. Returns counts
+        of what changed. Concurrent refreshes wait for the running one.
+        """
+        with self._refresh_lock:
+            self.refreshing = True
+            try:
+                return self._refresh()
+            finally:
+                self.refreshing = False
+                self._refreshed = time.monotonic()
+
+    def _refresh(self):
+        start = time.monotonic()
+        db = self._db()
+        listing = walk.walk(self.root, max_entries=MAX_FILES, mtime_ns=True)
+        known = {path: (file_id, size, mtime) for file_id, path, size, mtime in db.execute("SELECT id, path, size, mtime_ns FROM files")}
+        seen = set()
+        added = updated = skipped = 0
+        pending, pending_files = [], 0
+        for path, size, mtime in listing["files"]:
+            seen.add(path)
+            old = known.get(path)
+            if old is not None and old[1:] == (size, mtime):
+                continue
+            if old is not None:
+                _clear(db, old[0])
+            found = self._index_file(db, path, size, mtime, old[0] if old else None)
+            if found is None:
+                skipped += 1
+            else:
+                pending.append(found)
+                added += old is None
+                updated += old is not None
+            pending_files += 1
+            if pending_files >= COMMIT_EVERY or sum(len(grams) for _, grams in pending) >= FLUSH_POSTINGS:
+                _add_postings(db, pending)
+                db.commit()
+                pending, pending_files = [], 0
+        _add_postings(db, pending)
+        removed = [file_id for path, (file_id, _, _) in known.items() if path not in seen]
+        for file_id in removed:
+            _clear(db, file_id)
+            db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+        db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('indexed_at', ?)", (datetime.now(timezone.utc).isoformat(),))
+        db.commit()
+        elapsed = time.monotonic() - start
+        logging.info(f"Search index refreshed in {elapsed:.1f}s: {added} added, {updated} updated, {len(removed)} removed, {skipped} not indexed")
+        return {"added": added, "updated": updated, "removed": len(removed), "not_indexed": skipped, "truncated": listing["truncated"], "seconds": round(elapsed, 3)}
+
+    def _index_file(self, db, path, size, mtime, file_id):
+        """
+        Records one file and returns its id and trigrams, or None if it is not
+        indexed. Those files are still recorded, with ``indexed = 0``, so they
+        are not read again until they change.
+        """
+        data = None
+        if size <= MAX_FILE_BYTES:
+            try:
+                with open(os.path.join(self.root, path), "rb") as f:
+                    data = f.read(MAX_FILE_BYTES + 1)
+            except OSError as e:
+                logging.warning(f"Could not index {path}: {e}")
+        indexed = data is not None and len(data) <= MAX_FILE_BYTES and _is_text(data)
+        if file_id is None:
+            file_id = db.execute("INSERT INTO files (path, size, mtime_ns, indexed) VALUES (?, ?, ?, ?)", (path, size, mtime, int(indexed))).lastrowid
+        else:
+            db.execute("UPDATE files SET size = ?, mtime_ns = ?, indexed = ? WHERE id = ?", (size, mtime, int(indexed), file_id))
+        if not indexed:
+            return None
+        return file_id, trigrams(data.lower())
+
+    def start(self):
+        """
+        Starts the background refresher, once.
+        """
+        if self._refresher is not None:
+            return
+        self._refresher = threading.Thread(target=self._run, name="search-index", daemon=True)
+        self._refresher.start()
+
+    def _run(self):
+        while True:
+            if self._refreshed is not None and time.monotonic() - self._refreshed < INTERVAL:
+                time.sleep(INTERVAL - (time.monotonic() - self._refreshed))
+                continue
+            try:
+                self.refresh()
+            except Exception:
+                logging.exception("Search index refresh failed")
+
+    # --- Queries ---
+    def candidates(self, query, prefix=None):
+        """
+        Paths of the indexed files that contain every trigram of ``query``,
+        optionally only under the directory ``prefix``.
+        """
+        grams = [int(t) for t in trigrams(query.encode("utf-8").lower())]
+        db = self._db()
+        blocks = {}
+        rows = db.execute(f"SELECT trigram, block, bits FROM postings WHERE trigram IN ({','.join('?' * len(grams))})", grams)
+        for _, block, bits in rows:
+            count, mask = blocks.get(block, (0, -1))
+            blocks[block] = (count + 1, mask & bits)
+        ids = [
+            block * BLOCK + bit
+            for block, (count, mask) in blocks.items() if count == len(grams) and mask
+            for bit in range(BLOCK) if mask >> bit & 1
+        ]
+        paths = []
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            paths.extend(row[0] for row in db.execute(f"SELECT path FROM files WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+        if prefix:
+            directory = prefix.rstrip("/") + "/"
+            paths = [p for p in paths if p == prefix or p.startswith(directory)]
+        return sorted(paths)
+
+    def stats(self):
+        db = self._db()
+        files, indexed = db.execute("SELECT COUNT(*), COALESCE(SUM(indexed), 0) FROM files").fetchone()
+        row = db.execute("SELECT value FROM meta WHERE key = 'indexed_at'").fetchone()
+        return {"files": files, "indexed_files": indexed, "indexed_at": row[0] if row else None, "refreshing": self.refreshing}
+
+
+def _clear(db, file_id):
+    """
+    Removes a file from the postings of its block.
+    """
+    block, mask = _block_mask(file_id)
+    db.execute("UPDATE postings SET bits = bits & ? WHERE block = ?", (~mask, block))
+    db.execute("DELETE FROM postings WHERE block = ? AND bits = 0", (block,))
+
+
+def _add_postings(db, found):
+    """
+    Adds ``(file_id, trigrams)`` pairs to the postings, merging them into one
+    bitmap per trigram and block before writing.
+    """
+    if not found:
+        return
+    ids = np.concatenate([np.full(len(grams), file_id, dtype=np.int64) for file_id, grams in found])
+    grams = np.concatenate([grams for _, grams in found]).astype(np.int64)
+    keys = (ids // BLOCK) << 24 | grams
+    bits = np.left_shift(np.uint64(1), (ids % BLOCK).astype(np.uint64))
+    order = np.argsort(keys, kind="stable")
+    keys, bits = keys[order], bits[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    masks = np.bitwise_or.reduceat(bits, starts).view(np.int64)
+    keys = keys[starts]
+    db.executemany(
+        "INSERT INTO postings (trigram, block, bits) VALUES (?, ?, ?) ON CONFLICT (trigram, block) DO UPDATE SET bits = bits | excluded.bits",
+        zip((keys & 0xFFFFFF).tolist(), (keys >> 24).tolist(), masks.tolist()),
+    )
+
+
+def find_matches(data, query, case_sensitive, limit):
+    """
+    The line number, byte offset and snippet of up to ``limit`` occurrences
+    of ``query`` in ``data``, and the total number of occurrences.
+    """
+    needle = query.encode("utf-8")
+    haystack = data if case_sensitive else data.lower()
+    needle = needle if case_sensitive else needle.lower()
+    matches, count = [], 0
+    line, line_start, scanned = 1, 0, 0
+    position = haystack.find(needle)
+    while position != -1:
+        count += 1
+        if len(matches) < limit:
+            line += data.count(b"\n", scanned, position)
+            line_start = data.rfind(b"\n", 0, position) + 1
+            scanned = position
+            line_end = data.find(b"\n", position)
+            text = data[line_start:line_end if line_end != -1 else len(data)].decode("utf-8", errors="replace").rstrip("\r")
+            column = len(data[line_start:position].decode("utf-8", errors="replace"))
+            if len(text) > SNIPPET_CHARS:
+                begin = max(0, min(column - SNIPPET_CHARS // 2, len(text) - SNIPPET_CHARS))
+                text = ("..." if begin else "") + text[begin:begin + SNIPPET_CHARS] + ("..." if begin + SNIPPET_CHARS < len(text) else "")
+            matches.append({"line": line, "offset": position, "column": column, "snippet": text})
+        position = haystack.find(needle, position + max(len(needle), 1))
+    return matches, count
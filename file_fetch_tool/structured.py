@@ -0,0 +1,367 @@
+"""
+Server-side queries over CSV, JSON and JSONL files.
+
+``query`` streams a file in chunks of ``CHUNK_ROWS`` records, so memory does
+not grow with the file, and returns only the answer: the selected columns of
+the matching rows, or one row per group with its aggregates. Filters and
+aggregations run vectorized on NumPy arrays, one chunk at a time.
+
+CSV and JSONL are always streamed. A JSON document whose records are an array
+(at the root or at ``json_path``) is streamed with ``ijson`` when it is
+installed; without it, documents up to ``FILE_FETCH_QUERY_JSON_MAX_BYTES`` are
+loaded whole. A JSON document that is not an array of records, such as a
+config file, is returned as its parsed ``value``.
+"""
+import csv
+import io
+import itertools
+import os
+from collections import deque
+
+import numpy as np
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+from mcp_common.fastjson import loads
+
+CHUNK_ROWS = int(os.environ.get("FILE_FETCH_QUERY_CHUNK_ROWS", "65536"))
+MAX_ROWS = int(os.environ.get("FILE_FETCH_QUERY_MAX_ROWS", "1000"))
+JSON_MAX_BYTES = int(os.environ.get("FILE_FETCH_QUERY_JSON_MAX_BYTES", str(256 * 1024 * 1024)))
+FORMATS = {".csv": "csv", ".tsv": "csv", ".json": "json", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+# csv rejects fields over 128 KiB by default; the cap only guards against runaway quotes.
+csv.field_size_limit(64 * 1024 * 1024)
+
+
+class QueryError(ValueError):
+    pass
+
+
+# --- Values ---
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value if isinstance(value, str) else str(value)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _typed(value):
+    """
+    A CSV field as a number when it looks like one.
+    """
+    if not isinstance(value, str):
+        return value
+    if value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _floats(values):
+    try:
+        return np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        return np.fromiter((_number(v) for v in values), dtype=float, count=len(values))
+
+
+def _strings(values):
+    if values and all(type(v) is str for v in values):
+        return np.asarray(values, dtype=str)
+    return np.asarray([_text(v) for v in values], dtype=str)
+
+
+def _get(record, path):
+    for key in path.split("."):
+        if not isinstance(record, dict):
+            return None
+        record = record.get(key)
+    return record
+
+
+# --- Readers ---
+def _csv_chunks(raw, needed, delimiter, progress, extra=()):
+    """
+    Yields the header of a CSV file, then ``(columns, size)`` chunks of its
+    ``needed`` columns (all of them when ``None``) and the ``extra`` ones.
+    """
+    reader = csv.reader(io.TextIOWrapper(raw, encoding="utf-8", errors="replace", newline=""), delimiter=delimiter)
+    header = next(reader, None)
+    if header is None:
+        return
+    yield header
+    names = list(dict.fromkeys((header if needed is None else needed) + list(extra)))
+    missing = [n for n in names if n not in header]
+    if missing:
+        raise QueryError(f"Unknown columns: {', '.join(missing)}. The file has: {', '.join(header)}.")
+    indexes = [(n, header.index(n)) for n in names]
+    width = len(header)
+    while True:
+        rows = list(itertools.islice(reader, CHUNK_ROWS))
+        if not rows:
+            break
+        # Short rows are padded, as csv.DictReader does.
+        rows = [r if len(r) >= width else r + [""] * (width - len(r)) for r in rows]
+        yield {n: [r[i] for r in rows] for n, i in indexes}, len(rows)
+        progress(raw.tell())
+
+
+def _record_chunks(records, needed, progress=None, position=None, extra=()):
+    """
+    Yields the header (the keys of the first record) and then column chunks
+    of an iterable of records, with the ``needed`` columns (the header when
+    ``None``) and the ``extra`` ones. Columns may be dotted paths.
+    """
+    records = iter(records)
+    first = list(itertools.islice(records, CHUNK_ROWS))
+    first = [r if isinstance(r, dict) else {"value": r} for r in first]
+    header = list(dict.fromkeys(k for r in first[:100] for k in r))
+    yield header
+    names = list(dict.fromkeys((header if needed is None else needed) + list(extra)))
+    chunk = first
+    while chunk:
+        yield {n: [_get(r, n) for r in chunk] for n in names}, len(chunk)
+        if progress is not None and position is not None:
+            progress(position())
+        chunk = [r if isinstance(r, dict) else {"value": r} for r in itertools.islice(records, CHUNK_ROWS)]
+
+
+def _jsonl_records(f):
+    for line in f:
+        if line.strip():
+            yield loads(line)
+
+
+def _json_value(path, json_path):
+    if os.path.getsize(path) > JSON_MAX_BYTES:
+        raise QueryError(f"The file is larger than {JSON_MAX_BYTES} bytes; install ijson to stream it, or convert it to JSONL.")
+    with open(path, "rb") as f:
+        value = loads(f.read())
+    return _get(value, json_path) if json_path else value
+
+
+# --- Aggregation ---
+class _Groups:
+    """
+    Per-group partial aggregates, merged chunk by chunk: the row count and,
+    per aggregated column, the count, sum, min and max of its numeric values.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.state = {}
+
+    def add(self, n, keys, values):
+        """
+        ``keys`` are string arrays of the group columns and ``values`` float
+        arrays of the aggregated columns, all of length ``n``.
+        """
+        if not keys:
+            codes, firsts = np.zeros(n, dtype=np.int64), np.array([0] if n else [], dtype=np.int64)
+            size = 1 if n else 0
+        else:
+            combined = np.zeros(n, dtype=np.int64)
+            for column in keys:
+                uniques, inverse = np.unique(column, return_inverse=True)
+                combined = combined * len(uniques) + inverse
+            _, firsts, codes = np.unique(combined, return_index=True, return_inverse=True)
+            size = len(firsts)
+        if size == 0:
+            return
+        counts = np.bincount(codes, minlength=size)
+        partial = {}
+        for column, array in values.items():
+            valid = ~np.isnan(array)
+            valid_codes = codes[valid]
+            mins = np.full(size, np.inf)
+            maxs = np.full(size, -np.inf)
+            np.minimum.at(mins, valid_codes, array[valid])
+            np.maximum.at(maxs, valid_codes, array[valid])
+            partial[column] = (np.bincount(valid_codes, minlength=size), np.bincount(valid_codes, weights=array[valid], minlength=size), mins, maxs)
+        for g in range(size):
+            key = tuple(str(column[firsts[g]]) for column in keys)
+            entry = self.state.get(key)
+            if entry is None:
+                entry = self.state[key] = {"rows": 0, **{c: [0, 0.0, np.inf, -np.inf] for c in self.columns}}
+            entry["rows"] += int(counts[g])
+            for column, (count, total, low, high) in partial.items():
+                agg = entry[column]
+                agg[0] += int(count[g])
+                agg[1] += float(total[g])
+                agg[2] = min(agg[2], float(low[g]))
+                agg[3] = max(agg[3], float(high[g]))
+
+    def rows(self, group_by, aggregations):
+        result = []
+        for key in sorted(self.state):
+            entry = self.state[key]
+            row = [_typed(k) for k in key]
+            for op, column in aggregations:
+                if op == "count":
+                    row.append(entry["rows"] if column is None else entry[column][0])
+                    continue
+                count, total, low, high = entry[column]
+                if count == 0:
+                    row.append(None)
+                elif op == "sum":
+                    row.append(total)
+                elif op == "mean":
+                    row.append(total / count)
+                elif op == "min":
+                    row.append(low)
+                else:
+                    row.append(high)
+            result.append(row)
+        return result
+
+
+# --- Filters ---
+def _mask(values, op, value):
+    if op == "in":
+        if not isinstance(value, list):
+            raise QueryError("The 'in' operator takes a list of values.")
+        if value and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value):
+            return np.isin(_floats(values), np.asarray(value, dtype=float))
+        return np.isin(_strings(values), [_text(v) for v in value])
+    if op == "contains":
+        return np.char.find(_strings(values), _text(value)) >= 0
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        array, value = _floats(values), float(value)
+    else:
+        array, value = _strings(values), _text(value)
+    if op == "==":
+        return array == value
+    if op == "!=":
+        return array != value
+    if op == "<":
+        return array < value
+    if op == "<=":
+        return array <= value
+    if op == ">":
+        return array > value
+    return array >= value
+
+
+# --- Query ---
+def query(path, format=None, columns=None, filters=None, head=None, tail=None, group_by=None, aggregations=None,
+          json_path=None, delimiter=None, progress=None):
+    """
+    Runs a query over a CSV, JSON or JSONL file. ``filters`` are
+    ``(column, op, value)`` triples, all of which must hold; ``aggregations``
+    are ``(op, column)`` pairs, ``column`` being ``None`` for a row count.
+    """
+    progress = progress or (lambda position: None)
+    format = format or FORMATS.get(os.path.splitext(path)[1].lower())
+    if format is None:
+        raise QueryError("Cannot tell the file format from its extension; pass format as csv, json or jsonl.")
+    if head is not None and tail is not None:
+        raise QueryError("Pass either head or tail, not both.")
+    filters = filters or []
+    aggregations = list(aggregations or [])
+    if any(column is None and op != "count" for op, column in aggregations):
+        raise QueryError("Only count can be computed without a column.")
+    grouping = bool(group_by or aggregations)
+    if group_by and not aggregations:
+        aggregations = [("count", None)]
+    aggregated = sorted({c for op, c in aggregations if c is not None})
+    if grouping:
+        output = None
+        needed = list(dict.fromkeys((group_by or []) + aggregated + [f[0] for f in filters]))
+    else:
+        output = columns
+        needed = list(dict.fromkeys(columns + [f[0] for f in filters])) if columns else None
+    # Filter columns are read even when every column is, as they may be dotted paths.
+    extra = [f[0] for f in filters]
+    size = os.path.getsize(path)
+
+    with open(path, "rb") as f:
+        if format == "csv":
+            chunks = _csv_chunks(f, needed, delimiter or ("\t" if path.lower().endswith(".tsv") else ","), progress, extra)
+        elif format == "jsonl":
+            chunks = _record_chunks(_jsonl_records(f), needed, progress, f.tell, extra)
+        elif ijson is not None and (json_path or _starts_with_array(f)):
+            prefix = f"{json_path}.item" if json_path else "item"
+            chunks = _record_chunks(ijson.items(f, prefix, use_float=True), needed, progress, f.tell, extra)
+        else:
+            value = _json_value(path, json_path)
+            if not isinstance(value, list):
+                if filters or grouping or columns:
+                    value = [value]
+                else:
+                    return {"value": value}
+            chunks = _record_chunks(value, needed, extra=extra)
+
+        header = next(chunks, None)
+        if header is None:
+            return {"columns": output or [], "rows": [], "scanned_rows": 0, "matched_rows": 0, "truncated": False}
+        if not grouping and output is None:
+            output = header
+        groups = _Groups(aggregated) if grouping else None
+        rows = deque(maxlen=tail) if tail else []
+        limit = head if head is not None else (None if tail else MAX_ROWS)
+        scanned = matched = 0
+        truncated = False
+        for chunk, n in chunks:
+            scanned += n
+            mask = None
+            for column, op, value in filters:
+                m = _mask(chunk[column], op, value)
+                mask = m if mask is None else mask & m
+            selected = np.arange(n) if mask is None else np.flatnonzero(mask)
+            matched += len(selected)
+            if grouping:
+                keys = [_strings(chunk[c])[selected] for c in group_by or []]
+                values = {c: _floats(chunk[c])[selected] for c in aggregated}
+                groups.add(len(selected), keys, values)
+                continue
+            if limit is not None and len(rows) >= limit:
+                truncated = True
+                if head is not None:
+                    break
+                continue
+            take = selected[-tail:] if tail else selected if limit is None else selected[:limit - len(rows)]
+            typed = _typed if format == "csv" else (lambda v: v)
+            rows.extend([typed(chunk[c][i]) for c in output] for i in take.tolist())
+            if limit is not None and len(take) < len(selected):
+                truncated = True
+                if head is not None:
+                    break
+        progress(size)
+
+    if grouping:
+        names = list(group_by or []) + [op if column is None else f"{op}_{column}" for op, column in aggregations]
+        result_rows = groups.rows(group_by, aggregations)
+        total_groups = len(result_rows)
+        if head is not None:
+            result_rows = result_rows[:head]
+        if tail:
+            result_rows = result_rows[-tail:]
+        if len(result_rows) > MAX_ROWS:
+            result_rows, truncated = result_rows[:MAX_ROWS], True
+        return {"columns": names, "rows": result_rows, "groups": total_groups, "scanned_rows": scanned, "matched_rows": matched, "truncated": truncated or len(result_rows) < total_groups}
+    return {"columns": output, "rows": list(rows), "scanned_rows": scanned, "matched_rows": matched, "truncated": truncated or (tail is not None and matched > len(rows))}
+
+
+def _starts_with_array(f):
+    """
+    Whether a JSON document's root is an array; leaves the file at its start.
+    """
+    head = f.read(4096).lstrip()
+    f.seek(0)
+    return head[:1] == b"[" or head[:4] == b"\xef\xbb\xbf["
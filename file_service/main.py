@@ -1,26 +1,139 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
+import asyncio
+import base64
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-app = FastAPI(title="File Service", version="1.0.0")
+from mcp_common import walk
+from mcp_common.fastjson import JSONResponse, dumps
+from mcp_common.metrics import instrument
+
+app = FastAPI(title="File Service", version="1.0.0", default_response_class=JSONResponse)
+instrument(app)
+
+# Files are read on a bounded pool, so a slow share cannot tie up the event loop or every thread.
+READ_THREADS = int(os.environ.get("FILE_SERVICE_READ_THREADS", "16"))
+# Directories holding more than this many bytes are streamed as a chunked response.
+STREAM_BYTES = int(os.environ.get("FILE_SERVICE_STREAM_BYTES", str(8 * 1024 * 1024)))
+# Small files are read in batches of up to this many bytes per pool task.
+BATCH_BYTES = int(os.environ.get("FILE_SERVICE_BATCH_BYTES", str(256 * 1024)))
+BINARY_SNIFF_BYTES = 8192
+
+_read_pool = ThreadPoolExecutor(max_workers=READ_THREADS, thread_name_prefix="file-read")
 
 class DirectoryRequest(BaseModel):
     path: str
 
+class TreeRequest(BaseModel):
+    path: str
+    max_depth: Optional[int] = None
+    include: Optional[List[str]] = None
+    exclude: Optional[List[str]] = None
+    max_entries: int = walk.MAX_ENTRIES
+
+def read_file(path: str):
+    """
+    Reads a file as text, or as base64 when it is binary: it holds a NUL byte
+    in its first 8 KiB or is not valid UTF-8.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if b"\0" not in data[:BINARY_SNIFF_BYTES]:
+        try:
+            return data.decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+    return {"content": base64.b64encode(data).decode("ascii"), "encoding": "base64"}
+
+def read_batch(batch):
+    results = []
+    for entry in batch:
+        try:
+            results.append((entry.name, read_file(entry.path)))
+        except OSError as e:
+            results.append((entry.name, {"error": str(e)}))
+    return results
+
+def batches(entries):
+    """
+    Groups small files, so that each pool task reads up to ``BATCH_BYTES``
+    instead of paying a thread hand-off per file.
+    """
+    batch, size = [], 0
+    for entry, entry_size in entries:
+        if batch and size + entry_size > BATCH_BYTES:
+            yield batch
+            batch, size = [], 0
+        batch.append(entry)
+        size += entry_size
+    if batch:
+        yield batch
+
+async def read_all(entries):
+    """
+    Yields ``(name, content)`` for each entry in order, reading ahead on the
+    pool so that at most ``READ_THREADS`` batches are in memory beyond the
+    one being sent.
+    """
+    loop = asyncio.get_running_loop()
+    pending = []
+    groups = batches(entries)
+    for batch in groups:
+        pending.append(loop.run_in_executor(_read_pool, read_batch, batch))
+        if len(pending) >= READ_THREADS:
+            break
+    while pending:
+        results = await pending.pop(0)
+        batch = next(groups, None)
+        if batch is not None:
+            pending.append(loop.run_in_executor(_read_pool, read_batch, batch))
+        for name, content in results:
+            yield name, content
+
+def list_files(path: str):
+    entries, size = [], 0
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_file():
+                entry_size = entry.stat().st_size
+                entries.append((entry, entry_size))
+                size += entry_size
+    return entries, size
+
+async def stream_json(entries):
+    yield b"{"
+    first = True
+    async for name, content in read_all(entries):
+        yield (b"" if first else b",") + dumps(name) + b":" + dumps(content)
+        first = False
+    yield b"}"
+
 @app.post("/read_directory")
 async def read_directory(request: DirectoryRequest):
     """
-    Reads all files from a given directory and returns their content.
+    Reads all files from a given directory and returns their content. Text
+    files are returned as strings, binary files as base64 objects.
     """
     path = request.path
     if not os.path.isdir(path):
         raise HTTPException(status_code=400, detail="Invalid directory path")
 
-    file_contents = {}
-    for filename in os.listdir(path):
-        filepath = os.path.join(path, filename)
-        if os.path.isfile(filepath):
-            with open(filepath, "r") as f:
-                file_contents[filename] = f.read()
+    entries, size = await asyncio.to_thread(list_files, path)
+    if size > STREAM_BYTES:
+        return StreamingResponse(stream_json(entries), media_type="application/json")
+    return {name: content async for name, content in read_all(entries)}
 
-    return file_contents
+@app.post("/list_tree")
+async def list_tree(request: TreeRequest):
+    """
+    Lists the files under a directory recursively, with their sizes and
+    modification times but without their content.
+    """
+    if not os.path.isdir(request.path):
+        raise HTTPException(status_code=400, detail="Invalid directory path")
+    if request.max_entries < 1 or (request.max_depth is not None and request.max_depth < 0):
+        raise HTTPException(status_code=400, detail="max_entries must be positive and max_depth not negative")
+    return await asyncio.to_thread(walk.walk, request.path, request.max_depth, request.include, request.exclude, request.max_entries)
@@ -0,0 +1,180 @@
+"""
+Incremental backup of Grafana dashboards to a local, content-addressed store.
+
+Layout of the store directory::
+
+    manifest.json                      uid -> version, content hash, title, folder
+    objects/<h[:2]>/<h>.json.gz        gzip-compressed dashboard JSON, named by its SHA-256
+
+Only dashboards whose version differs from the manifest are downloaded, so
+repeated runs cost one search plus one cheap version lookup per dashboard.
+
+Usage::
+
+    GRAFANA_URL=... GRAFANA_API_TOKEN=... PYTHONPATH=.. python dashboard_sync.py --out ./backups
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+from mcp_common import upstream
+
+SEARCH_PAGE_SIZE = 5000
+
+
+def _search_all(session, grafana_url):
+    dashboards, page = [], 1
+    while True:
+        response = session.get(f"{grafana_url}/api/search", params={"type": "dash-db", "limit": SEARCH_PAGE_SIZE, "page": page})
+        response.raise_for_status()
+        hits = response.json()
+        dashboards.extend(hits)
+        if len(hits) < SEARCH_PAGE_SIZE:
+            return dashboards
+        page += 1
+
+
+def _latest_version(session, grafana_url, uid):
+    response = session.get(f"{grafana_url}/api/dashboards/uid/{uid}/versions", params={"limit": 1})
+    response.raise_for_status()
+    body = response.json()
+    versions = body.get("versions", []) if isinstance(body, dict) else body
+    return versions[0]["version"] if versions else None
+
+
+def _load_manifest(store_dir):
+    try:
+        with open(os.path.join(store_dir, "manifest.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"dashboards": {}}
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Unique per process and thread, so concurrent syncs never share a temp file.
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _store_object(store_dir, dashboard):
+    content = json.dumps(dashboard, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    digest = hashlib.sha256(content).hexdigest()
+    path = os.path.join(store_dir, "objects", digest[:2], f"{digest}.json.gz")
+    if not os.path.exists(path):
+        _write_atomic(path, gzip.compress(content, mtime=0))
+    return digest
+
+
+def load_dashboard(store_dir, digest):
+    """
+    Reads a stored dashboard back from its content hash.
+    """
+    with gzip.open(os.path.join(store_dir, "objects", digest[:2], f"{digest}.json.gz")) as f:
+        return json.load(f)
+
+
+def sync_dashboards(grafana_url, headers, store_dir, max_workers=16, full=False, progress=None):
+    """
+    Brings the local store up to date with Grafana and returns a summary of what changed.
+    ``progress`` is called as ``progress(done, total, message)`` while dashboards are fetched.
+    """
+    started = time.monotonic()
+    session = upstream.UpstreamSession(pool_size=max_workers)
+    session.headers.update(headers)
+
+    manifest = _load_manifest(store_dir)
+    known = manifest["dashboards"]
+    hits = {hit["uid"]: hit for hit in _search_all(session, grafana_url)}
+
+    def is_changed(uid):
+        entry = known.get(uid)
+        if full or entry is None:
+            return True
+        try:
+            return _latest_version(session, grafana_url, uid) != entry.get("version")
+        except requests.exceptions.RequestException:
+            return True
+
+    def fetch(uid):
+        response = session.get(f"{grafana_url}/api/dashboards/uid/{uid}")
+        response.raise_for_status()
+        body = response.json()
+        digest = _store_object(store_dir, body["dashboard"])
+        meta = body.get("meta", {})
+        return {
+            "version": body["dashboard"].get("version", meta.get("version")),
+            "sha256": digest,
+            "title": body["dashboard"].get("title"),
+            "folder": meta.get("folderTitle", hits[uid].get("folderTitle")),
+            "synced_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+    fetched, errors = [], {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        changed = [uid for uid, flag in zip(hits, executor.map(is_changed, hits)) if flag]
+        futures = {uid: executor.submit(fetch, uid) for uid in changed}
+        for done, (uid, future) in enumerate(futures.items(), start=1):
+            try:
+                known[uid] = future.result()
+                fetched.append(uid)
+            except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+                errors[uid] = str(e)
+            if progress:
+                progress(done, len(changed), f"Fetched {done} of {len(changed)} changed dashboards")
+
+    removed = [uid for uid in known if uid not in hits]
+    for uid in removed:
+        del known[uid]
+
+    manifest["synced_at"] = datetime.now(timezone.utc).isoformat()
+    _write_atomic(os.path.join(store_dir, "manifest.json"), json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+
+    return {
+        "total": len(hits),
+        "fetched": fetched,
+        "unchanged": len(hits) - len(changed),
+        "removed": removed,
+        "errors": errors,
+        "store_dir": store_dir,
+        "elapsed_seconds": round(time.monotonic() - started, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Back up Grafana dashboards to a local content-addressed store.")
+    parser.add_argument("--out", default=os.environ.get("GRAFANA_BACKUP_DIR", "dashboard_backups"), help="The store directory.")
+    parser.add_argument("--workers", type=int, default=16, help="The number of concurrent requests.")
+    parser.add_argument("--full", action="store_true", help="Fetch every dashboard, even if its version is unchanged.")
+    cli_args = parser.parse_args()
+
+    grafana_url = os.environ.get("GRAFANA_URL")
+    api_token = os.environ.get("GRAFANA_API_TOKEN")
+    if not grafana_url or not api_token:
+        raise SystemExit("GRAFANA_URL and GRAFANA_API_TOKEN must be set.")
+
+    summary = sync_dashboards(
+        grafana_url,
+        {"Authorization": f"Bearer {api_token}", "x-grafana-org-id": "1"},
+        cli_args.out,
+        max_workers=cli_args.workers,
+        full=cli_args.full,
+    )
+    print(json.dumps(summary, indent=2))
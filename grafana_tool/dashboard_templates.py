@@ -0,0 +1,216 @@
+"""
+Expands a compact dashboard spec into a full Grafana dashboard model.
+
+A spec names a few panel templates and says what to repeat them over::
+
+    {
+        "title": "Zabbix Host Groups Overview",
+        "datasource": "alexanderzobnin-zabbix-datasource",
+        "templates": {
+            "cpu": {
+                "title": "${group} CPU Usage",
+                "type": "graph",
+                "targets": [{"group": {"filter": "${group}"}, "host": {"filter": "*"},
+                             "application": {"filter": "CPU"}, "item": {"filter": "CPU utilization"}}]
+            }
+        },
+        "panels": [
+            {"template": "cpu", "repeat": {"group": ["Linux Servers", "Windows Servers"]}}
+        ],
+        "layout": {"width": 4, "height": 8, "row_by": "group"}
+    }
+
+``${name}`` placeholders are filled from the ``repeat`` lists (every
+combination is generated) and from ``vars``. Other ``$`` expressions, such as
+Grafana's own ``$__interval``, are left untouched. Panels are then placed on
+the 24-column grid by a skyline packer, so no ``gridPos`` is needed.
+"""
+import itertools
+import json
+import re
+from functools import lru_cache
+
+GRID_COLUMNS = 24
+MAX_PANELS = 5000
+PASSTHROUGH_KEYS = ("title", "uid", "tags", "time", "refresh", "timezone", "templating", "annotations", "links", "editable")
+
+_PLACEHOLDER = re.compile(r"\$\{(\w+)\}")
+
+
+# --- Template compiler ---
+def _compile_string(value):
+    parts = _PLACEHOLDER.split(value)
+    if len(parts) == 1:
+        return lambda variables: value
+    if len(parts) == 3 and parts[0] == "" and parts[2] == "":
+        name = parts[1]
+        # A string that is exactly one placeholder takes the variable's own type.
+        return lambda variables: variables.get(name, value)
+
+    def render(variables):
+        out = []
+        for i, part in enumerate(parts):
+            if i % 2 == 0:
+                out.append(part)
+            elif part in variables:
+                out.append(str(variables[part]))
+            else:
+                out.append("${" + part + "}")
+        return "".join(out)
+    return render
+
+
+def _compile_node(node):
+    if isinstance(node, dict):
+        items = [(key, _compile_node(value)) for key, value in node.items()]
+        return lambda variables: {key: render(variables) for key, render in items}
+    if isinstance(node, list):
+        renders = [_compile_node(value) for value in node]
+        return lambda variables: [render(variables) for render in renders]
+    if isinstance(node, str):
+        return _compile_string(node)
+    return lambda variables: node
+
+
+@lru_cache(maxsize=256)
+def _compile_cached(canonical):
+    return _compile_node(json.loads(canonical))
+
+
+def compile_template(template):
+    """
+    Compiles a panel template into a function that renders it for a set of
+    variables. Compiled templates are cached by their canonical JSON.
+    """
+    return _compile_cached(json.dumps(template, sort_keys=True, separators=(",", ":")))
+
+
+# --- Layout ---
+class SkylinePacker:
+    """
+    Places panels on a fixed-width grid. Each panel goes to the left-most
+    position where its top edge is lowest, which keeps the dashboard compact
+    while roughly preserving the panel order.
+    """
+
+    def __init__(self, columns=GRID_COLUMNS):
+        self.columns = columns
+        self.heights = [0] * columns
+
+    @property
+    def bottom(self):
+        return max(self.heights)
+
+    def place(self, w, h):
+        w = max(1, min(w, self.columns))
+        best_x, best_y = 0, None
+        for x in range(self.columns - w + 1):
+            y = max(self.heights[x:x + w])
+            if best_y is None or y < best_y:
+                best_x, best_y = x, y
+        for x in range(best_x, best_x + w):
+            self.heights[x] = best_y + h
+        return {"x": best_x, "y": best_y, "w": w, "h": h}
+
+    def new_row(self, h=0):
+        y = self.bottom
+        self.heights = [y + h] * self.columns
+        return y
+
+
+# --- Expansion ---
+def _combinations(repeat):
+    if not repeat:
+        return [{}]
+    names = list(repeat)
+    values = []
+    for name in names:
+        options = repeat[name]
+        if not isinstance(options, list):
+            options = [options]
+        values.append(options)
+    return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+
+
+def _mapping(value, what):
+    if not isinstance(value, dict):
+        raise ValueError(f"{what} must be an object, not {type(value).__name__}.")
+    return value
+
+
+def expand_spec(spec):
+    """
+    Expands a compact spec into a Grafana dashboard model. Raises ``ValueError``
+    when the spec is invalid.
+    """
+    _mapping(spec, "The spec")
+    templates = _mapping(spec.get("templates", {}), "`templates`")
+    entries = spec.get("panels")
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("The spec must contain a non-empty `panels` list.")
+
+    layout = _mapping(spec.get("layout", {}), "`layout`")
+    columns = int(layout.get("columns", GRID_COLUMNS))
+    default_w = int(layout.get("width", 6))
+    default_h = int(layout.get("height", 8))
+    row_by = layout.get("row_by")
+    global_vars = _mapping(spec.get("vars", {}), "`vars`")
+    datasource = spec.get("datasource")
+
+    rendered = []
+    for index, entry in enumerate(entries):
+        _mapping(entry, f"Panel entry {index}")
+        if "template" in entry:
+            name = entry["template"]
+            if not isinstance(name, str) or name not in templates:
+                raise ValueError(f"Panel entry {index} uses unknown template `{name}`.")
+            template = {**_mapping(templates[name], f"Template `{name}`"), **_mapping(entry.get("override", {}), f"The `override` of panel entry {index}")}
+        elif "panel" in entry:
+            template = entry["panel"]
+        else:
+            raise ValueError(f"Panel entry {index} needs a `template` or a `panel`.")
+        render = compile_template(template)
+        entry_vars = _mapping(entry.get("vars", {}), f"The `vars` of panel entry {index}")
+        repeat = entry.get("repeat")
+        if repeat is not None:
+            _mapping(repeat, f"The `repeat` of panel entry {index}")
+
+        for combo in _combinations(repeat):
+            if len(rendered) >= MAX_PANELS:
+                raise ValueError(f"The spec expands to more than {MAX_PANELS} panels.")
+            variables = {**global_vars, **entry_vars, **combo}
+            panel = _mapping(render(variables), f"The panel of entry {index}")
+            size = _mapping(panel.pop("size", {}), f"The `size` of panel entry {index}")
+            w = int(size.get("w", entry.get("w", default_w)))
+            h = int(size.get("h", entry.get("h", default_h)))
+            if datasource is not None:
+                panel.setdefault("datasource", datasource)
+            rendered.append((variables.get(row_by) if row_by else None, panel, w, h))
+
+    # Group panels under one row per `row_by` value, in order of first appearance.
+    rows = {}
+    for row_key, panel, w, h in rendered:
+        rows.setdefault(row_key, []).append((panel, w, h))
+
+    packer = SkylinePacker(columns)
+    panels = []
+    for row_key, members in rows.items():
+        if row_by:
+            panels.append({
+                "id": len(panels) + 1,
+                "type": "row",
+                "title": str(row_key),
+                "collapsed": False,
+                "gridPos": {"x": 0, "y": packer.new_row(1), "w": columns, "h": 1},
+                "panels": [],
+            })
+        for panel, w, h in members:
+            panel["id"] = len(panels) + 1
+            panel["gridPos"] = packer.place(w, h)
+            panels.append(panel)
+
+    dashboard = {key: spec[key] for key in PASSTHROUGH_KEYS if key in spec}
+    dashboard.setdefault("title", "Generated Dashboard")
+    dashboard["panels"] = panels
+    dashboard.setdefault("schemaVersion", 16)
+    return dashboard
@@ -1,15 +1,41 @@
+from contextlib import asynccontextmanager
+from typing import List, Optional, Union
 from fastapi import FastAPI, APIRouter, Request
-from starlette.responses import JSONResponse
+from starlette.responses import StreamingResponse
 from pydantic import BaseModel, Field
 import requests
 import os
 import json
 from pyzabbix import ZabbixAPI
 
+from mcp_common import upstream
+from mcp_common.cache import tool_cache
+from mcp_common.fastjson import JSONResponse, RawJSON, dumps, passthrough, read_json
+from mcp_common.jobs import JOB_FUNCTIONS, JOB_TOOLS, JobArgs, long_running
+from mcp_common.metrics import instrument
+from mcp_common.results import RESULTS_NEXT_TOOL, ResultsNextArgs, results_next
+from mcp_common.streaming import call_tool, report_progress
+
+from dashboard_sync import sync_dashboards
+from dashboard_templates import expand_spec
+from query_preview import TTLCache, preview_targets
+from zabbix_events import ZabbixProblemFeed
+
+# --- Upstream Limits ---
+upstream.limit(os.environ.get("GRAFANA_URL", ""), concurrency=16)
+upstream.limit(os.environ.get("ZABBIX_URL", ""), concurrency=8)
+# Data source queries are read-only POSTs and may take long; so are the Zabbix API calls made here.
+upstream.policy(os.environ.get("GRAFANA_URL", ""), read_timeout=30, endpoints={"/api/ds/query": {"read_timeout": 120, "idempotent": True}})
+upstream.policy(os.environ.get("ZABBIX_URL", ""), read_timeout=60, idempotent=True)
+
 # --- Pydantic Schemas ---
 class CreateDashboardArgs(BaseModel):
     dashboard_json: dict = Field(..., description="The JSON definition of the Grafana dashboard.")
 
+class CreateDashboardFromSpecArgs(BaseModel):
+    spec: dict = Field(..., description="A compact dashboard spec: `templates` (panel templates with ${var} placeholders), `panels` (entries naming a template with `repeat` lists and `vars`), and optional `layout` (`width`, `height`, `columns`, `row_by`), `datasource` and `title`.")
+    dry_run: bool = Field(False, description="Optional: Only expand the spec and return the dashboard JSON without creating it.")
+
 class DeleteDashboardArgs(BaseModel):
     uid: str = Field(..., description="The UID of the dashboard to delete.")
 
@@ -34,10 +60,40 @@ class CheckZabbixQueryArgs(BaseModel):
     host: str = Field(..., description="The host to execute the query on.")
     group: str = Field(..., description="The group to execute the query on.")
 
+class SyncDashboardsArgs(BaseModel):
+    full: bool = Field(False, description="Optional: Fetch every dashboard, even if its version has not changed since the last sync.")
+
 class GetZabbixDataArgs(BaseModel):
     pass
 
+class GetZabbixProblemsArgs(BaseModel):
+    host: Optional[str] = Field(None, description="Optional: Only return problems on this host.")
+    min_severity: int = Field(0, ge=0, le=5, description="Optional: Minimum trigger severity (0 = not classified, 5 = disaster).")
+    limit: int = Field(100, ge=1, description="Optional: Maximum number of problems to return, newest first.")
+
+class PreviewPanelQueryArgs(BaseModel):
+    targets: List[dict] = Field(..., description="The panel targets (queries) to run, as they appear in the panel's `targets` list.")
+    datasource: Optional[Union[dict, str]] = Field(None, description="Optional: The datasource for targets that do not set one, e.g. {\"uid\": \"abc123\"}.")
+    time_from: str = Field("now-6h", description="Optional: Start of the time range, e.g. `now-6h` or an epoch in milliseconds.")
+    time_to: str = Field("now", description="Optional: End of the time range.")
+    max_points: int = Field(500, ge=3, description="Optional: Maximum number of points returned per series. Larger frames are downsampled.")
+
 # --- Tool Implementation ---
+def tool_error(result):
+    """
+    Grafana tools report failures as a dict with an `error` key.
+    """
+    if isinstance(result, dict) and "error" in result:
+        return result["error"]
+    return None
+
+def is_cacheable(result):
+    """
+    Only successful API responses are cached; errors are strings or carry an `error` key.
+    """
+    return isinstance(result, (dict, list, RawJSON)) and not (isinstance(result, dict) and ("error" in result or result.get("success") is False))
+
+@tool_cache.invalidates("dashboards")
 def create_grafana_dashboard(args: CreateDashboardArgs):
     """
     Creates a new Grafana dashboard from a JSON definition.
@@ -61,12 +117,36 @@ def create_grafana_dashboard(args: CreateDashboardArgs):
     }
 
     try:
-        response = requests.post(f"{grafana_url}/api/dashboards/db", headers=headers, data=json.dumps(payload))
+        response = upstream.post(f"{grafana_url}/api/dashboards/db", headers=headers, data=dumps(payload))
         response.raise_for_status()
-        return response.json()
+        return passthrough(response)
     except requests.exceptions.RequestException as e:
         return {"error": f"An error occurred: {e}"}
 
+@long_running
+def create_grafana_dashboard_from_spec(args: CreateDashboardFromSpecArgs):
+    """
+    Expands a compact dashboard spec into a full Grafana dashboard and creates it.
+    """
+    try:
+        dashboard = expand_spec(args.spec)
+    except (ValueError, TypeError) as e:
+        return {"error": f"Invalid dashboard spec: {e}"}
+
+    panel_count = sum(1 for panel in dashboard["panels"] if panel.get("type") != "row")
+    if args.dry_run:
+        return {"panel_count": panel_count, "dashboard": dashboard}
+
+    report_progress(1, 2, f"Expanded the spec into {panel_count} panels; creating the dashboard")
+
+    result = create_grafana_dashboard(CreateDashboardArgs(dashboard_json=dashboard))
+    if isinstance(result, RawJSON):
+        result = result.loads()
+    if isinstance(result, dict) and "error" not in result:
+        result["panel_count"] = panel_count
+    return result
+
+@tool_cache.invalidates("dashboards")
 def delete_grafana_dashboard(args: DeleteDashboardArgs):
     """
     Deletes a Grafana dashboard.
@@ -84,12 +164,13 @@ def delete_grafana_dashboard(args: DeleteDashboardArgs):
     }
 
     try:
-        response = requests.delete(f"{grafana_url}/api/dashboards/uid/{args.uid}", headers=headers)
+        response = upstream.delete(f"{grafana_url}/api/dashboards/uid/{args.uid}", headers=headers)
         response.raise_for_status()
-        return response.json()
+        return passthrough(response)
     except requests.exceptions.RequestException as e:
         return f"An error occurred: {e}"
 
+@tool_cache.cached(ttl=60, groups=("dashboards",), cache_if=is_cacheable)
 def search_grafana_dashboards(args: SearchDashboardsArgs):
     """
     Searches for Grafana dashboards by title or other metadata.
@@ -107,12 +188,13 @@ def search_grafana_dashboards(args: SearchDashboardsArgs):
     }
 
     try:
-        response = requests.get(f"{grafana_url}/api/search?query={args.query}", headers=headers)
+        response = upstream.get(f"{grafana_url}/api/search?query={args.query}", headers=headers)
         response.raise_for_status()
-        return response.json()
+        return passthrough(response)
     except requests.exceptions.RequestException as e:
         return f"An error occurred: {e}"
 
+@tool_cache.cached(ttl=60, groups=("dashboards",), cache_if=is_cacheable)
 def get_grafana_dashboard_by_uid(args: GetDashboardByUidArgs):
     """
     Retrieves a Grafana dashboard by its UID.
@@ -130,12 +212,13 @@ def get_grafana_dashboard_by_uid(args: GetDashboardByUidArgs):
     }
 
     try:
-        response = requests.get(f"{grafana_url}/api/dashboards/uid/{args.uid}", headers=headers)
+        response = upstream.get(f"{grafana_url}/api/dashboards/uid/{args.uid}", headers=headers)
         response.raise_for_status()
-        return response.json()
+        return passthrough(response)
     except requests.exceptions.RequestException as e:
         return f"An error occurred: {e}"
 
+@tool_cache.cached(ttl=300, groups=("teams",), cache_if=is_cacheable)
 def list_grafana_teams(args: ListTeamsArgs):
     """
     Lists all teams in Grafana.
@@ -159,12 +242,13 @@ def list_grafana_teams(args: ListTeamsArgs):
     }
 
     try:
-        response = requests.get(f"{grafana_url}/api/teams/search", headers=headers, params=params)
+        response = upstream.get(f"{grafana_url}/api/teams/search", headers=headers, params=params)
         response.raise_for_status()
-        return response.json()
+        return passthrough(response)
     except requests.exceptions.RequestException as e:
         return f"An error occurred: {e}"
 
+@tool_cache.cached(ttl=300, groups=("users",), cache_if=is_cacheable)
 def list_grafana_users(args: ListUsersArgs):
     """
     Lists all users in a Grafana organization.
@@ -188,12 +272,37 @@ def list_grafana_users(args: ListUsersArgs):
     }
 
     try:
-        response = requests.get(f"{grafana_url}/api/users", headers=headers, params=params)
+        response = upstream.get(f"{grafana_url}/api/users", headers=headers, params=params)
         response.raise_for_status()
-        return response.json()
+        return passthrough(response)
     except requests.exceptions.RequestException as e:
         return f"An error occurred: {e}"
 
+@long_running
+def sync_grafana_dashboards(args: SyncDashboardsArgs):
+    """
+    Backs up all Grafana dashboards to the local store, fetching only the ones that changed.
+    """
+    grafana_url = os.environ.get("GRAFANA_URL")
+    api_token = os.environ.get("GRAFANA_API_TOKEN")
+
+    if not grafana_url or not api_token:
+        return {"error": "Grafana URL or API token is not configured."}
+
+    headers = {
+        "Authorization": f"Bearer {api_token}",
+        "Content-Type": "application/json",
+        "x-grafana-org-id": "1"
+    }
+
+    store_dir = os.environ.get("GRAFANA_BACKUP_DIR", "dashboard_backups")
+    try:
+        return sync_dashboards(grafana_url, headers, store_dir, full=args.full, progress=report_progress)
+    except requests.exceptions.RequestException as e:
+        return {"error": f"An error occurred: {e}"}
+    except OSError as e:
+        return {"error": f"Could not write to the backup directory: {e}"}
+
 def check_zabbix_query(args: CheckZabbixQueryArgs):
     """
     Lists all users in a Grafana organization.
@@ -217,9 +326,9 @@ def check_zabbix_query(args: CheckZabbixQueryArgs):
     }
 
     try:
-        response = requests.get(f"{grafana_url}/api/users", headers=headers, params=params)
+        response = upstream.get(f"{grafana_url}/api/users", headers=headers, params=params)
         response.raise_for_status()
-        return response.json()
+        return passthrough(response)
     except requests.exceptions.RequestException as e:
         return f"An error occurred: {e}"
 
@@ -245,9 +354,9 @@ def check_zabbix_query(args: CheckZabbixQueryArgs):
     }
 
     try:
-        response = requests.get(f"{grafana_url}/api/teams/search", headers=headers, params=params)
+        response = upstream.get(f"{grafana_url}/api/teams/search", headers=headers, params=params)
         response.raise_for_status()
-        return response.json()
+        return passthrough(response)
     except requests.exceptions.RequestException as e:
         return f"An error occurred: {e}"
 
@@ -267,9 +376,9 @@ def check_zabbix_query(args: CheckZabbixQueryArgs):
     }
 
     try:
-        response = requests.get(f"{grafana_url}/api/dashboards/uid/{args.uid}", headers=headers)
+        response = upstream.get(f"{grafana_url}/api/dashboards/uid/{args.uid}", headers=headers)
         response.raise_for_status()
-        return response.json()
+        return passthrough(response)
     except requests.exceptions.RequestException as e:
         return f"An error occurred: {e}"
 
@@ -289,12 +398,26 @@ def check_zabbix_query(args: CheckZabbixQueryArgs):
     }
 
     try:
-        response = requests.delete(f"{grafana_url}/api/dashboards/uid/{args.uid}", headers=headers)
+        response = upstream.delete(f"{grafana_url}/api/dashboards/uid/{args.uid}", headers=headers)
         response.raise_for_status()
-        return response.json()
+        return passthrough(response)
     except requests.exceptions.RequestException as e:
         return f"An error occurred: {e}"
 
+def substitute_variables(value, replacements):
+    """
+    Replaces template variables in every string of a JSON-like structure.
+    """
+    if isinstance(value, str):
+        for name, replacement in replacements.items():
+            value = value.replace(name, replacement)
+        return value
+    if isinstance(value, dict):
+        return {substitute_variables(k, replacements): substitute_variables(v, replacements) for k, v in value.items()}
+    if isinstance(value, list):
+        return [substitute_variables(v, replacements) for v in value]
+    return value
+
 def check_zabbix_query(args: CheckZabbixQueryArgs):
     """
     Checks if a Zabbix query is valid.
@@ -307,14 +430,11 @@ def check_zabbix_query(args: CheckZabbixQueryArgs):
         return {"success": False, "error_message": "Zabbix credentials are not configured."}
 
     try:
-        zapi = ZabbixAPI(zabbix_url)
+        zapi = ZabbixAPI(zabbix_url, session=upstream.new_session())
         zapi.login(zabbix_user, zabbix_password)
         
         # Replace template variables
-        query_str = json.dumps(args.query)
-        query_str = query_str.replace("$Group", args.group)
-        query_str = query_str.replace("$Host", args.host)
-        query = json.loads(query_str)
+        query = substitute_variables(args.query, {"$Group": args.group, "$Host": args.host})
 
         items = zapi.item.get(groupids=zapi.hostgroup.get(filter={"name": [args.group]})[0]["groupid"], hostids=zapi.host.get(filter={"host": [args.host]})[0]["hostid"], filter={"name": query["item"]["filter"]}, output=["name"])
         if items:
@@ -325,6 +445,7 @@ def check_zabbix_query(args: CheckZabbixQueryArgs):
         return {"success": False, "error_message": str(e)}
 
 
+@tool_cache.cached(ttl=300, groups=("zabbix",), cache_if=is_cacheable)
 def get_zabbix_data(args: GetZabbixDataArgs):
     """
     Gets a list of host groups and hosts from Zabbix.
@@ -337,7 +458,7 @@ def get_zabbix_data(args: GetZabbixDataArgs):
         return {"success": False, "error_message": "Zabbix credentials are not configured."}
 
     try:
-        zapi = ZabbixAPI(zabbix_url)
+        zapi = ZabbixAPI(zabbix_url, session=upstream.new_session())
         zapi.login(zabbix_user, zabbix_password)
         host_groups = [group["name"] for group in zapi.hostgroup.get(output=["name"])]
         hosts = [host["host"] for host in zapi.host.get(output=["host"])]
@@ -346,12 +467,66 @@ def get_zabbix_data(args: GetZabbixDataArgs):
         return {"success": False, "error_message": str(e)}
 
 
+query_cache = TTLCache(ttl=float(os.environ.get("GRAFANA_QUERY_CACHE_TTL", "30")))
+
+def preview_grafana_panel_query(args: PreviewPanelQueryArgs):
+    """
+    Runs panel targets through the Grafana datasource query API and returns the resulting data frames.
+    """
+    grafana_url = os.environ.get("GRAFANA_URL")
+    api_token = os.environ.get("GRAFANA_API_TOKEN")
+
+    if not grafana_url or not api_token:
+        return {"error": "Grafana URL or API token is not configured."}
+
+    headers = {
+        "Authorization": f"Bearer {api_token}",
+        "Content-Type": "application/json",
+        "x-grafana-org-id": "1"
+    }
+
+    return preview_targets(grafana_url, headers, args.targets, args.datasource, args.time_from, args.time_to, args.max_points, query_cache)
+
+problem_feed = None
+
+def start_problem_feed():
+    """
+    Starts the background Zabbix problem poller when Zabbix is configured.
+    """
+    global problem_feed
+    zabbix_url = os.environ.get("ZABBIX_URL")
+    zabbix_user = os.environ.get("ZABBIX_USER")
+    zabbix_password = os.environ.get("ZABBIX_PASSWORD")
+    interval = float(os.environ.get("ZABBIX_EVENT_POLL_INTERVAL", "30"))
+
+    if not zabbix_url or not zabbix_user or not zabbix_password or interval <= 0:
+        return None
+
+    problem_feed = ZabbixProblemFeed(
+        zabbix_url, zabbix_user, zabbix_password,
+        interval=interval,
+        capacity=int(os.environ.get("ZABBIX_EVENT_BUFFER_SIZE", "5000")),
+    )
+    problem_feed.start()
+    return problem_feed
+
+def get_zabbix_problems(args: GetZabbixProblemsArgs):
+    """
+    Gets the currently active Zabbix problems from the background problem feed.
+    """
+    if problem_feed is None:
+        return {"success": False, "error_message": "The Zabbix problem feed is not running."}
+
+    result = problem_feed.query(host=args.host, min_severity=args.min_severity, limit=args.limit)
+    return {"success": True, **result}
+
+
 # --- MCP Router ---
 router = APIRouter()
 
 @router.post("/mcp")
 async def mcp_handler(request: Request):
-    body = await request.json()
+    body = await read_json(request)
     method = body.get("method")
     id = body.get("id")
 
@@ -369,6 +544,13 @@ async def mcp_handler(request: Request):
                 "inputSchema": CreateDashboardArgs.model_json_schema(),
                 "outputSchema": {"type": "object"}
             },
+            {
+                "name": "create_grafana_dashboard_from_spec",
+                "title": "Create Grafana Dashboard from Spec",
+                "description": "Creates a Grafana dashboard from a compact spec. Panel templates are repeated over lists of host groups, hosts or items, and the panels are laid out automatically. Prefer this over `create_grafana_dashboard` for dashboards with many similar panels.",
+                "inputSchema": CreateDashboardFromSpecArgs.model_json_schema(),
+                "outputSchema": {"type": "object"}
+            },
             {
                 "name": "delete_grafana_dashboard",
                 "title": "Delete Grafana Dashboard",
@@ -404,6 +586,20 @@ async def mcp_handler(request: Request):
                 "inputSchema": ListUsersArgs.model_json_schema(),
                 "outputSchema": {"type": "object"}
             },
+            {
+                "name": "sync_grafana_dashboards",
+                "title": "Sync Grafana Dashboards",
+                "description": "Backs up all Grafana dashboards to the server's local store. Only dashboards whose version changed since the last sync are downloaded.",
+                "inputSchema": SyncDashboardsArgs.model_json_schema(),
+                "outputSchema": {"type": "object"}
+            },
+            {
+                "name": "preview_grafana_panel_query",
+                "title": "Preview Grafana Panel Query",
+                "description": "Runs panel targets through the Grafana datasource query API for a time range and returns the data frames, downsampled to `max_points` per series. Use it to check what a panel will show before creating the dashboard.",
+                "inputSchema": PreviewPanelQueryArgs.model_json_schema(),
+                "outputSchema": {"type": "object"}
+            },
             {
                 "name": "check_zabbix_query",
                 "title": "Check Zabbix Query",
@@ -417,7 +613,16 @@ async def mcp_handler(request: Request):
                 "description": "Gets a list of host groups and hosts from Zabbix.",
                 "inputSchema": GetZabbixDataArgs.model_json_schema(),
                 "outputSchema": {"type": "object"}
-            }
+            },
+            {
+                "name": "get_zabbix_problems",
+                "title": "Get Zabbix Problems",
+                "description": "Gets the currently active Zabbix problems, optionally filtered by host and minimum severity. Served from a continuously updated feed, so it is cheap to call often.",
+                "inputSchema": GetZabbixProblemsArgs.model_json_schema(),
+                "outputSchema": {"type": "object"}
+            },
+            RESULTS_NEXT_TOOL,
+            *JOB_TOOLS
         ]
         return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": {"tools": tools}})
     elif method == "tools/call":
@@ -426,52 +631,46 @@ async def mcp_handler(request: Request):
         try:
             if tool_name == "create_grafana_dashboard":
                 args = CreateDashboardArgs(**tool_args)
-                result = create_grafana_dashboard(args)
-                if isinstance(result, dict) and "error" in result:
-                    return JSONResponse(content={"jsonrpc": "2.0", "id": id, "error": {"code": -32000, "message": result["error"]}})
-                return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+                return await call_tool(request, id, body["params"], create_grafana_dashboard, args, error_of=tool_error)
+            elif tool_name == "create_grafana_dashboard_from_spec":
+                args = CreateDashboardFromSpecArgs(**tool_args)
+                return await call_tool(request, id, body["params"], create_grafana_dashboard_from_spec, args, error_of=tool_error)
             elif tool_name == "delete_grafana_dashboard":
                 args = DeleteDashboardArgs(**tool_args)
-                result = delete_grafana_dashboard(args)
-                if isinstance(result, dict) and "error" in result:
-                    return JSONResponse(content={"jsonrpc": "2.0", "id": id, "error": {"code": -32000, "message": result["error"]}})
-                return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+                return await call_tool(request, id, body["params"], delete_grafana_dashboard, args, error_of=tool_error)
             elif tool_name == "search_grafana_dashboards":
                 args = SearchDashboardsArgs(**tool_args)
-                result = search_grafana_dashboards(args)
-                if isinstance(result, dict) and "error" in result:
-                    return JSONResponse(content={"jsonrpc": "2.0", "id": id, "error": {"code": -32000, "message": result["error"]}})
-                return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+                return await call_tool(request, id, body["params"], search_grafana_dashboards, args, error_of=tool_error)
             elif tool_name == "get_grafana_dashboard_by_uid":
                 args = GetDashboardByUidArgs(**tool_args)
-                result = get_grafana_dashboard_by_uid(args)
-                if isinstance(result, dict) and "error" in result:
-                    return JSONResponse(content={"jsonrpc": "2.0", "id": id, "error": {"code": -32000, "message": result["error"]}})
-                return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+                return await call_tool(request, id, body["params"], get_grafana_dashboard_by_uid, args, error_of=tool_error)
             elif tool_name == "list_grafana_teams":
                 args = ListTeamsArgs(**tool_args)
-                result = list_grafana_teams(args)
-                if isinstance(result, dict) and "error" in result:
-                    return JSONResponse(content={"jsonrpc": "2.0", "id": id, "error": {"code": -32000, "message": result["error"]}})
-                return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+                return await call_tool(request, id, body["params"], list_grafana_teams, args, error_of=tool_error)
             elif tool_name == "list_grafana_users":
                 args = ListUsersArgs(**tool_args)
-                result = list_grafana_users(args)
-                if isinstance(result, dict) and "error" in result:
-                    return JSONResponse(content={"jsonrpc": "2.0", "id": id, "error": {"code": -32000, "message": result["error"]}})
-                return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+                return await call_tool(request, id, body["params"], list_grafana_users, args, error_of=tool_error)
+            elif tool_name == "sync_grafana_dashboards":
+                args = SyncDashboardsArgs(**tool_args)
+                return await call_tool(request, id, body["params"], sync_grafana_dashboards, args, error_of=tool_error)
+            elif tool_name == "preview_grafana_panel_query":
+                args = PreviewPanelQueryArgs(**tool_args)
+                return await call_tool(request, id, body["params"], preview_grafana_panel_query, args, error_of=tool_error)
             elif tool_name == "check_zabbix_query":
                 args = CheckZabbixQueryArgs(**tool_args)
-                result = check_zabbix_query(args)
-                if isinstance(result, dict) and "error" in result:
-                    return JSONResponse(content={"jsonrpc": "2.0", "id": id, "error": {"code": -32000, "message": result["error"]}})
-                return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+                return await call_tool(request, id, body["params"], check_zabbix_query, args, error_of=tool_error)
             elif tool_name == "get_zabbix_data":
                 args = GetZabbixDataArgs(**tool_args)
-                result = get_zabbix_data(args)
-                if isinstance(result, dict) and "error" in result:
-                    return JSONResponse(content={"jsonrpc": "2.0", "id": id, "error": {"code": -32000, "message": result["error"]}})
-                return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+                return await call_tool(request, id, body["params"], get_zabbix_data, args, error_of=tool_error)
+            elif tool_name == "get_zabbix_problems":
+                args = GetZabbixProblemsArgs(**tool_args)
+                return await call_tool(request, id, body["params"], get_zabbix_problems, args, error_of=tool_error)
+            elif tool_name == "results_next":
+                args = ResultsNextArgs(**tool_args)
+                return await call_tool(request, id, body["params"], results_next, args, error_of=tool_error)
+            elif tool_name in JOB_FUNCTIONS:
+                args = JobArgs(**tool_args)
+                return await call_tool(request, id, body["params"], JOB_FUNCTIONS[tool_name], args, error_of=tool_error)
             else:
                 return JSONResponse(content={"jsonrpc": "2.0", "id": id, "error": {"code": -32601, "message": "Method not found"}}, status_code=404)
         except Exception as e:
@@ -481,6 +680,43 @@ async def mcp_handler(request: Request):
     else:
         return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": None})
 
+@router.get("/zabbix/problems/stream")
+async def zabbix_problem_stream(request: Request, host: Optional[str] = None, min_severity: int = 0, cursor: Optional[int] = None):
+    """
+    Streams Zabbix problem changes as Server-Sent Events. The stream starts with a
+    snapshot of the matching active problems unless a ``cursor`` is given.
+    """
+    if problem_feed is None:
+        return JSONResponse(content={"error": "The Zabbix problem feed is not running."}, status_code=503)
+
+    async def events():
+        position = cursor
+        if position is None:
+            snapshot = problem_feed.query(host=host, min_severity=min_severity, limit=problem_feed.capacity)
+            position = snapshot["cursor"]
+            yield f"event: snapshot\nid: {position}\ndata: {json.dumps(snapshot)}\n\n"
+
+        while not await request.is_disconnected():
+            batch = await problem_feed.wait_for_changes(position, 15)
+            position = batch["cursor"]
+            if batch["resync"]:
+                yield f"event: resync\nid: {position}\ndata: {{}}\n\n"
+            changes = [c for c in batch["changes"] if "problem" not in c or ZabbixProblemFeed.matches(c["problem"], host, min_severity)]
+            for change in changes:
+                yield f"event: {change['type']}\nid: {change['seq']}\ndata: {json.dumps(change)}\n\n"
+            if not changes:
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 # --- FastAPI App ---
-app = FastAPI()
-app.include_router(router, prefix="/api/v1")
\ No newline at end of file
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_problem_feed()
+    yield
+    if problem_feed is not None:
+        problem_feed.stop()
+
+app = FastAPI(lifespan=lifespan)
+app.include_router(router, prefix="/api/v1")
+instrument(app)
\ No newline at end of file
@@ -0,0 +1,170 @@
+import hashlib
+import itertools
+import json
+import string
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from mcp_common import upstream
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="grafana-query")
+
+
+class TTLCache:
+    """
+    A small thread-safe cache whose entries expire ``ttl`` seconds after they
+    are stored. The oldest entries are evicted once ``max_entries`` is reached.
+    """
+
+    def __init__(self, ttl=30.0, max_entries=512):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def cache_key(target, time_from, time_to, max_points):
+    canonical = json.dumps([target, time_from, time_to, max_points], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _lttb_indices(xs, ys, threshold):
+    """
+    Largest-Triangle-Three-Buckets: picks ``threshold`` indices that keep the
+    visual shape of the series.
+    """
+    n = len(xs)
+    bucket_size = (n - 2) / (threshold - 2)
+    indices = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_start, next_end = end, min(int((i + 2) * bucket_size) + 1, n)
+        span = max(next_end - next_start, 1)
+        avg_x = sum(xs[next_start:next_end]) / span
+        avg_y = sum(ys[next_start:next_end]) / span
+
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+        indices.append(best)
+        a = best
+    indices.append(n - 1)
+    return indices
+
+
+def downsample_frame(frame, max_points):
+    """
+    Reduces a data frame to at most ``max_points`` rows. The rows are chosen by
+    LTTB over the time field and the first numeric field, and the same rows are
+    kept for every field so the frame stays aligned.
+    """
+    values = frame.get("data", {}).get("values") or []
+    fields = frame.get("schema", {}).get("fields") or []
+    length = len(values[0]) if values else 0
+    if max_points < 3 or length <= max_points:
+        return frame
+
+    types = [f.get("type") for f in fields]
+    x_index = types.index("time") if "time" in types else None
+    y_index = next((i for i, t in enumerate(types) if t == "number"), None)
+    if y_index is None:
+        step = length / max_points
+        indices = [int(i * step) for i in range(max_points)]
+    else:
+        xs = values[x_index] if x_index is not None else list(range(length))
+        xs = [float(x) if x is not None else 0.0 for x in xs]
+        ys = [float(y) if y is not None else 0.0 for y in values[y_index]]
+        indices = _lttb_indices(xs, ys, max_points)
+
+    data = dict(frame["data"])
+    data["values"] = [[column[i] for i in indices] for column in values]
+    schema = dict(frame.get("schema", {}))
+    schema["meta"] = {**schema.get("meta", {}), "downsampled": {"from": length, "to": len(indices)}}
+    return {**frame, "schema": schema, "data": data}
+
+
+def _query_target(grafana_url, headers, target, time_from, time_to, max_points):
+    payload = {
+        "queries": [{"maxDataPoints": max_points, **target}],
+        "from": time_from,
+        "to": time_to,
+    }
+    response = upstream.post(f"{grafana_url}/api/ds/query", headers=headers, data=json.dumps(payload))
+    response.raise_for_status()
+    result = response.json().get("results", {}).get(target["refId"], {})
+    frames = [downsample_frame(frame, max_points) for frame in result.get("frames", [])]
+    return {**result, "frames": frames}
+
+
+def preview_targets(grafana_url, headers, targets, datasource, time_from, time_to, max_points, cache):
+    """
+    Runs each target through ``/api/ds/query`` concurrently and returns the
+    (downsampled) frames keyed by ``refId``. Results are cached per target and
+    time range.
+    """
+    explicit = [t["refId"] for t in targets if t.get("refId")]
+    duplicates = sorted({r for r in explicit if explicit.count(r) > 1})
+    if duplicates:
+        return {"error": f"Duplicate refId: {', '.join(duplicates)}. Each target needs its own refId."}
+    used = set(explicit)
+    names = (string.ascii_uppercase[i % 26] + (str(i // 26) if i >= 26 else "") for i in itertools.count())
+    prepared = []
+    for target in targets:
+        target = dict(target)
+        if not target.get("refId"):
+            # Generated refIds skip the ones the caller chose.
+            target["refId"] = next(n for n in names if n not in used)
+            used.add(target["refId"])
+        target_ds = target.get("datasource", datasource)
+        if isinstance(target_ds, str):
+            target_ds = {"uid": target_ds}
+        if target_ds is not None:
+            target["datasource"] = target_ds
+        prepared.append(target)
+
+    results, cached, pending = {}, [], {}
+    for target in prepared:
+        key = cache_key(target, time_from, time_to, max_points)
+        hit = cache.get(key)
+        if hit is not None:
+            results[target["refId"]] = hit
+            cached.append(target["refId"])
+        else:
+            future = _executor.submit(_query_target, grafana_url, headers, target, time_from, time_to, max_points)
+            pending[target["refId"]] = (key, future)
+
+    for ref_id, (key, future) in pending.items():
+        try:
+            result = future.result()
+            cache.set(key, result)
+            results[ref_id] = result
+        except requests.exceptions.RequestException as e:
+            results[ref_id] = {"error": f"An error occurred: {e}"}
+
+    return {"results": results, "cached": cached}
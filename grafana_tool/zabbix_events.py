@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+
+from pyzabbix import ZabbixAPI
+
+from mcp_common import upstream
+
+EVENT_OUTPUT = ["eventid", "objectid", "clock", "value", "name", "severity", "acknowledged"]
+
+
+class ZabbixProblemFeed:
+    """
+    Keeps the set of active Zabbix problems up to date by polling only the
+    events created since the last poll (an ``eventid`` high-water mark).
+
+    Active problems are held in a bounded, insertion-ordered buffer indexed by
+    host and severity, so queries never touch Zabbix. Every change is also
+    appended to a short change log that subscribers can follow by cursor.
+    """
+
+    def __init__(self, url, user, password, interval=30.0, capacity=5000, history=1000, batch_size=1000):
+        self.url = url
+        self.user = user
+        self.password = password
+        self.interval = interval
+        self.capacity = capacity
+        self.batch_size = batch_size
+
+        self._zapi = None
+        self._problems = OrderedDict()
+        self._by_host = {}
+        self._by_severity = {}
+        self._by_trigger = {}
+        self._changes = deque(maxlen=history)
+        self._seq = 0
+        self._watermark = 0
+        self._cond = threading.Condition()
+        self._waiters = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.last_poll = None
+        self.last_error = None
+
+    # --- Lifecycle ---
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="zabbix-problem-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+                self.last_error = None
+            except Exception as e:
+                logging.error(f"Zabbix problem feed poll failed: {e}")
+                self.last_error = str(e)
+                self._zapi = None
+            self._stop.wait(self.interval)
+
+    # --- Polling ---
+    def _client(self):
+        if self._zapi is None:
+            zapi = ZabbixAPI(self.url, session=upstream.new_session())
+            zapi.login(self.user, self.password)
+            self._zapi = zapi
+        return self._zapi
+
+    def poll_once(self):
+        """
+        Runs one poll cycle: a full seed on the first call, then only the
+        events above the watermark.
+        """
+        zapi = self._client()
+        if self._watermark == 0:
+            self._seed(zapi)
+        else:
+            while self._advance(zapi) == self.batch_size:
+                pass
+        self.last_poll = datetime.now(timezone.utc).isoformat()
+
+    def _seed(self, zapi):
+        # Read the newest event id first so nothing created while seeding is skipped.
+        latest = zapi.event.get(output=["eventid"], sortfield=["eventid"], sortorder="DESC", limit=1)
+        watermark = int(latest[0]["eventid"]) if latest else 0
+
+        problems = zapi.problem.get(output=["eventid"], recent=False, sortfield=["eventid"], sortorder="ASC")
+        events = []
+        if problems:
+            events = zapi.event.get(
+                eventids=[p["eventid"] for p in problems],
+                output=EVENT_OUTPUT,
+                selectHosts=["host"],
+                sortfield=["eventid"],
+                sortorder="ASC",
+            )
+
+        with self._cond:
+            self._problems.clear()
+            self._by_host.clear()
+            self._by_severity.clear()
+            self._by_trigger.clear()
+            for event in events:
+                self._add(event, record=False)
+                watermark = max(watermark, int(event["eventid"]))
+            self._watermark = watermark or 1
+            self._record({"type": "resync", "active": len(self._problems)})
+            self._notify()
+
+    def _advance(self, zapi):
+        events = zapi.event.get(
+            output=EVENT_OUTPUT,
+            source=0,
+            object=0,
+            eventid_from=str(self._watermark + 1),
+            selectHosts=["host"],
+            sortfield=["eventid"],
+            sortorder="ASC",
+            limit=self.batch_size,
+        )
+        if not events:
+            return 0
+
+        with self._cond:
+            for event in events:
+                if event.get("value") == "1":
+                    self._add(event)
+                else:
+                    self._resolve(event)
+                self._watermark = max(self._watermark, int(event["eventid"]))
+            self._notify()
+        return len(events)
+
+    # --- Buffer maintenance (caller holds the lock) ---
+    def _add(self, event, record=True):
+        eventid = event["eventid"]
+        if eventid in self._problems:
+            return
+        problem = {
+            "eventid": eventid,
+            "triggerid": event.get("objectid"),
+            "name": event.get("name"),
+            "severity": int(event.get("severity", 0)),
+            "clock": int(event.get("clock", 0)),
+            "acknowledged": event.get("acknowledged") == "1",
+            "hosts": [h["host"] for h in event.get("hosts", [])],
+        }
+        self._problems[eventid] = problem
+        for host in problem["hosts"]:
+            self._by_host.setdefault(host, set()).add(eventid)
+        self._by_severity.setdefault(problem["severity"], set()).add(eventid)
+        self._by_trigger.setdefault(problem["triggerid"], set()).add(eventid)
+
+        while len(self._problems) > self.capacity:
+            oldest = next(iter(self._problems))
+            self._remove(oldest)
+
+        if record:
+            self._record({"type": "problem", "problem": problem})
+
+    def _resolve(self, event):
+        for eventid in list(self._by_trigger.get(event.get("objectid"), ())):
+            problem = self._remove(eventid)
+            if problem:
+                self._record({"type": "resolved", "problem": problem, "clock": int(event.get("clock", 0))})
+
+    def _remove(self, eventid):
+        problem = self._problems.pop(eventid, None)
+        if problem is None:
+            return None
+        for host in problem["hosts"]:
+            self._discard(self._by_host, host, eventid)
+        self._discard(self._by_severity, problem["severity"], eventid)
+        self._discard(self._by_trigger, problem["triggerid"], eventid)
+        return problem
+
+    @staticmethod
+    def _discard(index, key, eventid):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(eventid)
+            if not ids:
+                del index[key]
+
+    def _record(self, change):
+        self._seq += 1
+        change["seq"] = self._seq
+        self._changes.append(change)
+
+    # --- Queries ---
+    @staticmethod
+    def matches(problem, host=None, min_severity=0):
+        if problem["severity"] < min_severity:
+            return False
+        return host is None or host in problem["hosts"]
+
+    def query(self, host=None, min_severity=0, limit=100):
+        """
+        Returns active problems, newest first, filtered by host and minimum severity.
+        """
+        with self._cond:
+            ids = set()
+            for severity, eventids in self._by_severity.items():
+                if severity >= min_severity:
+                    ids |= eventids
+            if host is not None:
+                ids &= self._by_host.get(host, set())
+            selected = sorted(ids, key=int, reverse=True)[:limit]
+            return {
+                "problems": [dict(self._problems[eventid]) for eventid in selected],
+                "total": len(ids),
+                "cursor": self._seq,
+                "watermark": self._watermark,
+                "last_poll": self.last_poll,
+                "last_error": self.last_error,
+            }
+
+    def _notify(self):
+        """
+        Wakes the threads and event-loop subscribers waiting for changes.
+        Called with ``_cond`` held.
+        """
+        self._cond.notify_all()
+        for loop, event in self._waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The subscriber's loop is closed.
+                pass
+
+    async def wait_for_changes(self, cursor, timeout):
+        """
+        ``changes_since`` for event-loop callers: waits on an ``asyncio.Event``
+        set by the poller instead of holding a thread, so open streams do not
+        use up the executor that runs the tools.
+        """
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            ready = self._seq > cursor or self._stop.is_set()
+            if not ready:
+                self._waiters.add(waiter)
+        if not ready:
+            try:
+                await asyncio.wait_for(waiter[1].wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    self._waiters.discard(waiter)
+        return self.changes_since(cursor)
+
+    def changes_since(self, cursor, timeout=None):
+        """
+        Returns the changes recorded after ``cursor``, waiting up to ``timeout``
+        seconds for new ones. ``resync`` is set when the cursor has fallen out of
+        the change log and the caller should re-query the full problem list.
+        """
+        with self._cond:
+            if self._seq <= cursor and timeout:
+                self._cond.wait_for(lambda: self._seq > cursor or self._stop.is_set(), timeout)
+            oldest = self._changes[0]["seq"] if self._changes else self._seq + 1
+            changes = [c for c in self._changes if c["seq"] > cursor]
+            return {"changes": changes, "cursor": self._seq, "resync": cursor + 1 < oldest and cursor < self._seq}
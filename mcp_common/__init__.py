@@ -0,0 +1,6 @@
+"""
+Building blocks shared by the MCP tool servers.
+
+Each service keeps its own ``main.py``; the modules here are imported from it
+and copied next to it in the service's Docker image.
+"""
@@ -0,0 +1,301 @@
+"""
+TTL response cache for read-only tools, with request coalescing.
+
+Usage::
+
+    from mcp_common.cache import tool_cache
+
+    @tool_cache.cached(ttl=300, groups=("rules",))
+    def get_rules(args: GetRulesArgs): ...
+
+    @tool_cache.invalidates("agents")
+    def delete_agents(args: DeleteAgentsArgs): ...
+
+Results are keyed on the tool name and a canonical hash of its arguments.
+Concurrent calls with the same key wait for the one call already in flight
+instead of going upstream themselves. Cached values are shared between
+callers and must not be mutated.
+
+With ``stale=<seconds>``, an expired result is still returned for that long
+after its TTL while a single call refreshes it in the background
+(stale-while-revalidate), so callers never wait on the upstream for a key
+that was cached recently.
+
+A tool's TTL can be overridden with ``MCP_CACHE_TTL_<TOOL_NAME>`` (seconds,
+``0`` disables caching for that tool), and its stale window with
+``MCP_CACHE_STALE_<TOOL_NAME>``.
+"""
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from pydantic import BaseModel
+
+from mcp_common import metrics
+
+
+# Background refresh tasks, referenced until they finish.
+_refreshes = set()
+
+
+def _canonical(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", by_alias=True)
+    return value
+
+
+def make_key(name, args, kwargs):
+    payload = json.dumps(
+        [name, [_canonical(a) for a in args], {k: _canonical(v) for k, v in kwargs.items()}],
+        sort_keys=True, separators=(",", ":"), default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ToolCache:
+    """
+    A size-bounded LRU of tool results with per-entry expiry and named
+    invalidation groups.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._group_generations = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale = 0
+
+    # --- Storage ---
+    def _lookup(self, key):
+        """
+        Returns ``(found, fresh, value)``; a found entry that is not fresh is
+        past its TTL but within its stale window.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, False, None
+        expires, stale_until, _, value = entry
+        now = time.monotonic()
+        if stale_until < now:
+            del self._entries[key]
+            return False, False, None
+        self._entries.move_to_end(key)
+        return True, expires >= now, value
+
+    def _generations(self, groups):
+        return tuple(self._group_generations.get(g, 0) for g in groups)
+
+    def _store(self, key, value, ttl, stale, groups, generations):
+        with self._lock:
+            # Skip the store if a group was invalidated while the call was in flight.
+            if self._generations(groups) != generations:
+                return
+            expires = time.monotonic() + ttl
+            self._entries[key] = (expires, expires + stale, groups, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *groups):
+        """
+        Drops every entry that belongs to one of ``groups``.
+        """
+        with self._lock:
+            for group in groups:
+                self._group_generations[group] = self._group_generations.get(group, 0) + 1
+            dropped = [key for key, (_, _, entry_groups, _) in self._entries.items() if set(entry_groups) & set(groups)]
+            for key in dropped:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "stale": self.stale,
+                "inflight": len(self._inflight),
+            }
+
+    # --- Decorators ---
+    def _begin(self, tool_name, key, groups, make_future):
+        """
+        Returns ``(hit, value, future, leader, generations)`` for a call with
+        ``key``. A stale hit whose ``leader`` is set must refresh the entry.
+        """
+        with self._lock:
+            found, fresh, value = self._lookup(key)
+            if found and fresh:
+                self.hits += 1
+                metrics.CACHE_REQUESTS.labels(tool_name, "hit").inc()
+                return True, value, None, False, None
+            future = self._inflight.get(key)
+            if found:
+                self.stale += 1
+                metrics.CACHE_REQUESTS.labels(tool_name, "stale").inc()
+                if future is not None:
+                    return True, value, None, False, None
+                future = make_future()
+                self._inflight[key] = future
+                return True, value, future, True, self._generations(groups)
+            if future is not None:
+                self.coalesced += 1
+                metrics.CACHE_REQUESTS.labels(tool_name, "coalesced").inc()
+                return False, None, future, False, None
+            self.misses += 1
+            metrics.CACHE_REQUESTS.labels(tool_name, "miss").inc()
+            future = make_future()
+            self._inflight[key] = future
+            return False, None, future, True, self._generations(groups)
+
+    def _finish(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def cached(self, ttl, groups=(), name=None, cache_if=None, stale=0):
+        """
+        Caches the decorated tool's results for ``ttl`` seconds, and serves
+        them for ``stale`` seconds more while refreshing in the background.
+        ``ttl`` may be a function, called for each result stored, for TTLs
+        that vary over time (e.g. with market hours).
+        ``cache_if`` is an optional predicate; results it rejects (e.g. error
+        messages) are returned but not stored.
+        """
+        groups = tuple(groups)
+
+        def decorator(fn):
+            tool_name = name or fn.__name__
+            override = os.environ.get(f"MCP_CACHE_TTL_{tool_name.upper()}")
+            effective_ttl = float(override) if override is not None else ttl
+            effective_stale = float(os.environ.get(f"MCP_CACHE_STALE_{tool_name.upper()}", stale))
+            if not callable(effective_ttl) and effective_ttl <= 0:
+                return fn
+
+            def should_store(value):
+                return cache_if is None or cache_if(value)
+
+            def complete(key, future, generations, value):
+                # The waiters get the value even when it cannot be stored.
+                try:
+                    if should_store(value):
+                        entry_ttl = effective_ttl() if callable(effective_ttl) else effective_ttl
+                        self._store(key, value, entry_ttl, effective_stale, groups, generations)
+                except Exception:
+                    logging.exception(f"Could not cache the result of {tool_name}")
+                finally:
+                    self._finish(key)
+                    future.set_result(value)
+
+            if inspect.iscoroutinefunction(fn):
+                async def run(key, future, generations, args, kwargs):
+                    try:
+                        value = await fn(*args, **kwargs)
+                    except asyncio.CancelledError:
+                        self._finish(key)
+                        future.cancel()
+                        raise
+                    except BaseException as e:
+                        self._finish(key)
+                        future.set_exception(e)
+                        future.exception()
+                        raise
+                    complete(key, future, generations, value)
+                    return value
+
+                async def revalidate(key, future, generations, args, kwargs):
+                    try:
+                        await run(key, future, generations, args, kwargs)
+                    except Exception as e:
+                        logging.warning(f"Background refresh of {tool_name} failed: {e}")
+
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    key = make_key(tool_name, args, kwargs)
+                    loop = asyncio.get_running_loop()
+                    hit, value, future, leader, generations = self._begin(tool_name, key, groups, loop.create_future)
+                    if hit:
+                        if leader:
+                            task = loop.create_task(revalidate(key, future, generations, args, kwargs))
+                            _refreshes.add(task)
+                            task.add_done_callback(_refreshes.discard)
+                        return value
+                    if not leader:
+                        return await asyncio.shield(future)
+                    return await run(key, future, generations, args, kwargs)
+                async_wrapper.cache = self
+                return async_wrapper
+
+            def run_sync(key, future, generations, args, kwargs):
+                try:
+                    value = fn(*args, **kwargs)
+                except BaseException as e:
+                    self._finish(key)
+                    future.set_exception(e)
+                    raise
+                complete(key, future, generations, value)
+                return value
+
+            def revalidate_sync(key, future, generations, args, kwargs):
+                try:
+                    run_sync(key, future, generations, args, kwargs)
+                except Exception as e:
+                    logging.warning(f"Background refresh of {tool_name} failed: {e}")
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                key = make_key(tool_name, args, kwargs)
+                hit, value, future, leader, generations = self._begin(tool_name, key, groups, Future)
+                if hit:
+                    if leader:
+                        threading.Thread(target=revalidate_sync, args=(key, future, generations, args, kwargs), name=f"refresh-{tool_name}", daemon=True).start()
+                    return value
+                if not leader:
+                    return future.result()
+                return run_sync(key, future, generations, args, kwargs)
+            wrapper.cache = self
+            return wrapper
+        return decorator
+
+    def invalidates(self, *groups):
+        """
+        Invalidates ``groups`` after each call of the decorated (mutating) tool.
+        """
+        def decorator(fn):
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    try:
+                        return await fn(*args, **kwargs)
+                    finally:
+                        self.invalidate(*groups)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.invalidate(*groups)
+            return wrapper
+        return decorator
+
+
+tool_cache = ToolCache(max_entries=int(os.environ.get("MCP_CACHE_MAX_ENTRIES", "1024")))
@@ -0,0 +1,102 @@
+"""
+Fast JSON encoding and decoding for the MCP request/response path.
+
+``JSONResponse`` and ``read_json`` are drop-in replacements for Starlette's
+``JSONResponse`` and ``await request.json()``. They use orjson when it is
+installed and fall back to the standard library otherwise.
+
+Upstream bodies that need no transformation can be wrapped in ``RawJSON``
+(or returned through ``passthrough``); their bytes are spliced into the
+response as-is instead of being decoded and re-encoded.
+"""
+import json
+
+from starlette.responses import JSONResponse as StarletteJSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class RawJSON:
+    """
+    Already-encoded JSON that is embedded verbatim when the response is rendered.
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data if isinstance(data, bytes) else data.encode("utf-8")
+
+    def loads(self):
+        return loads(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f"<RawJSON {len(self.data)} bytes>"
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def _default(value):
+        if isinstance(value, RawJSON):
+            return orjson.Fragment(value.data)
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    def dumps(value):
+        try:
+            return orjson.dumps(value, default=_default, option=_OPTIONS)
+        except orjson.JSONEncodeError:
+            # orjson rejects a few things the standard library accepts, e.g. integers over 64 bits.
+            return _stdlib_dumps(value)
+
+    def loads(data):
+        return orjson.loads(data)
+else:
+    def dumps(value):
+        return _stdlib_dumps(value)
+
+    def loads(data):
+        return json.loads(data)
+
+
+def _stdlib_default(value):
+    if isinstance(value, RawJSON):
+        return json.loads(value.data)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _stdlib_dumps(value):
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_stdlib_default).encode("utf-8")
+
+
+class JSONResponse(StarletteJSONResponse):
+    def render(self, content):
+        return dumps(content)
+
+
+async def read_json(request):
+    """
+    Parses the request body; the fast equivalent of ``await request.json()``.
+    """
+    return loads(await request.body())
+
+
+def passthrough(response):
+    """
+    Returns an upstream ``requests`` response body as ``RawJSON`` when it is
+    declared as JSON and is valid JSON, or the parsed body otherwise. Empty
+    and invalid bodies raise from ``response.json()``, as they did before
+    passthrough, so tools report them as errors instead of embedding them.
+    """
+    if "json" in response.headers.get("Content-Type", "") and response.content:
+        try:
+            loads(response.content)
+        except ValueError:
+            return response.json()
+        return RawJSON(response.content)
+    return response.json()
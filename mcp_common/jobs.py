@@ -0,0 +1,374 @@
+"""
+Background jobs for long-running tools.
+
+A tool marked with ``@long_running`` can be called as a job by setting
+``params._meta.job`` to ``true``::
+
+    {"method": "tools/call", "params": {"name": "restart_agents", "arguments": {...}, "_meta": {"job": true}}}
+
+The call returns ``{"job_id": ..., "status": "queued"}`` at once, and the tool
+runs on a bounded pool of ``MCP_JOB_WORKERS`` concurrent jobs. The
+``job_status``, ``job_result`` and ``job_cancel`` tools poll, fetch and cancel
+it. Progress reported with ``report_progress`` shows up in the job's status.
+Without ``_meta.job`` the tool runs inline as before.
+
+Job state and results are written to ``MCP_JOB_DIR``, so finished jobs can
+still be fetched after a restart. Jobs that were queued or running when
+their process stopped are marked ``interrupted``; they are not re-run, as
+they may not be safe to repeat. Finished jobs are deleted after
+``MCP_JOB_TTL`` seconds.
+
+A running job is cancelled at its next ``report_progress`` call; a tool that
+reports no progress runs to completion and its result is discarded.
+"""
+import asyncio
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+
+from pydantic import BaseModel, Field
+
+from mcp_common import metrics
+from mcp_common.fastjson import RawJSON, dumps, loads
+
+JOB_DIR = os.environ.get("MCP_JOB_DIR", "jobs")
+WORKERS = int(os.environ.get("MCP_JOB_WORKERS", "4"))
+MAX_PENDING = int(os.environ.get("MCP_JOB_MAX_PENDING", "100"))
+TTL = float(os.environ.get("MCP_JOB_TTL", "86400"))
+PROGRESS_SAVE_INTERVAL = 1.0
+
+UNKNOWN_JOB = "Unknown or expired job."
+FINISHED = {"succeeded", "failed", "cancelled", "interrupted"}
+_JOB_ID = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+def long_running(fn):
+    """
+    Marks a tool as one that may be called as a background job. Apply it
+    outermost, above any cache decorators.
+    """
+    fn.long_running = True
+    return fn
+
+
+def wants_job(fn, params):
+    return getattr(fn, "long_running", False) and bool((params.get("_meta") or {}).get("job"))
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a running tool, at its next progress report, once its job
+    has been cancelled.
+    """
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+# --- Pydantic Schemas ---
+class JobArgs(BaseModel):
+    job_id: str = Field(..., description="The job_id returned when the tool was called with _meta.job.")
+
+
+JOB_TOOLS = [
+    {
+        "name": "job_status",
+        "title": "Get Job Status",
+        "description": "Returns the status (queued, running, succeeded, failed, cancelled or interrupted) and progress of a background job.",
+        "inputSchema": JobArgs.model_json_schema(),
+        "outputSchema": {"type": "object"},
+    },
+    {
+        "name": "job_result",
+        "title": "Get Job Result",
+        "description": "Returns the result of a finished background job.",
+        "inputSchema": JobArgs.model_json_schema(),
+        "outputSchema": {"type": "object"},
+    },
+    {
+        "name": "job_cancel",
+        "title": "Cancel Job",
+        "description": "Cancels a queued or running background job.",
+        "inputSchema": JobArgs.model_json_schema(),
+        "outputSchema": {"type": "object"},
+    },
+]
+
+
+class JobReporter:
+    """
+    Stands in for the SSE progress reporter while a tool runs as a job: it
+    records progress on the job and raises ``JobCancelled`` once the job has
+    been cancelled. Partial results are not kept; the final result holds them.
+    """
+
+    def __init__(self, manager, job):
+        self.manager = manager
+        self.job = job
+
+    def progress(self, progress, total=None, message=None):
+        if self.job["cancel_requested"]:
+            raise JobCancelled()
+        self.job["progress"] = {"progress": progress, "total": total, "message": message}
+        self.manager.save(self.job, throttle=True)
+
+    def partial(self, chunk):
+        if self.job["cancel_requested"]:
+            raise JobCancelled()
+
+
+class JobManager:
+    """
+    Runs jobs on the event loop, at most ``workers`` at a time, and keeps
+    their state in memory and in ``directory``.
+    """
+
+    def __init__(self, directory=JOB_DIR, workers=WORKERS, max_pending=MAX_PENDING):
+        self.directory = directory
+        self.workers = workers
+        self.max_pending = max_pending
+        self._jobs = {}
+        self._tasks = {}
+        self._saved = {}
+        self._semaphore = None
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    # --- Persistence ---
+    def _path(self, job_id, suffix="json"):
+        return os.path.join(self.directory, f"{job_id}.{suffix}")
+
+    def save(self, job, throttle=False):
+        now = time.monotonic()
+        if throttle and now - self._saved.get(job["id"], 0.0) < PROGRESS_SAVE_INTERVAL:
+            return
+        self._saved[job["id"]] = now
+        tmp = self._path(job["id"], f"json.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                f.write(dumps({k: v for k, v in job.items() if k != "cancel_requested"}))
+            os.replace(tmp, self._path(job["id"]))
+        except OSError as e:
+            logging.error(f"Could not save job {job['id']}: {e}")
+
+    def _read(self, job_id):
+        try:
+            with open(self._path(job_id), "rb") as f:
+                job = loads(f.read())
+        except (OSError, ValueError):
+            return None
+        job["cancel_requested"] = False
+        return job
+
+    def _write_result(self, job_id, result):
+        with open(self._path(job_id, "result.json"), "wb") as f:
+            f.write(result.data if isinstance(result, RawJSON) else dumps(result))
+
+    def _delete(self, job_id):
+        self._jobs.pop(job_id, None)
+        self._saved.pop(job_id, None)
+        for suffix in ("json", "result.json"):
+            try:
+                os.remove(self._path(job_id, suffix))
+            except OSError:
+                pass
+
+    def load(self):
+        """
+        Reads the jobs persisted by earlier runs, marks those that never
+        finished as interrupted, and deletes expired ones.
+        """
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            os.makedirs(self.directory, exist_ok=True)
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json") or name.endswith(".result.json"):
+                    continue
+                job = self._read(name[:-len(".json")])
+                if job is None:
+                    continue
+                if job["status"] not in FINISHED and not _alive(job.get("pid")):
+                    job.update(status="interrupted", finished=time.time(), error="The service restarted before the job finished.")
+                    self.save(job)
+                self._jobs[job["id"]] = job
+            self._purge()
+
+    def _purge(self):
+        cutoff = time.time() - TTL
+        for job_id, job in list(self._jobs.items()):
+            if job["status"] in FINISHED and (job.get("finished") or 0) < cutoff:
+                self._delete(job_id)
+
+    # --- Lifecycle ---
+    def get(self, job_id):
+        self.load()
+        if not _JOB_ID.match(job_id):
+            return None
+        job = self._jobs.get(job_id)
+        if job is None or (job["status"] not in FINISHED and job.get("pid") != os.getpid()):
+            # Written by another worker process; read its latest state.
+            job = self._read(job_id) or job
+        return job
+
+    def submit(self, fn, args, params, error_of, runner):
+        """
+        Queues ``fn(args)`` and returns the new job. ``runner`` runs the tool
+        with a progress reporter, like ``streaming.run_tool``.
+        """
+        self.load()
+        pending = sum(1 for task in self._tasks.values() if not task.done())
+        if pending >= self.max_pending:
+            raise JobQueueFull(f"Too many pending jobs ({pending}); try again later.")
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        job = {
+            "id": secrets.token_urlsafe(12),
+            "tool": fn.__name__,
+            "arguments": params.get("arguments", {}),
+            "status": "queued",
+            "pid": os.getpid(),
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+            "progress": None,
+            "error": None,
+            "cancel_requested": False,
+        }
+        self._jobs[job["id"]] = job
+        self.save(job)
+        self._purge()
+        metrics.JOBS_ACTIVE.labels("queued").inc()
+        self._tasks[job["id"]] = asyncio.ensure_future(self._run(job, fn, args, error_of, runner))
+        return job
+
+    async def _run(self, job, fn, args, error_of, runner):
+        tool = job["tool"]
+        queued = True
+        try:
+            async with self._semaphore:
+                queued = False
+                metrics.JOBS_ACTIVE.labels("queued").dec()
+                if job["cancel_requested"]:
+                    raise JobCancelled()
+                job.update(status="running", started=time.time())
+                self.save(job)
+                metrics.JOBS_ACTIVE.labels("running").inc()
+                start = time.perf_counter()
+                try:
+                    result = await runner(fn, args, JobReporter(self, job))
+                finally:
+                    metrics.JOBS_ACTIVE.labels("running").dec()
+                    metrics.TOOL_LATENCY.labels(tool).observe(time.perf_counter() - start)
+            if job["cancel_requested"]:
+                raise JobCancelled()
+            error = error_of(result) if error_of else None
+            if error is None:
+                await asyncio.to_thread(self._write_result, job["id"], result)
+                job["status"] = "succeeded"
+            else:
+                job.update(status="failed", error=error)
+        except JobCancelled:
+            job["status"] = "cancelled"
+        except asyncio.CancelledError:
+            # Cancelled while queued, or stopped by the service shutting down.
+            job["status"] = "cancelled" if job["cancel_requested"] else "interrupted"
+            if job["status"] == "interrupted":
+                job["error"] = "The service stopped before the job finished."
+        except Exception as e:
+            logging.exception(f"Job {job['id']} ({tool}) failed")
+            job.update(status="failed", error=f"Internal server error: {e}")
+        finally:
+            if queued:
+                metrics.JOBS_ACTIVE.labels("queued").dec()
+            job["finished"] = time.time()
+            self.save(job)
+            self._tasks.pop(job["id"], None)
+            metrics.JOBS_FINISHED.labels(tool, job["status"]).inc()
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        task = self._tasks.get(job_id)
+        if job is None or task is None:
+            return False
+        job["cancel_requested"] = True
+        if job["status"] == "queued":
+            task.cancel()
+        return True
+
+    def result(self, job_id):
+        with open(self._path(job_id, "result.json"), "rb") as f:
+            return RawJSON(f.read())
+
+
+def _alive(pid):
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+manager = JobManager()
+
+
+def public(job):
+    return {k: v for k, v in job.items() if k not in ("cancel_requested", "pid")}
+
+
+# --- Job Tools ---
+def job_status(args: JobArgs):
+    """
+    Returns the status and progress of a job.
+    """
+    job = manager.get(args.job_id)
+    if job is None:
+        return {"error": UNKNOWN_JOB}
+    return public(job)
+
+
+def job_result(args: JobArgs):
+    """
+    Returns the result of a finished job.
+    """
+    job = manager.get(args.job_id)
+    if job is None:
+        return {"error": UNKNOWN_JOB}
+    if job["status"] != "succeeded":
+        if job["status"] in FINISHED:
+            return {"error": f"Job {args.job_id} {job['status']}" + (f": {job['error']}" if job.get("error") else ".")}
+        return {"error": f"Job {args.job_id} is still {job['status']}; poll job_status until it has finished."}
+    try:
+        return manager.result(args.job_id)
+    except OSError:
+        return {"error": UNKNOWN_JOB}
+
+
+def job_cancel(args: JobArgs):
+    """
+    Cancels a queued or running job.
+    """
+    job = manager.get(args.job_id)
+    if job is None:
+        return {"error": UNKNOWN_JOB}
+    if job["status"] in FINISHED:
+        return public(job)
+    if not manager.cancel(args.job_id):
+        return {"error": f"Job {args.job_id} runs in another worker process and cannot be cancelled from this one."}
+    return dict(public(job), cancel_requested=True)
+
+
+JOB_FUNCTIONS = {"job_status": job_status, "job_result": job_result, "job_cancel": job_cancel}
+
+
+def error_of(result):
+    return result.get("error") if isinstance(result, dict) else None
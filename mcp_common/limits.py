@@ -0,0 +1,188 @@
+"""
+Per-upstream rate limits and concurrency caps with fair queueing.
+
+Each upstream host can be given a token-bucket rate limit and a cap on
+concurrent requests (a bulkhead). Requests through ``mcp_common.upstream`` to a
+limited host wait in a FIFO queue until both allow them, so bursts of tool
+calls are spread out instead of being rejected by the upstream. A request that
+waits longer than the host's queue timeout fails with ``UpstreamBusy``.
+``UpstreamBusy`` is a ``requests.exceptions.RequestException``, so the tools
+report it like any other upstream error.
+
+Services declare the limits of the APIs they call::
+
+    upstream.limit(WAZUH_URL, rate=5, burst=10, concurrency=8)
+
+``MCP_UPSTREAM_LIMITS`` overrides them per host without a code change, e.g.
+``{"wazuh.example.com:55000": {"rate": 2, "concurrency": 4}}``.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+
+from mcp_common import metrics
+
+QUEUE_TIMEOUT = float(os.environ.get("MCP_UPSTREAM_QUEUE_TIMEOUT", "30"))
+DEFAULT_RETRY_AFTER = 1.0
+
+
+class UpstreamBusy(requests.exceptions.RequestException):
+    """
+    Raised when a request could not be sent within its queue deadline.
+    """
+
+
+def host_of(url_or_host):
+    return urlsplit(url_or_host).netloc if "//" in url_or_host else url_or_host
+
+
+class Limiter:
+    """
+    A token bucket (``rate`` requests per second, up to ``burst`` at once)
+    combined with a limit of ``concurrency`` requests in flight. Waiting
+    requests are served strictly in arrival order.
+    """
+
+    def __init__(self, host, rate=None, burst=None, concurrency=None, queue_timeout=QUEUE_TIMEOUT):
+        self.host = host
+        self.rate = rate
+        self.burst = burst or (max(1.0, rate) if rate else None)
+        self.concurrency = concurrency
+        self.queue_timeout = queue_timeout
+
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._active = 0
+        self._tokens = self.burst or 0.0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._depth = metrics.UPSTREAM_QUEUE_DEPTH.labels(host)
+
+    def _delay(self, now):
+        """
+        Seconds until the head of the queue may go, ``0`` if it may go now,
+        or ``None`` if it must wait for a request to finish.
+        """
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self.concurrency and self._active >= self.concurrency:
+            return None
+        if self.rate:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                return (1 - self._tokens) / self.rate
+        return 0
+
+    def acquire(self, timeout=None):
+        """
+        Waits for this request's turn. Raises ``UpstreamBusy`` after
+        ``timeout`` seconds (the limiter's queue timeout by default).
+        """
+        start = time.monotonic()
+        deadline = start + (self.queue_timeout if timeout is None else timeout)
+        ticket = object()
+        with self._cond:
+            self._queue.append(ticket)
+            self._depth.inc()
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = self._delay(now) if self._queue[0] is ticket else None
+                    if delay == 0:
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        metrics.UPSTREAM_REJECTED.labels(self.host).inc()
+                        raise UpstreamBusy(f"Upstream {self.host} is busy: request waited {now - start:.1f}s in queue")
+                    self._cond.wait(remaining if delay is None else min(delay, remaining))
+                self._active += 1
+                if self.rate:
+                    self._tokens -= 1
+            finally:
+                self._queue.remove(ticket)
+                self._depth.dec()
+                self._cond.notify_all()
+        metrics.UPSTREAM_QUEUE_WAIT.labels(self.host).observe(time.monotonic() - start)
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def pause(self, seconds):
+        """
+        Holds every queued request for ``seconds``, e.g. after the upstream
+        answered 429 Too Many Requests.
+        """
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {"queued": len(self._queue), "active": self._active, "tokens": round(self._tokens, 2) if self.rate else None}
+
+
+def retry_after(response):
+    """
+    The delay requested by a 429 response's ``Retry-After`` header, in seconds.
+    """
+    value = response.headers.get("Retry-After")
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+_limiters = {}
+_lock = threading.Lock()
+
+
+def _overrides():
+    raw = os.environ.get("MCP_UPSTREAM_LIMITS")
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError as e:
+        logging.error(f"Ignoring invalid MCP_UPSTREAM_LIMITS: {e}")
+        return {}
+
+
+def limit(url_or_host, rate=None, burst=None, concurrency=None, queue_timeout=None):
+    """
+    Sets the limits for an upstream host, given as a host or a URL. Values from
+    ``MCP_UPSTREAM_LIMITS`` take precedence. Does nothing for an empty host.
+    """
+    host = host_of(url_or_host or "")
+    if not host:
+        return None
+    settings = {"rate": rate, "burst": burst, "concurrency": concurrency, "queue_timeout": queue_timeout if queue_timeout is not None else QUEUE_TIMEOUT}
+    settings.update(_overrides().get(host, {}))
+    limiter = Limiter(host, **settings)
+    with _lock:
+        _limiters[host] = limiter
+    return limiter
+
+
+def for_host(host):
+    """
+    The limiter of ``host``, or ``None`` when the host is not limited.
+    """
+    limiter = _limiters.get(host)
+    if limiter is None and host not in _limiters:
+        settings = _overrides().get(host)
+        with _lock:
+            _limiters[host] = limiter = Limiter(host, **settings) if settings else None
+    return limiter
+
+
+def stats():
+    return {host: limiter.stats() for host, limiter in list(_limiters.items()) if limiter is not None}
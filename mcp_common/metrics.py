@@ -0,0 +1,94 @@
+"""
+Prometheus metrics for the MCP servers.
+
+``instrument(app)`` adds the ``/metrics`` endpoint and a lightweight ASGI
+middleware that times every HTTP request. Tool-level metrics are recorded by
+``mcp_common.streaming.call_tool``, upstream metrics by
+``mcp_common.upstream`` and cache metrics by ``mcp_common.cache``, so
+individual tools need no instrumentation of their own.
+"""
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.responses import Response
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+HTTP_LATENCY = Histogram("mcp_http_request_duration_seconds", "Time spent handling HTTP requests, including parsing and validation.", ["method", "path"], buckets=LATENCY_BUCKETS)
+
+TOOL_CALLS = Counter("mcp_tool_calls_total", "Tool calls.", ["tool"])
+TOOL_ERRORS = Counter("mcp_tool_errors_total", "Tool calls that raised or returned a JSON-RPC error.", ["tool"])
+TOOL_LATENCY = Histogram("mcp_tool_duration_seconds", "Time spent running tools.", ["tool"], buckets=LATENCY_BUCKETS)
+TOOL_SERIALIZE = Histogram("mcp_tool_serialize_seconds", "Time spent encoding tool responses.", ["tool"], buckets=LATENCY_BUCKETS)
+TOOL_IN_FLIGHT = Gauge("mcp_tool_in_flight", "Tool calls currently running.", ["tool"])
+REQUEST_SIZE = Histogram("mcp_tool_request_bytes", "Size of tool call requests.", ["tool"], buckets=SIZE_BUCKETS)
+RESPONSE_SIZE = Histogram("mcp_tool_response_bytes", "Size of tool call responses.", ["tool"], buckets=SIZE_BUCKETS)
+
+UPSTREAM_LATENCY = Histogram("mcp_upstream_request_duration_seconds", "Time spent on upstream HTTP requests.", ["host", "endpoint"], buckets=LATENCY_BUCKETS)
+UPSTREAM_REQUESTS = Counter("mcp_upstream_requests_total", "Upstream HTTP requests by outcome.", ["host", "endpoint", "method", "status"])
+UPSTREAM_IN_FLIGHT = Gauge("mcp_upstream_in_flight", "Upstream HTTP requests currently running.", ["host"])
+UPSTREAM_QUEUE_DEPTH = Gauge("mcp_upstream_queue_depth", "Upstream requests waiting for a rate limit or concurrency slot.", ["host"])
+UPSTREAM_QUEUE_WAIT = Histogram("mcp_upstream_queue_wait_seconds", "Time upstream requests spent waiting in the limiter queue.", ["host"], buckets=LATENCY_BUCKETS)
+UPSTREAM_REJECTED = Counter("mcp_upstream_rejected_total", "Upstream requests that timed out in the limiter queue.", ["host"])
+UPSTREAM_THROTTLED = Counter("mcp_upstream_throttled_total", "429 Too Many Requests responses from upstreams.", ["host"])
+UPSTREAM_RETRIES = Counter("mcp_upstream_retries_total", "Upstream requests sent again after a failure.", ["host"])
+UPSTREAM_HEDGES = Counter("mcp_upstream_hedges_total", "Hedged upstream requests by which copy answered first (primary or hedge).", ["host", "winner"])
+UPSTREAM_BREAKER_STATE = Gauge("mcp_upstream_breaker_state", "Upstream circuit breaker state: 0 closed, 1 half-open, 2 open.", ["host"])
+UPSTREAM_SHORT_CIRCUITED = Counter("mcp_upstream_short_circuited_total", "Upstream requests failed fast by an open circuit breaker.", ["host"])
+
+RESULTS_STORED = Counter("mcp_results_stored_total", "Oversized tool results stored behind a result handle, by tier (memory or disk).", ["tier"])
+RESULT_STORE_BYTES = Gauge("mcp_result_store_bytes", "Bytes of stored tool results, by tier (memory or disk).", ["tier"])
+
+JOBS_ACTIVE = Gauge("mcp_jobs_active", "Background jobs by state (queued or running).", ["state"])
+JOBS_FINISHED = Counter("mcp_jobs_finished_total", "Finished background jobs by tool and final status.", ["tool", "status"])
+
+CACHE_REQUESTS = Counter("mcp_cache_requests_total", "Tool cache lookups by result (hit, miss, coalesced or stale).", ["tool", "result"])
+
+
+class MetricsMiddleware:
+    """
+    Times each HTTP request by route path. Written as plain ASGI so it adds no
+    buffering to streaming responses.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            HTTP_LATENCY.labels(scope["method"], route_path(scope)).observe(time.perf_counter() - start)
+
+
+def route_path(scope):
+    """
+    Returns the matched route template, e.g. ``/api/v1/mcp``. Some FastAPI
+    versions report only the path inside an included router, so the router
+    prefix is taken from the request path.
+    """
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if not path:
+        return "unmatched"
+    depth = path.count("/")
+    prefix = scope["path"].rsplit("/", depth)[0] if scope["path"].count("/") > depth else ""
+    return prefix + path
+
+
+async def metrics_endpoint(request):
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def instrument(app):
+    """
+    Adds ``/metrics`` and request timing to a FastAPI app.
+    """
+    app.add_middleware(MetricsMiddleware)
+    app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
+    return app
@@ -0,0 +1,212 @@
+"""
+Capture and replay of MCP traffic.
+
+With ``MCP_RECORD_PATH`` set, every tool call is appended to that file with its
+arrival time and duration. So is every upstream HTTP response made through
+``mcp_common.upstream``. A path ending in ``.gz`` is gzip-compressed. The log
+is JSON Lines with three record types:
+
+* ``{"t": "start", ...}`` once per process
+* ``{"t": "call", "service": "wazuh_tools", "seq": 3, "ts": 1700000000.5, "dur": 0.08, "path": "/api/v1/mcp", "body": {...}, "ok": true}``
+* ``{"t": "upstream", "call": 3, "method": "GET", "key": "...", "url": "...", "status": 200, ...}``
+
+With ``MCP_REPLAY_PATH`` set, upstream requests are answered from a recorded
+log instead of the network. A response is matched on method, path, query
+and body, ignoring credentials and JSON-RPC ids. The recorded upstream
+latency is reproduced, scaled by ``MCP_REPLAY_LATENCY`` (default ``1``;
+``0`` answers immediately). ``benchmarks/replay.py`` re-drives the recorded
+calls against a service running in this mode.
+
+Request headers and bodies are never written, only a hash of the body. Upstream
+response bodies are written in full and may contain tokens or other sensitive
+data, so treat the logs accordingly.
+"""
+import base64
+import contextvars
+import gzip
+import hashlib
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from mcp_common.fastjson import dumps, loads
+
+# Query parameters and JSON-RPC fields that differ between environments or runs.
+_VOLATILE_PARAMS = {"apikey", "appid", "api_key", "token", "account_id"}
+_VOLATILE_FIELDS = {"id", "auth"}
+
+current_call = contextvars.ContextVar("mcp_recorded_call", default=None)
+
+
+def read_log(path):
+    """
+    Yields the records of a log. A partial last record, left by a process that
+    was killed while writing, is ignored.
+    """
+    with (gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")) as f:
+        try:
+            for line in f:
+                try:
+                    yield loads(line)
+                except ValueError:
+                    logging.warning(f"Skipping malformed record in {path}")
+        except EOFError:
+            return
+
+
+def _body_bytes(body):
+    if body is None:
+        return b""
+    return body if isinstance(body, bytes) else body.encode("utf-8")
+
+
+def request_key(method, url, body):
+    """
+    A stable key for an upstream request. It does not include the host,
+    credentials or JSON-RPC request ids, so it matches across environments.
+    """
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in _VOLATILE_PARAMS)
+    data = _body_bytes(body)
+    if data:
+        try:
+            parsed = loads(data)
+            if isinstance(parsed, dict):
+                parsed = {k: v for k, v in parsed.items() if k not in _VOLATILE_FIELDS}
+            data = dumps(parsed)
+        except ValueError:
+            pass
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    return f"{method.upper()} {parts.path}?{urlencode(query)} {digest}"
+
+
+def _redacted(url):
+    parts = urlsplit(url)
+    query = [(k, "***" if k in _VOLATILE_PARAMS else v) for k, v in parse_qsl(parts.query, keep_blank_values=True)]
+    return parts._replace(query=urlencode(query)).geturl()
+
+
+class Recorder:
+    """
+    Appends call and upstream records to a log. Each record is written with a
+    single unbuffered append, so the log survives a crash and can be shared by
+    several worker processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._compress = path.endswith(".gz")
+        self._file = open(path, "ab", buffering=0)
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self.service = os.environ.get("MCP_SERVICE_NAME") or os.path.basename(os.getcwd())
+        self._write({"t": "start", "service": self.service, "pid": os.getpid(), "wall": datetime.now(timezone.utc).isoformat()})
+
+    def _write(self, record):
+        line = dumps(record) + b"\n"
+        if self._compress:
+            # One gzip member per record: concatenated members are still a valid
+            # gzip file, so several processes can append to the same log.
+            line = gzip.compress(line)
+        with self._lock:
+            self._file.write(line)
+
+    def begin_call(self, path, id, params):
+        """
+        Starts a call record and makes it current, so upstream requests made
+        by the tool are tagged with its sequence number.
+        """
+        call = {"t": "call", "service": self.service, "seq": next(self._seq), "ts": round(time.time(), 6), "path": path,
+                "body": {"jsonrpc": "2.0", "id": id, "method": "tools/call", "params": params}}
+        current_call.set(call["seq"])
+        return call, time.perf_counter()
+
+    def end_call(self, call, ok):
+        record, start = call
+        record["dur"] = round(time.perf_counter() - start, 6)
+        record["ok"] = ok
+        self._write(record)
+
+    def upstream(self, prepared, response, duration):
+        content = response.content
+        record = {
+            "t": "upstream",
+            "call": current_call.get(),
+            "ts": round(time.time(), 6),
+            "method": prepared.method,
+            "url": _redacted(prepared.url),
+            "key": request_key(prepared.method, prepared.url, prepared.body),
+            "status": response.status_code,
+            "content_type": response.headers.get("Content-Type"),
+            "dur": round(duration, 6),
+        }
+        try:
+            record["body"] = content.decode("utf-8")
+        except UnicodeDecodeError:
+            record["body_b64"] = base64.b64encode(content).decode("ascii")
+        self._write(record)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Replayer:
+    """
+    Answers upstream requests from a recorded log. Responses recorded for the
+    same key are returned in order; the last one is repeated once they run
+    out, so a log can be replayed many times over.
+    """
+
+    def __init__(self, path, latency=1.0):
+        self.latency = latency
+        self._responses = defaultdict(deque)
+        self._lock = threading.Lock()
+        for record in read_log(path):
+            if record.get("t") == "upstream":
+                self._responses[record["key"]].append(record)
+
+    def __len__(self):
+        return sum(len(q) for q in self._responses.values())
+
+    def _next(self, key):
+        with self._lock:
+            queue = self._responses.get(key)
+            if not queue:
+                return None
+            return queue.popleft() if len(queue) > 1 else queue[0]
+
+    def respond(self, prepared):
+        # Imported here, so that services without an HTTP client can import
+        # this module for recording.
+        import requests
+        from requests.structures import CaseInsensitiveDict
+
+        key = request_key(prepared.method, prepared.url, prepared.body)
+        record = self._next(key)
+        if record is None:
+            raise requests.exceptions.ConnectionError(f"No recorded response for {key}", request=prepared)
+        if self.latency:
+            time.sleep(record["dur"] * self.latency)
+
+        response = requests.Response()
+        response.status_code = record["status"]
+        response.reason = ""
+        response.url = prepared.url
+        response.request = prepared
+        response.headers = CaseInsensitiveDict({"Content-Type": record.get("content_type") or "application/json"})
+        if "body_b64" in record:
+            response._content = base64.b64decode(record["body_b64"])
+        else:
+            response._content = record["body"].encode("utf-8")
+        response.encoding = "utf-8"
+        return response
+
+
+recorder = Recorder(os.environ["MCP_RECORD_PATH"]) if os.environ.get("MCP_RECORD_PATH") else None
+replayer = Replayer(os.environ["MCP_REPLAY_PATH"], float(os.environ.get("MCP_REPLAY_LATENCY", "1"))) if os.environ.get("MCP_REPLAY_PATH") else None
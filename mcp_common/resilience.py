@@ -0,0 +1,254 @@
+"""
+Timeouts, retries, hedging and circuit breakers for upstream requests.
+
+Every request made through ``mcp_common.upstream`` follows the policy of its
+host and endpoint:
+
+* connect and read timeouts, so a hung upstream cannot pin a worker forever;
+* retries with full-jitter exponential backoff for idempotent requests that
+  failed to connect, timed out or got a 502/503/504 answer;
+* optionally, a hedged second copy of an idempotent request that has not
+  answered after ``hedge_after`` seconds, the first answer winning;
+* a circuit breaker per host that opens after ``breaker_failures``
+  consecutive failures and then fails requests immediately with
+  ``UpstreamUnavailable`` until ``breaker_reset`` seconds have passed and a
+  probe request succeeds.
+
+Services declare the policies of the APIs they call::
+
+    upstream.policy(GRAFANA_URL, read_timeout=30, endpoints={"/api/ds/query": {"read_timeout": 120}})
+
+Endpoints use the labels of ``upstream.endpoint_of`` (``/agents/:id/key``).
+``MCP_UPSTREAM_POLICIES`` overrides policies per host, or per
+``host/endpoint``, without a code change.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+
+import requests
+
+from mcp_common import metrics
+from mcp_common.limits import host_of
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+RETRY_STATUSES = {502, 503, 504}
+FAILURE_STATUSES = {500, 502, 503, 504}
+
+DEFAULTS = {
+    "connect_timeout": float(os.environ.get("MCP_UPSTREAM_CONNECT_TIMEOUT", "5")),
+    "read_timeout": float(os.environ.get("MCP_UPSTREAM_READ_TIMEOUT", "60")),
+    "retries": int(os.environ.get("MCP_UPSTREAM_RETRIES", "2")),
+    "backoff": 0.2,
+    "backoff_max": 5.0,
+    "hedge_after": None,
+    "idempotent": None,
+    "breaker_failures": int(os.environ.get("MCP_UPSTREAM_BREAKER_FAILURES", "5")),
+    "breaker_reset": float(os.environ.get("MCP_UPSTREAM_BREAKER_RESET", "30")),
+}
+
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+
+class UpstreamUnavailable(requests.exceptions.ConnectionError):
+    """
+    Raised without contacting the upstream while its circuit breaker is open.
+    """
+
+
+class Policy:
+    """
+    The timeouts, retry, hedging and breaker settings of one host or endpoint.
+    ``idempotent`` marks requests of other methods (e.g. read-only JSON-RPC
+    POSTs) as safe to retry and hedge; ``None`` decides by HTTP method.
+    """
+
+    def __init__(self, **settings):
+        for name, default in DEFAULTS.items():
+            setattr(self, name, settings.get(name, default))
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def is_idempotent(self, method):
+        return self.idempotent if self.idempotent is not None else method.upper() in IDEMPOTENT_METHODS
+
+    def backoff_delay(self, attempt):
+        """
+        Full-jitter exponential backoff: a random delay of up to
+        ``backoff * 2 ** attempt`` seconds, capped at ``backoff_max``.
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Counts consecutive failures of a host. Once open, requests fail fast until
+    ``reset`` seconds have passed; then one probe request is let through and
+    its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, host, failures, reset):
+        self.host = host
+        self.failures = failures
+        self.reset = reset
+        self.state = CLOSED
+        self._count = 0
+        self._opened = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self._gauge = metrics.UPSTREAM_BREAKER_STATE.labels(host)
+        self._gauge.set(CLOSED)
+
+    def _set(self, state):
+        self.state = state
+        self._gauge.set(state)
+
+    def before(self):
+        """
+        Raises ``UpstreamUnavailable`` unless a request may be sent now.
+        Returns ``True`` when the request is the half-open probe.
+        """
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened >= self.reset:
+                self._set(HALF_OPEN)
+            if self.state == CLOSED:
+                return False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+        metrics.UPSTREAM_SHORT_CIRCUITED.labels(self.host).inc()
+        raise UpstreamUnavailable(f"Upstream {self.host} is unavailable: circuit breaker is open after {self.failures} consecutive failures")
+
+    def success(self):
+        with self._lock:
+            self._count = 0
+            self._probing = False
+            if self.state != CLOSED:
+                logging.info(f"Circuit breaker for {self.host} closed")
+                self._set(CLOSED)
+
+    def failure(self):
+        with self._lock:
+            self._count += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self._count >= self.failures):
+                logging.warning(f"Circuit breaker for {self.host} opened after {self._count} consecutive failures")
+                self._opened = time.monotonic()
+                self._set(OPEN)
+
+    def abandon(self):
+        """
+        Ends a probe whose outcome says nothing about the upstream's health.
+        """
+        with self._lock:
+            self._probing = False
+
+    @property
+    def allows_retry(self):
+        return self.state == CLOSED
+
+
+# --- Hedging ---
+_hedge_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("MCP_UPSTREAM_HEDGE_THREADS", "32")), thread_name_prefix="upstream-hedge")
+
+
+def _discard(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def hedged(send, host, delay):
+    """
+    Calls ``send()`` and, if it has not returned after ``delay`` seconds,
+    calls it a second time in parallel. Returns the first successful response
+    and closes the other one.
+    """
+    primary = _hedge_pool.submit(copy_context().run, send)
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+
+    hedge = _hedge_pool.submit(copy_context().run, send)
+    futures = {primary: "primary", hedge: "hedge"}
+    done, pending = wait(futures, return_when=FIRST_COMPLETED)
+    winner = next(iter(done))
+    if winner.exception() is not None and pending:
+        # The first copy failed; the other one may still succeed.
+        winner = next(iter(pending))
+    for future in futures:
+        if future is not winner:
+            future.add_done_callback(_discard)
+    metrics.UPSTREAM_HEDGES.labels(host, futures[winner]).inc()
+    return winner.result()
+
+
+# --- Registry ---
+_policies = {}
+_resolved = {}
+_breakers = {}
+_lock = threading.Lock()
+
+
+def _overrides():
+    raw = os.environ.get("MCP_UPSTREAM_POLICIES")
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError as e:
+        logging.error(f"Ignoring invalid MCP_UPSTREAM_POLICIES: {e}")
+        return {}
+
+
+def configure(url_or_host, endpoints=None, **settings):
+    """
+    Sets the policy of an upstream host, and optionally of some of its
+    endpoints, merged over the defaults. Values from ``MCP_UPSTREAM_POLICIES``
+    take precedence. Does nothing for an empty host.
+    """
+    host = host_of(url_or_host or "")
+    if not host:
+        return
+    with _lock:
+        _policies[host] = {**settings, "endpoints": dict(endpoints or {})}
+        _resolved.clear()
+        _breakers.pop(host, None)
+
+
+def policy_for(host, endpoint):
+    """
+    The policy of an endpoint: the defaults, overlaid with the host's
+    settings, the endpoint's settings and their ``MCP_UPSTREAM_POLICIES``
+    overrides, in that order.
+    """
+    policy = _resolved.get(host + endpoint)
+    if policy is None:
+        declared = _policies.get(host, {})
+        overrides = _overrides()
+        settings = {k: v for k, v in declared.items() if k != "endpoints"}
+        settings.update(declared.get("endpoints", {}).get(endpoint, {}))
+        settings.update(overrides.get(host, {}))
+        settings.update(overrides.get(host + endpoint, {}))
+        with _lock:
+            policy = _resolved.setdefault(host + endpoint, Policy(**settings))
+    return policy
+
+
+def breaker_for(host):
+    breaker = _breakers.get(host)
+    if breaker is None:
+        policy = policy_for(host, "")
+        with _lock:
+            breaker = _breakers.setdefault(host, CircuitBreaker(host, policy.breaker_failures, policy.breaker_reset))
+    return breaker
+
+
+def stats():
+    return {host: {"state": ("closed", "half-open", "open")[b.state], "consecutive_failures": b._count} for host, b in list(_breakers.items())}
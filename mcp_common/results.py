@@ -0,0 +1,359 @@
+"""
+Cursor-based handles for oversized tool results.
+
+A tool result whose JSON encoding is larger than ``MCP_RESULT_INLINE_BYTES``
+is not returned inline. ``call_tool`` stores it server-side and returns a
+summary instead: the result with its largest list (or mapping) replaced by a
+placeholder, a short preview of that collection and a ``result_handle`` whose
+cursor pages through it with the generic ``results_next`` tool::
+
+    {"result_handle": {"cursor": "...", "path": "data.affected_items", "total_items": 5000, ...},
+     "result": {"data": {"affected_items": "<5000 items, see result_handle>", "total_affected_items": 5000}},
+     "preview": [...]}
+
+Stored results are kept in memory up to ``MCP_RESULT_MEMORY_BYTES`` and
+spilled to files under ``MCP_RESULT_DIR`` beyond that, up to
+``MCP_RESULT_DISK_BYTES``; the least recently used results are evicted
+first. A result expires ``MCP_RESULT_TTL`` seconds after it was last read.
+
+Services list ``RESULTS_NEXT_TOOL`` and dispatch ``results_next`` like any
+other tool. The store is per process, so a cursor must be read from the
+process that issued it.
+"""
+import atexit
+import logging
+import os
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+from mcp_common import metrics
+from mcp_common.fastjson import RawJSON, dumps, loads
+
+INLINE_LIMIT = int(os.environ.get("MCP_RESULT_INLINE_BYTES", str(1024 * 1024)))
+TTL = float(os.environ.get("MCP_RESULT_TTL", "900"))
+MEMORY_BUDGET = int(os.environ.get("MCP_RESULT_MEMORY_BYTES", str(64 * 1024 * 1024)))
+DISK_BUDGET = int(os.environ.get("MCP_RESULT_DISK_BYTES", str(1024 * 1024 * 1024)))
+PAGE_ITEMS = 100
+PREVIEW_ITEMS = 3
+TEXT_CHUNK = 64 * 1024
+MAX_DEPTH = 6
+UNKNOWN_CURSOR = "Unknown or expired cursor."
+
+
+# --- Pydantic Schemas ---
+class ResultsNextArgs(BaseModel):
+    cursor: str = Field(..., description="The cursor from a result_handle, or the next_cursor of a previous page.")
+    limit: int = Field(PAGE_ITEMS, ge=1, le=10000, description="Optional: Maximum number of items to return. Pages are also cut short to stay under the inline size limit.")
+    fields: Optional[List[str]] = Field(None, description="Optional: Fields to keep in each item, as dotted paths, e.g. ['id', 'name', 'os.platform'].")
+
+
+RESULTS_NEXT_TOOL = {
+    "name": "results_next",
+    "title": "Next Result Page",
+    "description": "Returns the next page of a large tool result that was replaced by a result_handle, optionally keeping only some fields of each item.",
+    "inputSchema": ResultsNextArgs.model_json_schema(),
+    "outputSchema": {"type": "object"},
+}
+
+
+# --- Splitting ---
+def _largest_collection(value, path=(), depth=0):
+    """
+    The path and size of the list or mapping with the most entries in
+    ``value``, searching ``MAX_DEPTH`` levels deep.
+    """
+    best = (path, len(value)) if isinstance(value, (list, dict)) else (None, 0)
+    if depth >= MAX_DEPTH:
+        return best
+    children = value.items() if isinstance(value, dict) else enumerate(value) if isinstance(value, list) else ()
+    for key, child in children:
+        if isinstance(child, (list, dict)):
+            candidate = _largest_collection(child, path + (key,), depth + 1)
+            if candidate[1] > best[1]:
+                best = candidate
+    return best
+
+
+def _get(value, path):
+    for key in path:
+        value = value[key]
+    return value
+
+
+def _replace(value, path, replacement):
+    """
+    A copy of ``value`` with the element at ``path`` replaced; only the
+    containers along the path are copied.
+    """
+    if not path:
+        return replacement
+    copy = dict(value) if isinstance(value, dict) else list(value)
+    copy[path[0]] = _replace(value[path[0]], path[1:], replacement)
+    return copy
+
+
+def split(value, encoded):
+    """
+    Splits a result into a skeleton, the path of the paged collection and its
+    items. Mappings are paged as ``{"key": ..., "value": ...}`` items; results
+    without a collection are paged as chunks of their JSON text.
+    """
+    path, size = _largest_collection(value)
+    if path is not None and size > 1:
+        collection = _get(value, path)
+        items = collection if isinstance(collection, list) else [{"key": k, "value": v} for k, v in collection.items()]
+        skeleton = _replace(value, path, f"<{len(items)} items, see result_handle>")
+        return skeleton, ".".join(str(k) for k in path), items
+    text = value if isinstance(value, str) else encoded.decode("utf-8")
+    items = [text[i:i + TEXT_CHUNK] for i in range(0, len(text), TEXT_CHUNK)]
+    return None, None, items
+
+
+def project(item, fields):
+    """
+    Keeps only the dotted ``fields`` of a dict item, preserving its nesting.
+    """
+    if not fields or not isinstance(item, dict):
+        return item
+    projected = {}
+    for field in fields:
+        source, target = item, projected
+        keys = field.split(".")
+        for key in keys[:-1]:
+            source = source.get(key) if isinstance(source, dict) else None
+            if not isinstance(source, dict):
+                break
+            target = target.setdefault(key, {})
+        else:
+            if keys[-1] in source:
+                target[keys[-1]] = source[keys[-1]]
+    return projected
+
+
+# --- Store ---
+class _Entry:
+    """
+    The encoded items of a stored result, either as a list of byte strings or,
+    once spilled, as a file of concatenated items with their offsets.
+    """
+
+    __slots__ = ("items", "path", "offsets", "size", "total", "expires")
+
+    def __init__(self, items, total, size):
+        self.items = items
+        self.path = None
+        self.offsets = None
+        self.size = size
+        self.total = total
+        self.expires = time.monotonic() + TTL
+
+    def spill(self, path):
+        offsets = array("q", [0])
+        with open(path, "wb") as f:
+            for item in self.items:
+                f.write(item)
+                offsets.append(offsets[-1] + len(item))
+        self.path, self.offsets, self.items = path, offsets, None
+
+    def read(self, start, stop):
+        if self.items is not None:
+            return self.items[start:stop]
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[start])
+            data = f.read(self.offsets[stop] - self.offsets[start])
+        base = self.offsets[start]
+        return [data[self.offsets[i] - base:self.offsets[i + 1] - base] for i in range(start, stop)]
+
+
+class ResultStore:
+    """
+    A size-bounded LRU of paged results, in memory up to ``memory_budget``
+    bytes and on disk up to ``disk_budget`` bytes, with per-entry expiry.
+    """
+
+    def __init__(self, memory_budget=MEMORY_BUDGET, disk_budget=DISK_BUDGET, directory=None):
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self._directory = directory or os.environ.get("MCP_RESULT_DIR")
+        self._temporary = False
+        self._entries = OrderedDict()
+        self._memory = 0
+        self._disk = 0
+        self._lock = threading.Lock()
+
+    def _spill_dir(self):
+        if self._directory is None:
+            self._directory = tempfile.mkdtemp(prefix="mcp-results-")
+            self._temporary = True
+        os.makedirs(self._directory, exist_ok=True)
+        return self._directory
+
+    def _drop(self, handle):
+        entry = self._entries.pop(handle)
+        if entry.path is None:
+            self._memory -= entry.size
+        else:
+            self._disk -= entry.size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _purge(self):
+        now = time.monotonic()
+        for handle in [h for h, e in self._entries.items() if e.expires < now]:
+            self._drop(handle)
+
+    def _update_gauges(self):
+        metrics.RESULT_STORE_BYTES.labels("memory").set(self._memory)
+        metrics.RESULT_STORE_BYTES.labels("disk").set(self._disk)
+
+    def put(self, items):
+        """
+        Stores encoded items and returns their handle, or ``None`` when they
+        do not fit in the store at all.
+        """
+        size = sum(len(item) for item in items)
+        if size > self.memory_budget + self.disk_budget:
+            return None
+        handle = secrets.token_urlsafe(12)
+        entry = _Entry(items, len(items), size)
+        with self._lock:
+            self._purge()
+            if self._memory + size > self.memory_budget:
+                if size > self.disk_budget:
+                    return None
+                while self._disk + size > self.disk_budget and self._evict("disk"):
+                    pass
+                entry.spill(os.path.join(self._spill_dir(), handle))
+                self._disk += size
+                tier = "disk"
+            else:
+                self._memory += size
+                tier = "memory"
+            self._entries[handle] = entry
+            self._update_gauges()
+        metrics.RESULTS_STORED.labels(tier).inc()
+        return handle
+
+    def _evict(self, tier):
+        for handle, entry in self._entries.items():
+            if (entry.path is not None) == (tier == "disk"):
+                self._drop(handle)
+                return True
+        return False
+
+    def get(self, handle, start, stop):
+        """
+        Returns the total number of items and the encoded items
+        ``start:stop``, or ``None`` for an unknown or expired handle.
+        """
+        with self._lock:
+            self._purge()
+            entry = self._entries.get(handle)
+            if entry is None:
+                self._update_gauges()
+                return None
+            entry.expires = time.monotonic() + TTL
+            self._entries.move_to_end(handle)
+        try:
+            return entry.total, entry.read(start, min(stop, entry.total))
+        except OSError:
+            # Evicted while being read.
+            return None
+
+    def clear(self):
+        with self._lock:
+            for handle in list(self._entries):
+                self._drop(handle)
+            self._update_gauges()
+        if self._temporary:
+            shutil.rmtree(self._directory, ignore_errors=True)
+
+
+store = ResultStore()
+atexit.register(store.clear)
+
+
+def _cursor(handle, offset):
+    return f"{handle}.{offset}"
+
+
+def handle_of(cursor):
+    return cursor.rsplit(".", 1)[0]
+
+
+# --- Call Path ---
+def bounded(tool, result):
+    """
+    Returns ``result`` as ``RawJSON`` when its encoding is within the inline
+    limit, or a summary with a ``result_handle`` when it is not.
+    """
+    encoded = result.data if isinstance(result, RawJSON) else dumps(result)
+    if len(encoded) <= INLINE_LIMIT:
+        return result if isinstance(result, RawJSON) else RawJSON(encoded)
+
+    value = loads(encoded)
+    skeleton, path, items = split(value, encoded)
+    handle = store.put([dumps(item) for item in items])
+    preview = items[:PREVIEW_ITEMS] if path is not None else []
+    logging.info(f"Tool {tool} returned {len(encoded)} bytes; stored {len(items)} items as a result handle")
+    summary = {
+        "result_handle": {
+            "cursor": _cursor(handle, 0) if handle else None,
+            "path": path,
+            "total_items": len(items),
+            "total_bytes": len(encoded),
+            "expires_in": TTL,
+            "fields": sorted(items[0]) if path is not None and isinstance(items[0], dict) else None,
+        },
+        "preview": preview,
+    }
+    if handle is None:
+        summary["result_handle"]["error"] = "The result is too large to store; narrow the query."
+    if path is None:
+        summary["result_handle"]["format"] = "text" if isinstance(value, str) else "json_text"
+    if skeleton is not None and len(dumps(skeleton)) <= INLINE_LIMIT // 4:
+        summary["result"] = skeleton
+    return summary
+
+
+def results_next(args: ResultsNextArgs):
+    """
+    Returns a page of a stored result.
+    """
+    handle, _, offset = args.cursor.rpartition(".")
+    if not handle or not offset.isdigit():
+        return {"error": "Invalid cursor."}
+    start = int(offset)
+    found = store.get(handle, start, start + args.limit)
+    if found is None:
+        return {"error": UNKNOWN_CURSOR}
+    total, encoded = found
+
+    items, size = [], 0
+    for data in encoded:
+        item = project(loads(data), args.fields)
+        size += len(data)
+        if items and size > INLINE_LIMIT:
+            break
+        items.append(item)
+    end = start + len(items)
+    return {
+        "items": items,
+        "offset": start,
+        "total_items": total,
+        "next_cursor": _cursor(handle, end) if end < total else None,
+    }
+
+
+def error_of(result):
+    return result.get("error") if isinstance(result, dict) else None
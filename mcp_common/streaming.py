@@ -0,0 +1,268 @@
+"""
+Tool execution with optional Streamable HTTP (Server-Sent Events) responses.
+
+``call_tool`` runs a tool and returns its JSON-RPC response. Clients that send
+``Accept: text/event-stream`` get an SSE stream instead of a single JSON body.
+The stream carries the tool's progress notifications and partial results
+while it runs, comment keep-alives so proxies do not time out idle
+connections, and finally the JSON-RPC response itself. Other clients get the
+plain JSON response as before.
+
+Tools report progress without knowing how they are being called::
+
+    from mcp_common.streaming import report_progress, emit_partial
+
+    def restart_agents(args):
+        report_progress(0, 2, "Restarting agents")
+        ...
+
+Both functions are no-ops when the caller is not streaming. Progress
+notifications are only sent when the request carries
+``params._meta.progressToken``, as the MCP specification requires.
+"""
+import asyncio
+import contextvars
+import inspect
+import logging
+import os
+import time
+
+from starlette.responses import StreamingResponse
+
+from mcp_common import jobs, metrics, recording, results
+from mcp_common.fastjson import JSONResponse, dumps
+
+KEEPALIVE_SECONDS = float(os.environ.get("MCP_SSE_KEEPALIVE", "15"))
+# Messages buffered per stream. A tool thread that gets ahead of a slow
+# client waits, so memory stays flat however much the tool sends.
+QUEUE_MESSAGES = int(os.environ.get("MCP_SSE_QUEUE_MESSAGES", "8"))
+
+_reporter = contextvars.ContextVar("mcp_progress_reporter", default=None)
+_DONE = object()
+
+
+class ProgressReporter:
+    """
+    Forwards notifications from a running tool, on any thread, to the SSE stream.
+    """
+
+    def __init__(self, loop, queue, request_id, progress_token):
+        self.loop = loop
+        self.queue = queue
+        self.request_id = request_id
+        self.progress_token = progress_token
+        self.closed = False
+
+    def _send(self, message):
+        if self.closed:
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            # Async tools cannot block the loop; their messages queue up in order.
+            asyncio.ensure_future(self.queue.put(message))
+        else:
+            asyncio.run_coroutine_threadsafe(self.queue.put(message), self.loop).result()
+
+    def close(self):
+        """
+        Stops forwarding and frees the queue, so a tool blocked on a
+        disconnected client can finish.
+        """
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    def progress(self, progress, total=None, message=None):
+        if self.progress_token is None:
+            return
+        params = {"progressToken": self.progress_token, "progress": progress}
+        if total is not None:
+            params["total"] = total
+        if message is not None:
+            params["message"] = message
+        self._send({"jsonrpc": "2.0", "method": "notifications/progress", "params": params})
+
+    def partial(self, chunk):
+        self._send({"jsonrpc": "2.0", "method": "notifications/partial_result", "params": {"requestId": self.request_id, "chunk": chunk}})
+
+
+def report_progress(progress, total=None, message=None):
+    """
+    Sends a ``notifications/progress`` message to a streaming caller.
+    """
+    reporter = _reporter.get()
+    if reporter is not None:
+        reporter.progress(progress, total, message)
+
+
+def emit_partial(chunk):
+    """
+    Sends a chunk of the result ahead of the final response to a streaming caller.
+    """
+    reporter = _reporter.get()
+    if reporter is not None:
+        reporter.partial(chunk)
+
+
+def is_streaming():
+    return _reporter.get() is not None
+
+
+def wants_stream(request):
+    return "text/event-stream" in request.headers.get("accept", "")
+
+
+def _invoke(fn, args, reporter):
+    token = _reporter.set(reporter)
+    try:
+        return fn(args)
+    finally:
+        _reporter.reset(token)
+
+
+async def run_tool(fn, args, reporter=None):
+    """
+    Runs a tool function. Synchronous tools run in a worker thread so that a
+    slow upstream call does not block the event loop.
+    """
+    if inspect.iscoroutinefunction(fn):
+        token = _reporter.set(reporter)
+        try:
+            return await fn(args)
+        finally:
+            _reporter.reset(token)
+    return await asyncio.to_thread(_invoke, fn, args, reporter)
+
+
+def tool_message(id, result, error_of=None, tool=None):
+    """
+    Builds the JSON-RPC message for a tool result. ``error_of`` maps a result to
+    an error message, or ``None`` when the result is a success. Successful
+    results of ``tool`` that are too large to return inline are replaced by a
+    result handle (see ``mcp_common.results``).
+    """
+    error = error_of(result) if error_of else None
+    if error is not None:
+        return {"jsonrpc": "2.0", "id": id, "error": {"code": -32000, "message": error}}
+    if tool is not None and tool != "results_next":
+        result = results.bounded(tool, result)
+    return {"jsonrpc": "2.0", "id": id, "result": result}
+
+
+def _sse(message):
+    return b"event: message\ndata: " + dumps(message) + b"\n\n"
+
+
+async def _stream(id, params, fn, args, error_of, log_result, call):
+    tool = fn.__name__
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=QUEUE_MESSAGES)
+    progress_token = (params.get("_meta") or {}).get("progressToken")
+    reporter = ProgressReporter(loop, queue, id, progress_token)
+
+    in_flight = metrics.TOOL_IN_FLIGHT.labels(tool)
+    in_flight.inc()
+    start = time.perf_counter()
+    ok = False
+    if call is not None:
+        recording.current_call.set(call[0]["seq"])
+    task = asyncio.ensure_future(run_tool(fn, args, reporter))
+    task.add_done_callback(lambda _: asyncio.ensure_future(queue.put(_DONE)))
+    size = 0
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            if item is _DONE:
+                break
+            chunk = _sse(item)
+            size += len(chunk)
+            yield chunk
+        metrics.TOOL_LATENCY.labels(tool).observe(time.perf_counter() - start)
+
+        try:
+            result = task.result()
+        except Exception as e:
+            logging.exception(f"Tool {tool} failed")
+            metrics.TOOL_ERRORS.labels(tool).inc()
+            yield _sse({"jsonrpc": "2.0", "id": id, "error": {"code": -32000, "message": f"Internal server error: {e}"}})
+            return
+        if log_result:
+            logging.info(f"Tool {tool} returned: {result}")
+        message = tool_message(id, result, error_of, tool)
+        if "error" in message:
+            metrics.TOOL_ERRORS.labels(tool).inc()
+        ok = "error" not in message
+        serialize_start = time.perf_counter()
+        chunk = _sse(message)
+        metrics.TOOL_SERIALIZE.labels(tool).observe(time.perf_counter() - serialize_start)
+        metrics.RESPONSE_SIZE.labels(tool).observe(size + len(chunk))
+        yield chunk
+    finally:
+        in_flight.dec()
+        reporter.close()
+        if not task.done():
+            task.cancel()
+        if call is not None:
+            recording.recorder.end_call(call, ok)
+
+
+async def call_tool(request, id, params, fn, args, error_of=None, log_result=False):
+    """
+    Runs ``fn(args)`` and returns the JSON-RPC response, as an SSE stream when
+    the client accepts one, or queues it as a background job when the tool is
+    long-running and the caller asked for one (see ``mcp_common.jobs``). Tool
+    metrics are recorded here for every service.
+    """
+    tool = fn.__name__
+    metrics.TOOL_CALLS.labels(tool).inc()
+    content_length = request.headers.get("content-length")
+    if content_length:
+        metrics.REQUEST_SIZE.labels(tool).observe(int(content_length))
+    if jobs.wants_job(fn, params):
+        try:
+            job = jobs.manager.submit(fn, args, params, error_of, run_tool)
+        except jobs.JobQueueFull as e:
+            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "error": {"code": -32000, "message": str(e)}})
+        return JSONResponse(content=tool_message(id, jobs.public(job)))
+    call = recording.recorder.begin_call(request.url.path, id, params) if recording.recorder is not None else None
+
+    if wants_stream(request):
+        return StreamingResponse(
+            _stream(id, params, fn, args, error_of, log_result, call),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    in_flight = metrics.TOOL_IN_FLIGHT.labels(tool)
+    in_flight.inc()
+    start = time.perf_counter()
+    try:
+        result = await run_tool(fn, args)
+    except Exception:
+        metrics.TOOL_ERRORS.labels(tool).inc()
+        if call is not None:
+            recording.recorder.end_call(call, False)
+        raise
+    finally:
+        in_flight.dec()
+        metrics.TOOL_LATENCY.labels(tool).observe(time.perf_counter() - start)
+
+    if log_result:
+        logging.info(f"Tool {tool} returned: {result}")
+    message = tool_message(id, result, error_of, tool)
+    if "error" in message:
+        metrics.TOOL_ERRORS.labels(tool).inc()
+    serialize_start = time.perf_counter()
+    response = JSONResponse(content=message)
+    metrics.TOOL_SERIALIZE.labels(tool).observe(time.perf_counter() - serialize_start)
+    metrics.RESPONSE_SIZE.labels(tool).observe(len(response.body))
+    if call is not None:
+        recording.recorder.end_call(call, "error" not in message)
+    return response
@@ -0,0 +1,191 @@
+"""
+Shared HTTP client for upstream APIs.
+
+``get``/``post``/``put``/``delete`` mirror the ``requests`` functions of the
+same name but go through one pooled, keep-alive session and record
+per-host, per-endpoint latency and outcome metrics. Errors are the usual
+``requests.exceptions.RequestException`` subclasses.
+
+Requests to hosts limited through ``limit`` (see ``mcp_common.limits``) wait
+for their turn, and are queued again when the upstream answers 429. Responses
+are recorded to, or answered from, a traffic log when ``mcp_common.recording``
+is enabled.
+
+Every request has connect and read timeouts, idempotent requests are retried
+with backoff (and optionally hedged), and each host has a circuit breaker; see
+``mcp_common.resilience`` and ``policy``. A ``timeout=None`` argument means the
+policy's timeouts, not an unbounded wait.
+"""
+import re
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from mcp_common import limits, metrics, recording, resilience
+
+POOL_SIZE = 32
+
+_ID_SEGMENT = re.compile(r"^\d+$|^[0-9a-fA-F-]{16,}$|^(?=.*\d).{8,}$")
+_ID_PARENTS = {"uid", "tickets", "vulnerability"}
+
+
+def endpoint_of(path):
+    """
+    Reduces a URL path to a low-cardinality endpoint label by replacing
+    identifiers with ``:id``, e.g. ``/agents/001/key`` -> ``/agents/:id/key``.
+    """
+    segments = path.strip("/").split("/")
+    normalized = []
+    for i, segment in enumerate(segments):
+        previous = segments[i - 1] if i else ""
+        if _ID_SEGMENT.search(segment) or previous in _ID_PARENTS:
+            normalized.append(":id")
+        else:
+            normalized.append(segment)
+    return "/" + "/".join(normalized)
+
+
+class UpstreamSession(requests.Session):
+    """
+    A ``requests.Session`` with a larger connection pool that records metrics
+    for every request.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        parts = urlsplit(url)
+        host = parts.netloc
+        endpoint = endpoint_of(parts.path)
+        policy = resilience.policy_for(host, endpoint)
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = policy.timeout
+
+        breaker = resilience.breaker_for(host)
+        breaker.before()
+        retries = policy.retries if policy.is_idempotent(method) else 0
+        hedge = policy.hedge_after is not None and policy.is_idempotent(method)
+        send = lambda: self._limited_request(host, endpoint, method, url, *args, **kwargs)  # noqa: E731
+        attempt = 0
+        while True:
+            try:
+                response = resilience.hedged(send, host, policy.hedge_after) if hedge else send()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                breaker.failure()
+                # A request that never connected was not processed, whatever its method.
+                retryable = attempt < retries or (attempt < policy.retries and isinstance(e, requests.exceptions.ConnectTimeout))
+                if not retryable or not breaker.allows_retry:
+                    raise
+            except BaseException:
+                breaker.abandon()
+                raise
+            else:
+                if response.status_code not in resilience.FAILURE_STATUSES:
+                    breaker.success()
+                    return response
+                breaker.failure()
+                if response.status_code not in resilience.RETRY_STATUSES or attempt >= retries or not breaker.allows_retry:
+                    return response
+                response.close()
+            metrics.UPSTREAM_RETRIES.labels(host).inc()
+            time.sleep(policy.backoff_delay(attempt))
+            attempt += 1
+
+    def _limited_request(self, host, endpoint, method, url, *args, **kwargs):
+        limiter = limits.for_host(host)
+        if limiter is None:
+            return self._send_request(host, endpoint, method, url, *args, **kwargs)
+
+        deadline = time.monotonic() + limiter.queue_timeout
+        while True:
+            limiter.acquire(timeout=deadline - time.monotonic())
+            try:
+                response = self._send_request(host, endpoint, method, url, *args, **kwargs)
+            finally:
+                limiter.release()
+            if response.status_code != 429:
+                return response
+            # The upstream did not process the request, so it is safe to queue it again.
+            metrics.UPSTREAM_THROTTLED.labels(host).inc()
+            wait = limits.retry_after(response)
+            limiter.pause(wait)
+            if time.monotonic() + wait >= deadline:
+                return response
+            response.close()
+
+    def _send_request(self, host, endpoint, method, url, *args, **kwargs):
+        in_flight = metrics.UPSTREAM_IN_FLIGHT.labels(host)
+        in_flight.inc()
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            in_flight.dec()
+            metrics.UPSTREAM_LATENCY.labels(host, endpoint).observe(time.perf_counter() - start)
+            metrics.UPSTREAM_REQUESTS.labels(host, endpoint, method.upper(), status).inc()
+
+    def send(self, request, **kwargs):
+        if recording.replayer is not None:
+            return recording.replayer.respond(request)
+        start = time.perf_counter()
+        response = super().send(request, **kwargs)
+        if recording.recorder is not None and not kwargs.get("stream"):
+            recording.recorder.upstream(request, response, time.perf_counter() - start)
+        return response
+
+
+def limit(url_or_host, rate=None, burst=None, concurrency=None, queue_timeout=None):
+    """
+    Rate-limits and caps concurrent requests to an upstream host for every
+    session. See ``mcp_common.limits.limit``.
+    """
+    return limits.limit(url_or_host, rate=rate, burst=burst, concurrency=concurrency, queue_timeout=queue_timeout)
+
+
+def policy(url_or_host, endpoints=None, **settings):
+    """
+    Sets the timeouts, retries, hedging and circuit breaker settings of an
+    upstream host and, optionally, of some of its endpoints. See
+    ``mcp_common.resilience``.
+    """
+    resilience.configure(url_or_host, endpoints=endpoints, **settings)
+
+
+def new_session():
+    """
+    Returns a separate instrumented session, for clients such as pyzabbix that
+    modify their session's headers.
+    """
+    return UpstreamSession()
+
+
+session = UpstreamSession()
+
+
+def request(method, url, **kwargs):
+    return session.request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return session.request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return session.request("POST", url, **kwargs)
+
+
+def put(url, **kwargs):
+    return session.request("PUT", url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return session.request("DELETE", url, **kwargs)
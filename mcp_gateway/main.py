@@ -0,0 +1,299 @@
+from contextlib import AsyncExitStack, asynccontextmanager
+from fastapi import FastAPI, APIRouter, Request
+from starlette.background import BackgroundTask
+from starlette.responses import Response, StreamingResponse
+import httpx
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+
+from mcp_common.fastjson import JSONResponse, dumps, loads
+from mcp_common.metrics import instrument
+from mcp_common.jobs import UNKNOWN_JOB
+from mcp_common.results import UNKNOWN_CURSOR, handle_of
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+SERVICES_DIR = os.environ.get("MCP_GATEWAY_SERVICES_DIR", os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CATALOG_TTL = float(os.environ.get("MCP_GATEWAY_CATALOG_TTL", "300"))
+CATALOG_MIN_REFRESH = 5.0
+HANDLE_OWNERS = 10000
+
+# Tools that every backend offers for the handles it issued: the argument
+# naming the handle, how to reduce it to a key, and the error for an unknown one.
+HANDLE_TOOLS = {
+    "results_next": ("cursor", handle_of, UNKNOWN_CURSOR),
+    "job_status": ("job_id", str, UNKNOWN_JOB),
+    "job_result": ("job_id", str, UNKNOWN_JOB),
+    "job_cancel": ("job_id", str, UNKNOWN_JOB),
+}
+BACKEND_TIMEOUT = float(os.environ.get("MCP_GATEWAY_TIMEOUT", "300"))
+FORWARDED_HEADERS = ("content-type", "content-encoding", "cache-control", "x-accel-buffering")
+
+# --- Backends ---
+class HTTPBackend:
+    """
+    A tool server reached over HTTP through the gateway's shared connection pool.
+    """
+
+    def __init__(self, name, url, client):
+        self.name = name
+        self.url = url
+        self.client = client
+
+    async def rpc(self, message):
+        response = await self.client.post(self.url, content=dumps(message), headers={"Content-Type": "application/json"})
+        return loads(response.content)
+
+    async def forward(self, request, body):
+        headers = {"Content-Type": "application/json", "Accept": request.headers.get("accept", "application/json")}
+        upstream = await self.client.send(self.client.build_request("POST", self.url, content=body, headers=headers), stream=True)
+        return StreamingResponse(
+            upstream.aiter_raw(),
+            status_code=upstream.status_code,
+            headers={k: v for k, v in upstream.headers.items() if k.lower() in FORWARDED_HEADERS},
+            background=BackgroundTask(upstream.aclose),
+        )
+
+
+class _ASGIForward(Response):
+    """
+    Hands the request straight to another ASGI app, so its response (streaming
+    or not) is sent to the client without being buffered by the gateway.
+    """
+
+    def __init__(self, app, scope, body):
+        self.app = app
+        self.scope = scope
+        self.body_bytes = body
+        self.background = None
+
+    async def __call__(self, scope, receive, send):
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": self.body_bytes, "more_body": False}
+            return await receive()
+
+        await self.app(self.scope, replay, send)
+
+
+class LocalBackend:
+    """
+    A tool server whose ``main.py`` is imported into the gateway process and
+    called directly, without a network hop.
+    """
+
+    def __init__(self, name, app):
+        self.name = name
+        self.app = app
+        self.path = "/api/v1/mcp"
+        self._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://local")
+
+    @classmethod
+    def load(cls, name):
+        directory = os.path.join(SERVICES_DIR, name)
+        sys.path.insert(0, directory)
+        spec = importlib.util.spec_from_file_location(f"mcp_service_{name}", os.path.join(directory, "main.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return cls(name, module.app)
+
+    async def rpc(self, message):
+        response = await self._client.post(self.path, content=dumps(message), headers={"Content-Type": "application/json"})
+        return loads(response.content)
+
+    async def forward(self, request, body):
+        scope = dict(request.scope)
+        scope.update({"app": self.app, "path": self.path, "raw_path": self.path.encode(), "root_path": ""})
+        for key in ("router", "endpoint", "route", "path_params"):
+            scope.pop(key, None)
+        return _ASGIForward(self.app, scope, body)
+
+
+# --- Catalog ---
+class ToolCatalog:
+    """
+    The merged ``tools/list`` of all backends. Backends are queried in
+    parallel; a backend that fails keeps its previously listed tools. The
+    catalog is refreshed in the background once it is older than
+    ``MCP_GATEWAY_CATALOG_TTL``, and on demand when an unknown tool is called.
+
+    Every backend offers its own ``results_next`` and job tools; a cursor or
+    job ID is sent to the backend that issued it, found by asking each in
+    turn the first time.
+    """
+
+    def __init__(self, backends, ttl=CATALOG_TTL):
+        self.backends = backends
+        self.ttl = ttl
+        self.tools = []
+        self.routes = {}
+        self._by_backend = {}
+        self._refreshed = 0.0
+        self.handlers = {}
+        self._handle_owners = OrderedDict()
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    async def _list(self, backend):
+        await backend.rpc({"jsonrpc": "2.0", "id": "gateway-init", "method": "initialize", "params": {}})
+        reply = await backend.rpc({"jsonrpc": "2.0", "id": "gateway-list", "method": "tools/list", "params": {}})
+        return reply["result"]["tools"]
+
+    async def refresh(self):
+        async with self._lock:
+            results = await asyncio.gather(*(self._list(b) for b in self.backends), return_exceptions=True)
+            for backend, result in zip(self.backends, results):
+                if isinstance(result, BaseException):
+                    logging.error(f"Could not list tools of backend {backend.name}: {result}")
+                else:
+                    self._by_backend[backend.name] = result
+
+            tools, routes, handlers = [], {}, {}
+            for backend in self.backends:
+                for tool in self._by_backend.get(backend.name, []):
+                    if tool["name"] in HANDLE_TOOLS:
+                        handlers.setdefault(tool["name"], []).append(backend)
+                        if handlers[tool["name"]][0] is not backend:
+                            continue
+                    if tool["name"] in routes:
+                        logging.warning(f"Tool {tool['name']} of backend {backend.name} is shadowed by backend {routes[tool['name']].name}")
+                        continue
+                    routes[tool["name"]] = backend
+                    tools.append(tool)
+            self.tools, self.routes, self.handlers = tools, routes, handlers
+            self._refreshed = time.monotonic()
+
+    def _refresh_in_background(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.refresh())
+
+    async def list_tools(self):
+        if time.monotonic() - self._refreshed > self.ttl:
+            self._refresh_in_background()
+        return self.tools
+
+    async def backend_for(self, tool_name):
+        backend = self.routes.get(tool_name)
+        if backend is None and time.monotonic() - self._refreshed > CATALOG_MIN_REFRESH:
+            await self.refresh()
+            backend = self.routes.get(tool_name)
+        elif time.monotonic() - self._refreshed > self.ttl:
+            self._refresh_in_background()
+        return backend
+
+
+    async def call_handle_tool(self, message):
+        """
+        Forwards a call of one of the ``HANDLE_TOOLS`` to the backend that
+        issued its cursor or job ID.
+        """
+        tool_name = message["params"]["name"]
+        argument, key_of, unknown = HANDLE_TOOLS[tool_name]
+        key = key_of(str(message["params"].get("arguments", {}).get(argument, "")))
+        owner = self._handle_owners.get(key)
+        reply = {"jsonrpc": "2.0", "id": message.get("id"), "error": {"code": -32000, "message": unknown}}
+        for backend in [owner] if owner is not None else self.handlers.get(tool_name, []):
+            try:
+                answer = await backend.rpc(message)
+            except (httpx.HTTPError, ValueError) as e:
+                logging.error(f"Backend {backend.name} failed for tool {tool_name}: {e}")
+                continue
+            if not isinstance(answer, dict):
+                logging.error(f"Backend {backend.name} returned an invalid reply for tool {tool_name}")
+                continue
+            reply = answer
+            if reply.get("error", {}).get("message") != unknown:
+                self._handle_owners[key] = backend
+                self._handle_owners.move_to_end(key)
+                if len(self._handle_owners) > HANDLE_OWNERS:
+                    self._handle_owners.popitem(last=False)
+                break
+        return reply
+
+
+def configured_backends(client):
+    """
+    Builds the backend list from ``MCP_GATEWAY_CONFIG`` (a file in the
+    ``docs/mcp.json`` format), ``MCP_GATEWAY_BACKENDS`` (``name=url,...``)
+    and ``MCP_GATEWAY_INPROCESS`` (service directories to import).
+    """
+    backends = {}
+    config_path = os.environ.get("MCP_GATEWAY_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "mcp.json"))
+    if config_path and os.path.exists(config_path):
+        with open(config_path) as f:
+            for entry in json.load(f).get("tools", []):
+                backends[entry["name"]] = HTTPBackend(entry["name"], entry["url"], client)
+    for item in filter(None, os.environ.get("MCP_GATEWAY_BACKENDS", "").split(",")):
+        name, url = item.split("=", 1)
+        backends[name.strip()] = HTTPBackend(name.strip(), url.strip(), client)
+    for name in filter(None, os.environ.get("MCP_GATEWAY_INPROCESS", "").split(",")):
+        backends[name.strip()] = LocalBackend.load(name.strip())
+    return list(backends.values())
+
+
+# --- MCP Router ---
+router = APIRouter()
+
+@router.post("/mcp")
+async def mcp_handler(request: Request):
+    raw = await request.body()
+    body = loads(raw)
+    method = body.get("method")
+    id = body.get("id")
+    catalog = request.app.state.catalog
+
+    if method == "initialize":
+        return JSONResponse(content={
+            "jsonrpc": "2.0", "id": id,
+            "result": {"protocolVersion": "1.0.0", "serverInfo": {"name": "MCP Gateway"}}
+        })
+    elif method == "tools/list":
+        tools = await catalog.list_tools()
+        return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": {"tools": tools}})
+    elif method == "tools/call":
+        tool_name = body["params"]["name"]
+        if tool_name in HANDLE_TOOLS:
+            try:
+                return JSONResponse(content=await catalog.call_handle_tool(body))
+            except httpx.HTTPError as e:
+                return JSONResponse(content={"jsonrpc": "2.0", "id": id, "error": {"code": -32000, "message": f"Backend is unavailable: {e}"}}, status_code=502)
+        backend = await catalog.backend_for(tool_name)
+        if backend is None:
+            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "error": {"code": -32601, "message": "Method not found"}}, status_code=404)
+        try:
+            return await backend.forward(request, raw)
+        except httpx.HTTPError as e:
+            logging.error(f"Backend {backend.name} failed for tool {tool_name}: {e}")
+            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "error": {"code": -32000, "message": f"Backend {backend.name} is unavailable: {e}"}}, status_code=502)
+    else:
+        return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": None})
+
+# --- FastAPI App ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    limits = httpx.Limits(max_connections=int(os.environ.get("MCP_GATEWAY_POOL_SIZE", "100")), max_keepalive_connections=int(os.environ.get("MCP_GATEWAY_POOL_SIZE", "100")))
+    async with AsyncExitStack() as stack:
+        client = await stack.enter_async_context(httpx.AsyncClient(timeout=BACKEND_TIMEOUT, limits=limits))
+        backends = configured_backends(client)
+        for backend in backends:
+            if isinstance(backend, LocalBackend):
+                await stack.enter_async_context(backend.app.router.lifespan_context(backend.app))
+        app.state.catalog = ToolCatalog(backends)
+        await app.state.catalog.refresh()
+        logging.info(f"Gateway serving {len(app.state.catalog.tools)} tools from {len(backends)} backends")
+        yield
+
+app = FastAPI(lifespan=lifespan)
+app.include_router(router, prefix="/api/v1")
+instrument(app)
@@ -1,5 +1,4 @@
 from fastapi import FastAPI, APIRouter, Request
-from starlette.responses import JSONResponse
 from pydantic import BaseModel, Field
 import requests
 import os
@@ -7,9 +6,32 @@ import json
 
 import logging
 
+from mcp_common import upstream
+from mcp_common.cache import tool_cache
+from mcp_common.fastjson import JSONResponse, RawJSON, loads, read_json
+from mcp_common.jobs import JOB_FUNCTIONS, JOB_TOOLS, JobArgs, long_running, error_of as jobs_error
+from mcp_common.metrics import instrument
+from mcp_common.results import RESULTS_NEXT_TOOL, ResultsNextArgs, results_next, error_of as results_error
+from mcp_common.streaming import call_tool, emit_partial, is_streaming, report_progress
+
 # --- Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# --- Upstream Limits ---
+# Matches the Wazuh API's default max_request_per_minute of 300.
+upstream.limit(
+    os.environ.get("WAZUH_URL", ""),
+    rate=float(os.environ.get("WAZUH_REQUESTS_PER_MINUTE", "300")) / 60,
+    burst=10,
+    concurrency=8,
+)
+# Alert pages can be slow on large indices; a stalled read is hedged after WAZUH_HEDGE_AFTER seconds when set.
+upstream.policy(
+    os.environ.get("WAZUH_URL", ""),
+    read_timeout=60,
+    endpoints={"/alerts": {"read_timeout": 120, "hedge_after": float(os.environ["WAZUH_HEDGE_AFTER"]) if os.environ.get("WAZUH_HEDGE_AFTER") else None}},
+)
+
 # --- Pydantic Schemas ---
 class GetAgentDetailsArgs(BaseModel):
     agent_id: str = Field(..., description="The ID of the agent to get details for.")
@@ -72,6 +94,12 @@ class GetAlertsArgs(BaseModel):
     select: str = Field(None, description="Select which fields to return (separated by comma).")
 
 # --- Tool Implementation ---
+def is_cacheable(result):
+    """
+    Only successful API responses are cached; errors are returned as strings.
+    """
+    return isinstance(result, (dict, RawJSON))
+
 def get_auth_token():
     """
     Gets the authentication token from the Wazuh API.
@@ -85,17 +113,19 @@ def get_auth_token():
 
     wazuh_ssl_verify = os.environ.get("WAZUH_SSL_VERIFY", "true").lower() == "true"
     try:
-        response = requests.post(f"{os.environ.get('WAZUH_URL')}/security/user/authenticate", auth=(wazuh_user, wazuh_password), verify=wazuh_ssl_verify)
+        response = upstream.post(f"{os.environ.get('WAZUH_URL')}/security/user/authenticate", auth=(wazuh_user, wazuh_password), verify=wazuh_ssl_verify)
         response.raise_for_status()
-        json_response = response.json()
+        json_response = loads(response.content)
         if json_response.get("error", 0) != 0:
             logging.error(f"Error getting token: {json_response.get('message', 'Unknown error')}")
             return None
         return json_response.get("data", {}).get("token")
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, ValueError) as e:
         logging.error(f"Error getting token: {e}")
         return None
 
+@long_running
+@tool_cache.cached(ttl=30, groups=("agents",), cache_if=is_cacheable)
 def get_agents(args: GetAgentsArgs):
     """
     Gets a list of all Wazuh agents.
@@ -108,14 +138,14 @@ def get_agents(args: GetAgentsArgs):
     params = args.dict(by_alias=True, exclude_none=True)
     wazuh_ssl_verify = os.environ.get("WAZUH_SSL_VERIFY", "true").lower() == "true"
     try:
-        response = requests.get(f"{os.environ.get('WAZUH_URL')}/agents", headers=headers, params=params, verify=wazuh_ssl_verify)
+        response = upstream.get(f"{os.environ.get('WAZUH_URL')}/agents", headers=headers, params=params, verify=wazuh_ssl_verify)
         response.raise_for_status()
-        json_response = response.json()
+        json_response = loads(response.content)
         if json_response.get("error", 0) != 0:
             logging.error(f"Error getting agents: {json_response.get('message', 'Unknown error')}")
             return f"An error occurred: {json_response.get('message', 'Unknown error')}"
-        return json_response
-    except requests.exceptions.RequestException as e:
+        return RawJSON(response.content)
+    except (requests.exceptions.RequestException, ValueError) as e:
         logging.error(f"Error getting agents: {e}")
         return f"An error occurred: {e}"
 
@@ -125,6 +155,7 @@ def get_agent_details(args: GetAgentDetailsArgs):
     """
     return get_agents(GetAgentsArgs(agents_list=args.agent_id))
 
+@tool_cache.cached(ttl=300, groups=("rules",), cache_if=is_cacheable)
 def get_rules(args: GetRulesArgs):
     """
     Gets a list of all Wazuh rules.
@@ -137,17 +168,54 @@ def get_rules(args: GetRulesArgs):
     params = args.dict(by_alias=True, exclude_none=True)
     wazuh_ssl_verify = os.environ.get("WAZUH_SSL_VERIFY", "true").lower() == "true"
     try:
-        response = requests.get(f"{os.environ.get('WAZUH_URL')}/rules", headers=headers, params=params, verify=wazuh_ssl_verify)
+        response = upstream.get(f"{os.environ.get('WAZUH_URL')}/rules", headers=headers, params=params, verify=wazuh_ssl_verify)
         response.raise_for_status()
-        json_response = response.json()
+        json_response = loads(response.content)
         if json_response.get("error", 0) != 0:
             logging.error(f"Error getting rules: {json_response.get('message', 'Unknown error')}")
             return f"An error occurred: {json_response.get('message', 'Unknown error')}"
-        return json_response
-    except requests.exceptions.RequestException as e:
+        return RawJSON(response.content)
+    except (requests.exceptions.RequestException, ValueError) as e:
         logging.error(f"Error getting rules: {e}")
         return f"An error occurred: {e}"
 
+WAZUH_PAGE_SIZE = int(os.environ.get("WAZUH_PAGE_SIZE", "500"))
+
+def get_alerts_paged(headers, params, wazuh_ssl_verify):
+    """
+    Gets alerts page by page, streaming each page to the caller as it arrives.
+    """
+    offset, limit = params.get("offset", 0), params["limit"]
+    items, total, message = [], None, None
+    try:
+        while len(items) < limit:
+            page = dict(params, offset=offset + len(items), limit=min(WAZUH_PAGE_SIZE, limit - len(items)))
+            response = upstream.get(f"{os.environ.get('WAZUH_URL')}/alerts", headers=headers, params=page, verify=wazuh_ssl_verify)
+            response.raise_for_status()
+            json_response = loads(response.content)
+            if json_response.get("error", 0) != 0:
+                logging.error(f"Error getting alerts: {json_response.get('message', 'Unknown error')}")
+                return f"An error occurred: {json_response.get('message', 'Unknown error')}"
+            data = json_response.get("data", {})
+            page_items = data.get("affected_items", [])
+            total = data.get("total_affected_items", total)
+            message = json_response.get("message", message)
+            items.extend(page_items)
+            emit_partial({"offset": page["offset"], "affected_items": page_items})
+            expected = min(limit, max((total or 0) - offset, 0))
+            report_progress(len(items), expected, f"Fetched {len(items)} of {expected} alerts")
+            if len(page_items) < page["limit"]:
+                break
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logging.error(f"Error getting alerts: {e}")
+        return f"An error occurred: {e}"
+    return {
+        "data": {"affected_items": items, "total_affected_items": total, "total_failed_items": 0, "failed_items": []},
+        "message": message,
+        "error": 0,
+    }
+
+@long_running
 def get_alerts(args: GetAlertsArgs):
     """
     Gets a list of all Wazuh alerts.
@@ -159,15 +227,17 @@ def get_alerts(args: GetAlertsArgs):
     headers = {"Authorization": f"Bearer {token}"}
     params = args.dict(by_alias=True, exclude_none=True)
     wazuh_ssl_verify = os.environ.get("WAZUH_SSL_VERIFY", "true").lower() == "true"
+    if is_streaming() and args.limit > WAZUH_PAGE_SIZE:
+        return get_alerts_paged(headers, params, wazuh_ssl_verify)
     try:
-        response = requests.get(f"{os.environ.get('WAZUH_URL')}/alerts", headers=headers, params=params, verify=wazuh_ssl_verify)
+        response = upstream.get(f"{os.environ.get('WAZUH_URL')}/alerts", headers=headers, params=params, verify=wazuh_ssl_verify)
         response.raise_for_status()
-        json_response = response.json()
+        json_response = loads(response.content)
         if json_response.get("error", 0) != 0:
             logging.error(f"Error getting alerts: {json_response.get('message', 'Unknown error')}")
             return f"An error occurred: {json_response.get('message', 'Unknown error')}"
-        return json_response
-    except requests.exceptions.RequestException as e:
+        return RawJSON(response.content)
+    except (requests.exceptions.RequestException, ValueError) as e:
         logging.error(f"Error getting alerts: {e}")
         return f"An error occurred: {e}"
 
@@ -175,6 +245,7 @@ class AddAgentArgs(BaseModel):
     name: str = Field(..., description="Agent name")
     ip: str = Field(None, description="If this is not included, the API will get the IP automatically. Allowed values: IP, IP/NET, ANY")
 
+@tool_cache.invalidates("agents")
 def add_agent(args: AddAgentArgs):
     """
     Adds a new agent.
@@ -187,14 +258,14 @@ def add_agent(args: AddAgentArgs):
     data = args.dict(exclude_none=True)
     wazuh_ssl_verify = os.environ.get("WAZUH_SSL_VERIFY", "true").lower() == "true"
     try:
-        response = requests.post(f"{os.environ.get('WAZUH_URL')}/agents", headers=headers, json=data, verify=wazuh_ssl_verify)
+        response = upstream.post(f"{os.environ.get('WAZUH_URL')}/agents", headers=headers, json=data, verify=wazuh_ssl_verify)
         response.raise_for_status()
-        json_response = response.json()
+        json_response = loads(response.content)
         if json_response.get("error", 0) != 0:
             logging.error(f"Error adding agent: {json_response.get('message', 'Unknown error')}")
             return f"An error occurred: {json_response.get('message', 'Unknown error')}"
-        return json_response
-    except requests.exceptions.RequestException as e:
+        return RawJSON(response.content)
+    except (requests.exceptions.RequestException, ValueError) as e:
         logging.error(f"Error adding agent: {e}")
         return f"An error occurred: {e}"
 
@@ -215,6 +286,8 @@ class DeleteAgentsArgs(BaseModel):
     ip: str = Field(None, description="Filter by the IP used by the agent to communicate with the manager.")
     registerIP: str = Field(None, description="Filter by the IP used when registering the agent")
 
+@long_running
+@tool_cache.invalidates("agents", "vulnerabilities")
 def delete_agents(args: DeleteAgentsArgs):
     """
     Deletes one or more agents.
@@ -226,21 +299,25 @@ def delete_agents(args: DeleteAgentsArgs):
     headers = {"Authorization": f"Bearer {token}"}
     params = args.dict(by_alias=True, exclude_none=True)
     wazuh_ssl_verify = os.environ.get("WAZUH_SSL_VERIFY", "true").lower() == "true"
+    report_progress(0, 1, "Deleting agents")
     try:
-        response = requests.delete(f"{os.environ.get('WAZUH_URL')}/agents", headers=headers, params=params, verify=wazuh_ssl_verify)
+        response = upstream.delete(f"{os.environ.get('WAZUH_URL')}/agents", headers=headers, params=params, verify=wazuh_ssl_verify)
         response.raise_for_status()
-        json_response = response.json()
+        json_response = loads(response.content)
         if json_response.get("error", 0) != 0:
             logging.error(f"Error deleting agents: {json_response.get('message', 'Unknown error')}")
             return f"An error occurred: {json_response.get('message', 'Unknown error')}"
-        return json_response
-    except requests.exceptions.RequestException as e:
+        report_progress(1, 1, "Done")
+        return RawJSON(response.content)
+    except (requests.exceptions.RequestException, ValueError) as e:
         logging.error(f"Error deleting agents: {e}")
         return f"An error occurred: {e}"
 
 class RestartAgentsArgs(BaseModel):
     agents_list: str = Field(None, description="List of agent IDs (separated by comma), all agents selected by default if not specified")
 
+@long_running
+@tool_cache.invalidates("agents")
 def restart_agents(args: RestartAgentsArgs):
     """
     Restarts one or more agents.
@@ -252,15 +329,17 @@ def restart_agents(args: RestartAgentsArgs):
     headers = {"Authorization": f"Bearer {token}"}
     params = args.dict(exclude_none=True)
     wazuh_ssl_verify = os.environ.get("WAZUH_SSL_VERIFY", "true").lower() == "true"
+    report_progress(0, 1, "Restarting agents")
     try:
-        response = requests.put(f"{os.environ.get('WAZUH_URL')}/agents/restart", headers=headers, params=params, verify=wazuh_ssl_verify)
+        response = upstream.put(f"{os.environ.get('WAZUH_URL')}/agents/restart", headers=headers, params=params, verify=wazuh_ssl_verify)
         response.raise_for_status()
-        json_response = response.json()
+        json_response = loads(response.content)
         if json_response.get("error", 0) != 0:
             logging.error(f"Error restarting agents: {json_response.get('message', 'Unknown error')}")
             return f"An error occurred: {json_response.get('message', 'Unknown error')}"
-        return json_response
-    except requests.exceptions.RequestException as e:
+        report_progress(1, 1, "Done")
+        return RawJSON(response.content)
+    except (requests.exceptions.RequestException, ValueError) as e:
         logging.error(f"Error restarting agents: {e}")
         return f"An error occurred: {e}"
 
@@ -278,14 +357,14 @@ def get_agent_key(args: GetAgentKeyArgs):
     headers = {"Authorization": f"Bearer {token}"}
     wazuh_ssl_verify = os.environ.get("WAZUH_SSL_VERIFY", "true").lower() == "true"
     try:
-        response = requests.get(f"{os.environ.get('WAZUH_URL')}/agents/{args.agent_id}/key", headers=headers, verify=wazuh_ssl_verify)
+        response = upstream.get(f"{os.environ.get('WAZUH_URL')}/agents/{args.agent_id}/key", headers=headers, verify=wazuh_ssl_verify)
         response.raise_for_status()
-        json_response = response.json()
+        json_response = loads(response.content)
         if json_response.get("error", 0) != 0:
             logging.error(f"Error getting agent key: {json_response.get('message', 'Unknown error')}")
             return f"An error occurred: {json_response.get('message', 'Unknown error')}"
-        return json_response
-    except requests.exceptions.RequestException as e:
+        return RawJSON(response.content)
+    except (requests.exceptions.RequestException, ValueError) as e:
         logging.error(f"Error getting agent key: {e}")
         return f"An error occurred: {e}"
 
@@ -306,6 +385,8 @@ class GetVulnerabilitiesArgs(BaseModel):
     name: str = Field(None, description="Filter by vulnerability name.")
     version: str = Field(None, description="Filter by vulnerability version.")
 
+@long_running
+@tool_cache.cached(ttl=300, groups=("vulnerabilities",), cache_if=is_cacheable)
 def get_vulnerabilities(args: GetVulnerabilitiesArgs):
     """
     Gets the vulnerabilities of a specific agent.
@@ -319,15 +400,14 @@ def get_vulnerabilities(args: GetVulnerabilitiesArgs):
     agent_id = params.pop("agent_id")
     wazuh_ssl_verify = os.environ.get("WAZUH_SSL_VERIFY", "true").lower() == "true"
     try:
-        response = requests.get(f"{os.environ.get('WAZUH_URL')}/vulnerability/{agent_id}", headers=headers, params=params, verify=wazuh_ssl_verify)
-        print(response.text)
+        response = upstream.get(f"{os.environ.get('WAZUH_URL')}/vulnerability/{agent_id}", headers=headers, params=params, verify=wazuh_ssl_verify)
         response.raise_for_status()
-        json_response = response.json()
+        json_response = loads(response.content)
         if json_response.get("error", 0) != 0:
             logging.error(f"Error getting vulnerabilities: {json_response.get('message', 'Unknown error')}")
             return f"An error occurred: {json_response.get('message', 'Unknown error')}"
-        return json_response
-    except requests.exceptions.RequestException as e:
+        return RawJSON(response.content)
+    except (requests.exceptions.RequestException, ValueError) as e:
         logging.error(f"Error getting vulnerabilities: {e}")
         return f"An error occurred: {e}"
 
@@ -336,7 +416,7 @@ router = APIRouter()
 
 @router.post("/mcp")
 async def mcp_handler(request: Request):
-    body = await request.json()
+    body = await read_json(request)
     method = body.get("method")
     id = body.get("id")
 
@@ -409,7 +489,9 @@ async def mcp_handler(request: Request):
                 "description": "Gets the vulnerabilities of a specific agent.",
                 "inputSchema": GetVulnerabilitiesArgs.model_json_schema(),
                 "outputSchema": {"type": "object"}
-            }
+            },
+            RESULTS_NEXT_TOOL,
+            *JOB_TOOLS
         ]
         return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": {"tools": tools}})
     elif method == "tools/call":
@@ -419,49 +501,37 @@ async def mcp_handler(request: Request):
 
         if tool_name == "get_agents":
             args = GetAgentsArgs(**tool_args)
-            result = get_agents(args)
-            logging.info(f"Tool get_agents returned: {result}")
-            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+            return await call_tool(request, id, body["params"], get_agents, args, log_result=True)
         elif tool_name == "get_agent_details":
             args = GetAgentDetailsArgs(**tool_args)
-            result = get_agent_details(args)
-            logging.info(f"Tool get_agent_details returned: {result}")
-            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+            return await call_tool(request, id, body["params"], get_agent_details, args, log_result=True)
         elif tool_name == "get_rules":
             args = GetRulesArgs(**tool_args)
-            result = get_rules(args)
-            logging.info(f"Tool get_rules returned: {result}")
-            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+            return await call_tool(request, id, body["params"], get_rules, args, log_result=True)
         elif tool_name == "get_alerts":
             args = GetAlertsArgs(**tool_args)
-            result = get_alerts(args)
-            logging.info(f"Tool get_alerts returned: {result}")
-            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+            return await call_tool(request, id, body["params"], get_alerts, args, log_result=True)
         elif tool_name == "add_agent":
             args = AddAgentArgs(**tool_args)
-            result = add_agent(args)
-            logging.info(f"Tool add_agent returned: {result}")
-            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+            return await call_tool(request, id, body["params"], add_agent, args, log_result=True)
         elif tool_name == "delete_agents":
             args = DeleteAgentsArgs(**tool_args)
-            result = delete_agents(args)
-            logging.info(f"Tool delete_agents returned: {result}")
-            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+            return await call_tool(request, id, body["params"], delete_agents, args, log_result=True)
         elif tool_name == "restart_agents":
             args = RestartAgentsArgs(**tool_args)
-            result = restart_agents(args)
-            logging.info(f"Tool restart_agents returned: {result}")
-            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+            return await call_tool(request, id, body["params"], restart_agents, args, log_result=True)
         elif tool_name == "get_agent_key":
             args = GetAgentKeyArgs(**tool_args)
-            result = get_agent_key(args)
-            logging.info(f"Tool get_agent_key returned: {result}")
-            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+            return await call_tool(request, id, body["params"], get_agent_key, args, log_result=True)
         elif tool_name == "get_vulnerabilities":
             args = GetVulnerabilitiesArgs(**tool_args)
-            result = get_vulnerabilities(args)
-            logging.info(f"Tool get_vulnerabilities returned: {result}")
-            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+            return await call_tool(request, id, body["params"], get_vulnerabilities, args, log_result=True)
+        elif tool_name == "results_next":
+            args = ResultsNextArgs(**tool_args)
+            return await call_tool(request, id, body["params"], results_next, args, error_of=results_error)
+        elif tool_name in JOB_FUNCTIONS:
+            args = JobArgs(**tool_args)
+            return await call_tool(request, id, body["params"], JOB_FUNCTIONS[tool_name], args, error_of=jobs_error)
         else:
             logging.error(f"Method not found: {tool_name}")
             return JSONResponse(content={"jsonrpc": "2.0", "id": id, "error": {"code": -32601, "message": "Method not found"}}, status_code=404)
@@ -470,4 +540,5 @@ async def mcp_handler(request: Request):
 
 # --- FastAPI App ---
 app = FastAPI()
-app.include_router(router, prefix="/api/v1")
\ No newline at end of file
+app.include_router(router, prefix="/api/v1")
+instrument(app)
\ No newline at end of file
@@ -1,42 +1,134 @@
-
 from fastapi import FastAPI, APIRouter, Request
-from starlette.responses import JSONResponse
 from pydantic import BaseModel, Field
-import requests
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
 
+from mcp_common import upstream
+from mcp_common.cache import tool_cache
+from mcp_common.fastjson import JSONResponse, read_json
+from mcp_common.metrics import instrument
+from mcp_common.streaming import call_tool, report_progress
+
+OPENWEATHER_URL = os.environ.get("OPENWEATHER_URL", "https://api.openweathermap.org")
+# Coordinates are rounded to tiles this many degrees wide (0.1 is about 11 km),
+# so queries for nearby places share one upstream call.
+TILE_DEGREES = float(os.environ.get("WEATHER_TILE_DEGREES", "0.1"))
+# OpenWeather updates current conditions about every 10 minutes. Older
+# results are served for WEATHER_CACHE_STALE seconds more while they refresh.
+CACHE_TTL = float(os.environ.get("WEATHER_CACHE_TTL", "600"))
+CACHE_STALE = float(os.environ.get("WEATHER_CACHE_STALE", "1800"))
+BATCH_MAX_LOCATIONS = int(os.environ.get("WEATHER_BATCH_MAX_LOCATIONS", "200"))
+
+# Tiles missing from the cache are fetched on this pool, paced by the upstream limit below.
+_fetch_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("WEATHER_BATCH_THREADS", "8")), thread_name_prefix="weather")
+
+# --- Upstream Limits ---
+# The free OpenWeather plan allows 60 requests per minute.
+upstream.limit(
+    OPENWEATHER_URL,
+    rate=float(os.environ.get("OPENWEATHER_REQUESTS_PER_MINUTE", "60")) / 60,
+    burst=int(os.environ.get("OPENWEATHER_BURST", "10")),
+    concurrency=int(os.environ.get("OPENWEATHER_CONCURRENCY", "8")),
+)
+upstream.policy(OPENWEATHER_URL, read_timeout=10)
+
 # --- Pydantic Schemas ---
 class GetWeatherArgs(BaseModel):
     lat: float = Field(..., description="Latitude")
     lon: float = Field(..., description="Longitude")
 
+class Location(BaseModel):
+    lat: float = Field(..., description="Latitude")
+    lon: float = Field(..., description="Longitude")
+    name: Optional[str] = Field(None, description="Optional: A label for the location, e.g. a data center name, returned with its row.")
+
+class GetWeatherBatchArgs(BaseModel):
+    locations: List[Location] = Field(..., min_length=1, max_length=BATCH_MAX_LOCATIONS, description="The locations to look up.")
+
 # --- Tool Implementation ---
-async def get_weather_forecast(args: GetWeatherArgs):
+class WeatherError(Exception):
+    """
+    Raised when OpenWeather does not return the weather of a tile.
+    """
+
+def tile_of(lat, lon):
+    """
+    The center of the cache tile holding a location.
+    """
+    return round(round(lat / TILE_DEGREES) * TILE_DEGREES, 6), round(round(lon / TILE_DEGREES) * TILE_DEGREES, 6)
+
+# Cached under the tool's name, so MCP_CACHE_TTL_GET_WEATHER_FORECAST still applies.
+@tool_cache.cached(ttl=CACHE_TTL, stale=CACHE_STALE, groups=("weather",), name="get_weather_forecast")
+def fetch_tile(lat, lon):
+    """
+    Fetches the current weather at a tile center. Only successful responses
+    are cached.
+    """
+    response = upstream.get(
+        f"{OPENWEATHER_URL}/data/2.5/weather",
+        params={"lat": lat, "lon": lon, "appid": os.environ.get("OPENWEATHER_API_KEY")},
+    )
+    data = response.json()
+    if response.status_code != 200:
+        raise WeatherError(f"Could not get weather data. Response: {data}")
+    return data
+
+def describe(data):
+    return f"Current weather: {data['weather'][0]['description']}, temperature: {data['main']['temp'] - 273.15:.2f}°C"
+
+def get_weather_forecast(args: GetWeatherArgs):
     """
     Fetches the current weather for a specified location using OpenWeatherMap.
     """
-    api_key = os.environ.get("OPENWEATHER_API_KEY")
-    if not api_key:
+    if not os.environ.get("OPENWEATHER_API_KEY"):
         return "OpenWeather API key is not configured."
-
-    url = f"https://api.openweathermap.org/data/2.5/weather?lat={args.lat}&lon={args.lon}&appid={api_key}"
     try:
-        async with requests.AsyncClient() as client:
-            response = await client.get(url)
-            data = response.json()
-            if response.status_code == 200:
-                return f"Current weather: {data['weather'][0]['description']}, temperature: {data['main']['temp'] - 273.15:.2f}°C"
-            else:
-                return f"Could not get weather data. Response: {data}"
+        return describe(fetch_tile(*tile_of(args.lat, args.lon)))
+    except WeatherError as e:
+        return str(e)
     except Exception as e:
         return f"An error occurred: {e}"
 
+def get_weather_batch(args: GetWeatherBatchArgs):
+    """
+    Fetches the current weather for many locations at once, as a table with
+    one row per location. Locations in the same tile share one upstream call,
+    and a location that fails has its error in its row.
+    """
+    if not os.environ.get("OPENWEATHER_API_KEY"):
+        return {"error": "OpenWeather API key is not configured."}
+    tiles = [tile_of(location.lat, location.lon) for location in args.locations]
+    futures = {_fetch_pool.submit(fetch_tile, *tile): tile for tile in dict.fromkeys(tiles)}
+    weather, errors = {}, {}
+    for done, future in enumerate(as_completed(futures), 1):
+        tile = futures[future]
+        try:
+            data = future.result()
+            weather[tile] = (data["weather"][0]["description"], round(data["main"]["temp"] - 273.15, 2), data["main"].get("humidity"))
+        except WeatherError as e:
+            errors[tile] = str(e)
+        except Exception as e:
+            errors[tile] = f"An error occurred: {e}"
+        report_progress(done, len(futures), f"Fetched {done} of {len(futures)} locations")
+
+    rows = []
+    for location, tile in zip(args.locations, tiles):
+        description, temperature, humidity = weather.get(tile, (None, None, None))
+        rows.append([location.name, location.lat, location.lon, description, temperature, humidity, errors.get(tile)])
+    return {
+        "fields": ["name", "lat", "lon", "weather", "temperature_c", "humidity", "error"],
+        "rows": rows,
+        "tiles": len(futures),
+        "failed": sum(1 for tile in tiles if tile in errors),
+    }
+
 # --- MCP Router ---
 router = APIRouter()
 
 @router.post("/mcp")
 async def mcp_handler(request: Request):
-    body = await request.json()
+    body = await read_json(request)
     method = body.get("method")
     id = body.get("id")
 
@@ -52,6 +144,12 @@ async def mcp_handler(request: Request):
             "description": "Fetches the current weather for a specified location.",
             "inputSchema": GetWeatherArgs.model_json_schema(),
             "outputSchema": {"type": "string"}
+        }, {
+            "name": "get_weather_batch",
+            "title": "Get Weather For Many Locations",
+            "description": "Fetches the current weather for a list of locations in one call, e.g. every site or data center, as a compact table. Failures are reported per location.",
+            "inputSchema": GetWeatherBatchArgs.model_json_schema(),
+            "outputSchema": {"type": "object"}
         }]
         return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": {"tools": tools}})
     elif method == "tools/call":
@@ -59,8 +157,10 @@ async def mcp_handler(request: Request):
         tool_args = body["params"].get("arguments", {})
         if tool_name == "get_weather_forecast":
             args = GetWeatherArgs(**tool_args)
-            result = await get_weather_forecast(args)
-            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+            return await call_tool(request, id, body["params"], get_weather_forecast, args)
+        elif tool_name == "get_weather_batch":
+            args = GetWeatherBatchArgs(**tool_args)
+            return await call_tool(request, id, body["params"], get_weather_batch, args)
         else:
             return JSONResponse(content={"jsonrpc": "2.0", "id": id, "error": {"code": -32601, "message": "Method not found"}}, status_code=404)
     else:
@@ -69,3 +169,4 @@ async def mcp_handler(request: Request):
 # --- FastAPI App ---
 app = FastAPI()
 app.include_router(router, prefix="/api/v1")
+instrument(app)
@@ -1,41 +1,120 @@
-
 from fastapi import FastAPI, APIRouter, Request
-from starlette.responses import JSONResponse
 from pydantic import BaseModel, Field
-import requests
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
 import os
 
+from mcp_common import limits, metrics, upstream
+from mcp_common.cache import tool_cache
+from mcp_common.fastjson import JSONResponse, read_json
+from mcp_common.metrics import instrument
+from mcp_common.streaming import call_tool
+
+ALPHAVANTAGE_URL = os.environ.get("ALPHAVANTAGE_URL", "https://www.alphavantage.co")
+REQUESTS_PER_MINUTE = float(os.environ.get("ALPHAVANTAGE_REQUESTS_PER_MINUTE", "5"))
+# Quotes are cached for QUOTE_TTL_OPEN seconds while the US market is open,
+# and after the close until the next open, for at most QUOTE_TTL_CLOSED
+# seconds. Expired quotes are served QUOTE_STALE seconds more while they refresh.
+QUOTE_TTL_OPEN = float(os.environ.get("QUOTE_TTL_OPEN", "60"))
+QUOTE_TTL_CLOSED = float(os.environ.get("QUOTE_TTL_CLOSED", "21600"))
+QUOTE_STALE = float(os.environ.get("QUOTE_STALE", "300"))
+# Regular session hours, with a quarter hour after the bell for closing prints.
+# Exchange holidays count as trading days, which only shortens the TTL.
+MARKET_TZ = ZoneInfo("America/New_York")
+MARKET_OPEN = time(9, 30)
+MARKET_CLOSE = time(16, 15)
+# Retries of a quote answered with Alpha Vantage's rate-limit message.
+THROTTLE_RETRIES = 2
+
+# --- Upstream Limits ---
+# The free Alpha Vantage tier allows 5 requests per minute. Cache misses queue
+# for a token for up to ALPHAVANTAGE_QUEUE_TIMEOUT seconds instead of failing.
+upstream.limit(
+    ALPHAVANTAGE_URL,
+    rate=REQUESTS_PER_MINUTE / 60,
+    burst=int(os.environ.get("ALPHAVANTAGE_BURST", "5")),
+    concurrency=2,
+    queue_timeout=float(os.environ.get("ALPHAVANTAGE_QUEUE_TIMEOUT", "60")),
+)
+upstream.policy(ALPHAVANTAGE_URL, read_timeout=10)
+
 # --- Pydantic Schemas ---
 class GetStockPriceArgs(BaseModel):
     ticker: str = Field(..., description="The stock ticker symbol.")
 
+# --- Market Hours ---
+def market_is_open(now):
+    return now.weekday() < 5 and MARKET_OPEN <= now.time() < MARKET_CLOSE
+
+def seconds_until_open(now):
+    opening = datetime.combine(now.date(), MARKET_OPEN, tzinfo=MARKET_TZ)
+    while opening <= now or opening.weekday() >= 5:
+        opening = datetime.combine(opening.date() + timedelta(days=1), MARKET_OPEN, tzinfo=MARKET_TZ)
+    return opening.timestamp() - now.timestamp()
+
+def quote_ttl():
+    """
+    How long a quote fetched now stays fresh.
+    """
+    now = datetime.now(MARKET_TZ)
+    if market_is_open(now):
+        return QUOTE_TTL_OPEN
+    return max(QUOTE_TTL_OPEN, min(seconds_until_open(now), QUOTE_TTL_CLOSED))
+
 # --- Tool Implementation ---
+class QuoteError(Exception):
+    """
+    Raised when Alpha Vantage does not return a quote.
+    """
+
+# Cached under the tool's name, so MCP_CACHE_TTL_GET_STOCK_PRICE still applies.
+@tool_cache.cached(ttl=quote_ttl, stale=QUOTE_STALE, groups=("quotes",), name="get_stock_price")
+def fetch_quote(symbol):
+    """
+    Fetches the Alpha Vantage quote of a symbol. Alpha Vantage answers
+    throttled requests with 200 and a note instead of 429, so those pause the
+    limiter and are queued again.
+    """
+    host = limits.host_of(ALPHAVANTAGE_URL)
+    for _ in range(THROTTLE_RETRIES + 1):
+        response = upstream.get(
+            f"{ALPHAVANTAGE_URL}/query",
+            params={"function": "GLOBAL_QUOTE", "symbol": symbol, "apikey": os.environ.get("ALPHAVANTAGE_API_KEY")},
+        )
+        data = response.json()
+        quote = data.get("Global Quote")
+        if quote and "05. price" in quote:
+            return quote
+        note = data.get("Note") or data.get("Information")
+        if note is None:
+            raise QuoteError(f"Could not find stock price for {symbol}. Response: {data}")
+        metrics.UPSTREAM_THROTTLED.labels(host).inc()
+        limiter = limits.for_host(host)
+        if limiter is not None:
+            limiter.pause(60 / REQUESTS_PER_MINUTE)
+    raise QuoteError(f"Alpha Vantage rate limit reached for {symbol}: {note}")
+
 def get_stock_price(args: GetStockPriceArgs):
     """
     Fetches the current stock price for a given ticker symbol using Alpha Vantage.
     """
-    api_key = os.environ.get("ALPHAVANTAGE_API_KEY")
-    if not api_key:
+    if not os.environ.get("ALPHAVANTAGE_API_KEY"):
         return "Alpha Vantage API key is not configured."
-
-    url = f"https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={args.ticker}&apikey={api_key}"
+    symbol = args.ticker.strip().upper()
     try:
-        response = requests.get(url)
-        data = response.json()
-        if "Global Quote" in data and "05. price" in data["Global Quote"]:
-            price = data["Global Quote"]["05. price"]
-            return f"The current stock price of {args.ticker} is {price}"
-        else:
-            return f"Could not find stock price for {args.ticker}. Response: {data}"
+        quote = fetch_quote(symbol)
+    except QuoteError as e:
+        return str(e)
     except Exception as e:
         return f"An error occurred: {e}"
+    return f"The current stock price of {symbol} is {quote['05. price']}"
 
 # --- MCP Router ---
 router = APIRouter()
 
 @router.post("/mcp")
 async def mcp_handler(request: Request):
-    body = await request.json()
+    body = await read_json(request)
     method = body.get("method")
     id = body.get("id")
 
@@ -58,13 +137,27 @@ async def mcp_handler(request: Request):
         tool_args = body["params"].get("arguments", {})
         if tool_name == "get_stock_price":
             args = GetStockPriceArgs(**tool_args)
-            result = get_stock_price(args)
-            return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": result})
+            return await call_tool(request, id, body["params"], get_stock_price, args)
         else:
             return JSONResponse(content={"jsonrpc": "2.0", "id": id, "error": {"code": -32601, "message": "Method not found"}}, status_code=404)
     else:
         return JSONResponse(content={"jsonrpc": "2.0", "id": id, "result": None})
 
+@router.get("/quotes/stats")
+def quote_stats():
+    """
+    Quote cache counters, the Alpha Vantage request queue and the current
+    quote TTL.
+    """
+    limiter = limits.for_host(limits.host_of(ALPHAVANTAGE_URL))
+    return {
+        "cache": tool_cache.stats(),
+        "upstream": limiter.stats() if limiter is not None else None,
+        "market_open": market_is_open(datetime.now(MARKET_TZ)),
+        "ttl": quote_ttl(),
+    }
+
 # --- FastAPI App ---
 app = FastAPI()
 app.include_router(router, prefix="/api/v1")
+instrument(app)